@@ -0,0 +1,379 @@
+#!/usr/bin/env jython
+
+# JythonMX, helpers to expose JMX data from Jython applications
+#
+# Copyright (C) 2009 Nicolas Trangez  <eikke eikke com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1
+# of the License.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA  02110-1301  USA
+
+'''JythonMX benchmarks
+
+Run all benchmarks, or only the given ones, using Jython::
+
+    jython benchmarks.py [name ...]
+'''
+
+__docformat__ = 'restructuredtext en'
+
+import sys
+import time
+import array
+import logging
+import operator
+import threading
+
+#pylint: disable-msg=F0401
+import java.lang
+import jarray
+#pylint: enable-msg=F0401
+
+import jythonmx
+
+#pylint: disable-msg=C0103,R0903
+
+def timed(fun, *args_):
+    '''Run a function once, returning the wall clock time it took
+
+    :param fun: function to run
+    :type fun: `callable`
+
+    :return: runtime in seconds
+    :rtype: `float`
+    '''
+    start = time.time()
+    fun(*args_)
+    return time.time() - start
+
+def report(name, seconds, count):
+    '''Print the result of a benchmark run'''
+    print '%-40s %8.3fs %10.2fus/op' % (name, seconds,
+                                       seconds * 1000000 / count)
+
+
+class BenchMBean(object):
+    '''A bean of a realistic size'''
+    def __init__(self, i):
+        self._i = i
+
+    count = jythonmx.TypedProperty(java.lang.Integer,
+                                   fget=operator.attrgetter('_i'),
+                                   doc='A counter')
+    label = property(fget=lambda s: 'bean %d' % s._i, doc='A label')
+    enabled = jythonmx.TypedProperty(java.lang.Boolean,
+                                     fget=lambda _: True,
+                                     doc='Whether the bean is enabled')
+
+    @jythonmx.returns(java.lang.String)
+    @jythonmx.args((java.lang.String, 'Name'))
+    def hello(self, name):
+        '''Say hello'''
+        return 'Hello, %s' % name
+
+    def reset(self):
+        '''Reset the bean'''
+        self._i = 0
+
+    changed = jythonmx.signal('changed')
+
+
+def register_all(adapters):
+    '''Register all adapters under a unique name'''
+    for i, adapter in enumerate(adapters):
+        adapter.register('JythonMXBench:type=BenchMBean,name=%d' % i)
+
+def unregister_all(adapters):
+    '''Unregister all adapters'''
+    for adapter in adapters:
+        adapter.unregister()
+
+
+def bench_startup(count=10000):
+    '''Register `count` beans of a single class'''
+    def uncached(adapters):
+        '''Registration without the class metadata cache'''
+        for i, adapter in enumerate(adapters):
+            jythonmx.metadata_cache.invalidate(BenchMBean)
+            adapter.register('JythonMXBench:type=BenchMBean,name=%d' % i)
+
+    for name, fun in (('register (uncached metadata)', uncached),
+                      ('register (cached metadata)', register_all), ):
+        jythonmx.metadata_cache.invalidate()
+        adapters = [jythonmx.MBeanAdapter(BenchMBean(i))
+                    for i in xrange(count)]
+        report('%s x %d' % (name, count), timed(fun, adapters), count)
+        unregister_all(adapters)
+
+
+def logged(fun):
+    '''The exception logging decorator wrapped around the `MBeanAdapter`
+    methods before the introduction of adapter modes'''
+    def _wrapped(*args_, **kwargs): #pylint: disable-msg=C0111
+        try:
+            return fun(*args_, **kwargs)
+        except:
+            logging.exception('Error executing %s', fun.__name__)
+            raise
+
+    return _wrapped
+
+def legacy_get_attribute(adapter, name):
+    '''The attribute lookup performed by `MBeanAdapter.getAttribute` before
+    the introduction of attribute dispatch tables'''
+    #pylint: disable-msg=W0212
+    bean = adapter._bean
+    adapter._logger.debug('Attribute requested: %s', name)
+
+    if not hasattr(bean, name):
+        raise AttributeError(name)
+
+    type_ = adapter.DEFAULT_PROPERTY_TYPE
+    if hasattr(bean.__class__, name):
+        property_ = getattr(bean.__class__, name)
+        if isinstance(property_, jythonmx.TypedProperty):
+            type_ = property_.type
+
+    return type_(getattr(bean, name))
+
+legacy_get_attribute = logged(legacy_get_attribute)
+
+def bench_get_attribute(count=100000):
+    '''Read attributes through getAttribute'''
+    adapter = jythonmx.MBeanAdapter(BenchMBean(1))
+    names = ('count', 'label', 'enabled')
+
+    def legacy():
+        '''Read attributes through the legacy code path'''
+        for _ in xrange(count):
+            for name in names:
+                legacy_get_attribute(adapter, name)
+
+    def dispatched(adapter=adapter):
+        '''Read attributes through the dispatch table'''
+        get = adapter.getAttribute
+        for _ in xrange(count):
+            for name in names:
+                get(name)
+
+    def instrumented():
+        '''Read attributes through an instrumented adapter'''
+        dispatched(jythonmx.InstrumentedMBeanAdapter(BenchMBean(1)))
+
+    for name, fun in (('getAttribute (legacy)', legacy),
+                      ('getAttribute (dispatch table)', dispatched),
+                      ('getAttribute (instrumented)', instrumented), ):
+        report('%s x %d' % (name, count * len(names)), timed(fun),
+               count * len(names))
+
+
+def legacy_invoke(adapter, name, args_, sig): #pylint: disable-msg=W0613
+    '''The lookup performed by `MBeanAdapter.invoke` before the introduction
+    of operation dispatch tables'''
+    #pylint: disable-msg=W0212
+    if not hasattr(adapter._bean, name):
+        raise AttributeError(name)
+
+    fun = getattr(adapter._bean, name, None)
+    if not callable(fun):
+        raise AttributeError(name)
+
+    return_type = getattr(fun, '__returns__',
+                          adapter.DEFAULT_FUNCTION_RETURN_TYPE)
+    value = fun(*args_)
+    if return_type is java.lang.Void:
+        return
+    return return_type(value)
+
+def bench_invoke(count=100000):
+    '''Invoke an operation through invoke'''
+    adapter = jythonmx.MBeanAdapter(BenchMBean(1))
+    args_, sig = ('world', ), ('java.lang.String', )
+
+    def legacy():
+        '''Invoke through the legacy code path'''
+        for _ in xrange(count):
+            legacy_invoke(adapter, 'hello', args_, sig)
+
+    def dispatched():
+        '''Invoke through the dispatch table'''
+        invoke = adapter.invoke
+        for _ in xrange(count):
+            invoke('hello', args_, sig)
+
+    for name, fun in (('invoke (legacy)', legacy),
+                      ('invoke (dispatch table)', dispatched), ):
+        report('%s x %d' % (name, count), timed(fun), count)
+
+
+def legacy_get_mbean_info(adapter):
+    '''The lookup performed by `MBeanAdapter.getMBeanInfo` before tracing was
+    moved into `TracingMBeanAdapter`'''
+    #pylint: disable-msg=W0212
+    adapter._logger.debug('MBean info requested')
+
+    if adapter._registering:
+        return adapter._metadata.skeleton
+
+    return adapter.beaninfo
+
+legacy_get_mbean_info = logged(legacy_get_mbean_info)
+
+def bench_tracing(count=100000):
+    '''Call getMBeanInfo with and without tracing'''
+    bean = BenchMBean(1)
+    adapters = (
+        ('getMBeanInfo (logged, before)', jythonmx.MBeanAdapter(bean),
+         legacy_get_mbean_info),
+        ('getMBeanInfo (MBeanAdapter)', jythonmx.MBeanAdapter(bean),
+         jythonmx.MBeanAdapter.getMBeanInfo),
+        ('getMBeanInfo (TracingMBeanAdapter)',
+         jythonmx.TracingMBeanAdapter(bean),
+         jythonmx.TracingMBeanAdapter.getMBeanInfo),
+    )
+
+    def call(adapter, fun):
+        '''Call `fun` on `adapter` `count` times'''
+        for _ in xrange(count):
+            fun(adapter)
+
+    for name, adapter, fun in adapters:
+        report('%s x %d' % (name, count), timed(call, adapter, fun), count)
+
+
+def bench_contention(threads=16, adapters=500):
+    '''Register, use and unregister adapters from many threads at once'''
+    def work(offset):
+        '''Exercise a set of adapters'''
+        beans = [BenchMBean(i) for i in xrange(adapters)]
+        adapters_ = [jythonmx.MBeanAdapter(bean) for bean in beans]
+
+        for i, adapter in enumerate(adapters_):
+            adapter.register('JythonMXBench:type=BenchMBean,name=%d' % \
+                             (offset + i))
+        for bean, adapter in zip(beans, adapters_):
+            adapter.getMBeanInfo()
+            adapter.getAttribute('count')
+            for _ in xrange(10):
+                bean.changed('Changed')
+        unregister_all(adapters_)
+
+    def run(count):
+        '''Run `work` in `count` threads'''
+        workers = [threading.Thread(target=work, args=(i * adapters, ))
+                   for i in xrange(count)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    for count in (1, threads):
+        report('%d thread(s) x %d adapters' % (count, adapters),
+               timed(run, count), count * adapters)
+
+
+def bench_lazy(classes=200, count=50):
+    '''Register `count` beans of each of `classes` distinct classes'''
+    def register(lazy):
+        '''Register beans of freshly created classes'''
+        # Every run uses new classes, so nothing is cached
+        types_ = [type('BenchMBean%d' % i, (BenchMBean, ),
+                       {'__doc__': BenchMBean.__doc__})
+                  for i in xrange(classes)]
+        adapters = [jythonmx.MBeanAdapter(type_(i), lazy=lazy)
+                    for type_ in types_ for i in xrange(count)]
+
+        start = time.time()
+        for i, adapter in enumerate(adapters):
+            adapter.register('JythonMXBench:type=BenchMBean,name=%d' % i)
+        seconds = time.time() - start
+
+        unregister_all(adapters)
+        return seconds
+
+    total = classes * count
+    for name, lazy in (('register (eager)', False),
+                       ('register (lazy)', True), ):
+        report('%s x %d' % (name, total), register(lazy), total)
+
+
+def bench_array(size=100000, count=20):
+    '''Export numeric arrays of `size` elements'''
+    values = [float(i) for i in xrange(size)]
+    cases = (
+        ('Array(java.lang.Double), list', jythonmx.Array(java.lang.Double),
+         values),
+        ('Array(\'d\'), list', jythonmx.Array('d'), values),
+        ('Array(\'d\'), array.array', jythonmx.Array('d'),
+         array.array('d', values)),
+        ('Array(\'d\'), Java double[]', jythonmx.Array('d'),
+         jarray.array(values, 'd')),
+    )
+
+    def export(type_, values):
+        '''Coerce the values `count` times'''
+        for _ in xrange(count):
+            type_(values)
+
+    for name, type_, values in cases:
+        report('%s x %d' % (name, count), timed(export, type_, values), count)
+
+
+def bench_histogram(size=100000, count=1000):
+    '''Read the percentiles of `size` recorded values `count` times'''
+    values = [float(i % 1000) for i in xrange(size)]
+    histogram = jythonmx.HistogramValue()
+    for value in values:
+        histogram.update(value)
+    quantiles = (0.5, 0.75, 0.95, 0.99)
+
+    def naive():
+        '''Sort all values on every percentile read'''
+        for _ in xrange(count):
+            for quantile in quantiles:
+                sorted(values)[int(quantile * (len(values) - 1))]
+
+    def reservoir():
+        '''Read percentiles through the histogram attributes'''
+        for _ in xrange(count):
+            for attr in ('p50', 'p75', 'p95', 'p99'):
+                getattr(histogram, attr)
+
+    for name, fun in (('percentiles (sorted list)', naive),
+                      ('percentiles (histogram)', reservoir), ):
+        report('%s x %d' % (name, count * len(quantiles)), timed(fun),
+               count * len(quantiles))
+
+
+BENCHMARKS = (
+    ('startup', bench_startup),
+    ('getattribute', bench_get_attribute),
+    ('tracing', bench_tracing),
+    ('invoke', bench_invoke),
+    ('contention', bench_contention),
+    ('lazy', bench_lazy),
+    ('array', bench_array),
+    ('histogram', bench_histogram),
+)
+
+def main(names):
+    '''Run the benchmarks with the given names, or all of them'''
+    for name, fun in BENCHMARKS:
+        if not names or name in names:
+            print '%s: %s' % (name, fun.__doc__)
+            fun()
+            print
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -40,10 +40,23 @@ __version__ = 0, 0, 1
 __license__ = 'GNU Lesser General Public License version 2.1'
 __docformat__ = 'restructuredtext en'
 
-__all__ = 'returns', 'args', 'TypedProperty', 'MBeanAdapter', 'Array', 'signal',
-
+__all__ = 'returns', 'args', 'TypedProperty', 'MBeanAdapter', 'Array', \
+          'signal', 'NotificationQueue', 'MBeanRegistry', 'Composite', \
+          'Tabular', 'Counter', 'Gauge', 'Meter', 'Histogram', 'Timer', \
+          'Sampler', 'Threshold', 'ThresholdMonitor', \
+          'InstrumentedMBeanAdapter', 'AccessStats', 'TracingMBeanAdapter', \
+          'operation', 'async_operation', 'OperationExecutor', 'bulkhead', \
+          'Bulkhead', 'cached', 'HTTPExporter', 'PrometheusRenderer', \
+          'VersionedMBeanAdapter', 'adapter_class',
+
+import re
 import sys
+import cgi
+import math
+import time
+import array
 import types
+import random
 import logging
 import inspect
 import operator
@@ -53,6 +66,7 @@ import itertools
 
 #pylint: disable-msg=F0401
 import java.lang
+import java.math
 from java.lang.management import ManagementFactory
 from javax.management import DynamicMBean, ObjectName, \
                              MBeanInfo, MBeanAttributeInfo, \
@@ -61,8 +75,34 @@ from javax.management import DynamicMBean, ObjectName, \
                              AttributeNotFoundException, MBeanException, \
                              ReflectionException, \
                              Notification, NotificationBroadcasterSupport, \
-                             MBeanNotificationInfo
+                             NotificationFilterSupport, MBeanNotificationInfo
+import java.util
+from javax.management.openmbean import SimpleType, ArrayType, \
+                                      CompositeType, CompositeData, \
+                                      CompositeDataSupport, TabularType, \
+                                      TabularData, TabularDataSupport, \
+                                      OpenMBeanAttributeInfoSupport
+from java.util import LinkedHashMap, WeakHashMap
+from java.util.concurrent import ThreadFactory, Executors, ArrayBlockingQueue, \
+                                 TimeUnit, ThreadPoolExecutor, FutureTask, \
+                                 RejectedExecutionException, \
+                                 LinkedBlockingQueue, Semaphore, \
+                                 TimeoutException
+from java.util.concurrent.atomic import AtomicLong, AtomicBoolean, \
+                                        AtomicInteger, AtomicLongArray
+try:
+    from java.util.concurrent.atomic import LongAdder
+except ImportError:
+    # Java < 8
+    LongAdder = None
 import jarray
+from java.io import BufferedWriter, OutputStreamWriter
+from java.net import InetSocketAddress
+try:
+    from com.sun.net.httpserver import HttpServer, HttpHandler
+except ImportError:
+    # Not provided by all JVMs
+    HttpServer = HttpHandler = None
 #pylint: enable-msg=F0401
 
 #pylint: disable-msg=W0142,C0103,R0903,W0141,R0201,W0622
@@ -165,6 +205,76 @@ def test_args():
     assert f.__args__ == ((java.lang.String, 'Name'), java.lang.Integer)
 
 
+operation = tag_decorator('__operation__', lambda *a: a[0])
+operation.__doc__ = '''
+Define the name of the operation a method is exposed as
+
+By default, methods are exposed using their own name. Methods exposed using the
+same name, but taking different argument types, are overloads of a single
+operation, which are told apart by their signature.
+'''.strip()
+
+def test_operation():
+    '''Test `operation` behaviour'''
+    @operation('add')
+    def add_strings(): #pylint: disable-msg=C0111
+        pass
+
+    assert add_strings.__operation__ == 'add' #pylint: disable-msg=E1101
+
+
+def async_operation(fun_or_executor=None):
+    '''Mark a method as a long-running, asynchronous operation
+
+    Invoking the operation through JMX submits it to an `OperationExecutor`,
+    `operation_executor` by default, and immediately returns a job ID. Once
+    the method returns, a ``<operation>.completed`` notification is emitted,
+    or a ``<operation>.failed`` one if it raised an exception. The
+    ``userData`` of both is a map holding the ``jobId``, and the ``result``
+    coerced into the `returns` type, or the ``error`` message.
+
+    Example:
+
+    >>> class C(object):
+    ...     @async_operation
+    ...     def reindex(self):
+    ...         pass
+    ...
+    ...     @async_operation(OperationExecutor(pool_size=1))
+    ...     def flush(self):
+    ...         pass
+
+    :param fun_or_executor: method to mark, or executor to submit it to
+    :type fun_or_executor: `callable` or `OperationExecutor`
+    '''
+    if callable(fun_or_executor):
+        fun_or_executor.__async__ = operation_executor
+        return fun_or_executor
+
+    def tagger(fun):
+        '''Mark `fun` as an asynchronous operation'''
+        fun.__async__ = fun_or_executor or operation_executor
+        return fun
+
+    return tagger
+
+def test_async_operation():
+    '''Test `async_operation` behaviour'''
+    executor = object()
+
+    @async_operation
+    def f(): #pylint: disable-msg=C0111
+        pass
+
+    @async_operation(executor)
+    def g(): #pylint: disable-msg=C0111
+        pass
+
+    #pylint: disable-msg=E1101
+    assert f.__async__ is operation_executor
+    assert g.__async__ is executor
+
+
 # An attribute setter generator, similar to operator.attrgetter
 #pylint: disable-msg=E0601
 attrsetter = lambda attr: lambda self, value: setattr(self, attr, value)
@@ -185,13 +295,45 @@ def test_attrsetter():
     assert c._i == 456 #pylint: disable-msg=W0212
 
 
-# A helper to calculate the fully-qualified name of a class
-classname = lambda cls: '%s.%s' % (cls.__module__, cls.__name__)
+# A helper to calculate the fully-qualified name of a class, or the JMX name of
+# a type wrapper like `Array`
+classname = lambda cls: getattr(cls, 'typename', None) or \
+                        '%s.%s' % (cls.__module__, cls.__name__)
 
 def test_classname():
     '''Test `classname`'''
     assert classname(java.lang.String) == 'java.lang.String'
 
+def binary_classname(type_):
+    '''Calculate the binary name of a type, as returned by ``Class.getName``
+
+    This is the name JMX clients and proxies pass in operation signatures. It
+    only differs from `classname` for arrays of objects, e.g.
+    ``[Ljava.lang.String;`` instead of ``java.lang.String[]``.
+
+    :param type\_: type to name
+    :type type\_: `type` or `Array`
+
+    :return: binary class name
+    :rtype: `str`
+    '''
+    if not isinstance(type_, Array) or type_.typecode:
+        return classname(type_)
+
+    name = binary_classname(type_.type)
+    return '[%s' % name if name.startswith('[') else '[L%s;' % name
+
+def test_binary_classname():
+    '''Test `binary_classname`'''
+    assert binary_classname(java.lang.String) == 'java.lang.String'
+    assert binary_classname(Array('d')) == '[D'
+    assert binary_classname(Array(java.lang.String)) == '[Ljava.lang.String;'
+    assert binary_classname(Array(Array('i'))) == '[[I'
+
+
+# The identity function, for values which need no coercion
+identity = lambda value: value
+
 
 # A helper to flatten a docstring in one line
 format_docstring = lambda doc: ' '.join(itertools.imap(lambda s: s.strip(),
@@ -206,22 +348,289 @@ def test_format_docstring():
     assert format_docstring(docstring) == 'Abc def'
 
 
+class _LRUMap(LinkedHashMap):
+    '''An access-ordered ``LinkedHashMap`` evicting its eldest entries'''
+    def __init__(self, maxsize, evictions):
+        LinkedHashMap.__init__(self, 16, 0.75, True)
+        self._maxsize = maxsize
+        self._evictions = evictions
+
+    def removeEldestEntry(self, eldest): #pylint: disable-msg=W0613
+        '''Evict the eldest entry if the map grew too large'''
+        if self.size() > self._maxsize:
+            self._evictions.incrementAndGet()
+            return True
+
+        return False
+
+
+class LRUCache(object):
+    '''A thread-safe mapping holding at most `maxsize` entries
+
+    Once full, the least recently used entry is evicted to make room. Without
+    `maxsize`, nothing is ever evicted, but keys are only referenced weakly:
+    an entry is dropped once its key is garbage collected.
+    '''
+    __slots__ = '_map', '_lock', '_evictions',
+
+    def __init__(self, maxsize=None):
+        '''Initialize a new `LRUCache`
+
+        :param maxsize: maximum number of entries, or `None` for no limit
+        :type maxsize: `int`
+        '''
+        if maxsize is not None and maxsize < 1:
+            raise ValueError('maxsize should be positive')
+
+        self._evictions = AtomicLong()
+        if maxsize is None:
+            self._map = WeakHashMap()
+        else:
+            self._map = _LRUMap(maxsize, self._evictions)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''Retrieve the value of `key`, marking it as recently used'''
+        self._lock.acquire()
+        try:
+            value = self._map.get(key)
+        finally:
+            self._lock.release()
+
+        return default if value is None else value
+
+    def setdefault(self, key, value):
+        '''Retrieve the value of `key`, storing `value` if there's none yet'''
+        self._lock.acquire()
+        try:
+            current = self._map.get(key)
+            if current is not None:
+                return current
+
+            self._map.put(key, value)
+            return value
+        finally:
+            self._lock.release()
+
+    def __setitem__(self, key, value):
+        self._lock.acquire()
+        try:
+            self._map.put(key, value)
+        finally:
+            self._lock.release()
+
+    def pop(self, key, default=None):
+        '''Remove `key`, returning its value'''
+        self._lock.acquire()
+        try:
+            value = self._map.remove(key)
+        finally:
+            self._lock.release()
+
+        return default if value is None else value
+
+    def clear(self):
+        '''Remove all entries'''
+        self._lock.acquire()
+        try:
+            self._map.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return self._map.size()
+
+    evictions = property(lambda s: s._evictions.get(),
+                         doc='Number of entries evicted so far')
+
+def test_lru_cache():
+    '''Test `LRUCache` eviction'''
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.setdefault('a', 4) == 1
+    assert cache.pop('c') == 3
+    assert cache.evictions == 1
+
+    keys = [str(i) for i in xrange(1000)]
+    cache = LRUCache()
+    for i, key in enumerate(keys):
+        cache[key] = i
+    assert len(cache) == 1000
+    assert cache.evictions == 0
+
+
+class AttributeCache(object):
+    '''A cache of (coerced) attribute values, per bean, expiring after a TTL
+
+    When several threads miss the cache for the same bean at the same time,
+    only one of them computes the value, the others wait for it.
+
+    By default values of any number of beans are cached, each until its bean
+    is garbage collected. The `hits` and `misses` counters are totals over all
+    beans.
+    '''
+    __slots__ = '_ttl', '_entries', '_hits', '_misses',
+
+    class _Entry(object):
+        '''Cached value of a single bean'''
+        __slots__ = 'state', 'lock',
+
+        def __init__(self):
+            # (expiry time, value) pair, replaced at once
+            self.state = (0, None)
+            self.lock = threading.Lock()
+
+    def __init__(self, ttl, maxsize=None):
+        '''Initialize a new `AttributeCache`
+
+        :param ttl: number of seconds values are cached
+        :type ttl: `float`
+        :param maxsize: maximum number of beans values are cached of, or `None`
+                        for no limit
+        :type maxsize: `int`
+        '''
+        if ttl <= 0:
+            raise ValueError('ttl should be positive')
+
+        self._ttl = ttl
+        self._entries = LRUCache(maxsize)
+
+        self._hits = AtomicLong()
+        self._misses = AtomicLong()
+
+    def get(self, bean, compute):
+        '''Retrieve the cached value for `bean`, computing it if required
+
+        :param bean: bean the value belongs to
+        :type bean: `object`
+        :param compute: callable computing the value, given `bean`
+        :type compute: `callable`
+
+        :return: cached or computed value
+        :rtype: `object`
+        '''
+        entry = self._entries.get(bean) or \
+                self._entries.setdefault(bean, self._Entry())
+
+        expires, value = entry.state
+        if expires > time.time():
+            self._hits.incrementAndGet()
+            return value
+
+        entry.lock.acquire()
+        try:
+            # Some other thread might have computed the value in the meantime
+            expires, value = entry.state
+            if expires > time.time():
+                self._hits.incrementAndGet()
+                return value
+
+            self._misses.incrementAndGet()
+
+            value = compute(bean)
+            entry.state = (time.time() + self._ttl, value)
+
+            return value
+        finally:
+            entry.lock.release()
+
+    def invalidate(self, bean=None):
+        '''Drop cached values
+
+        :param bean: bean to drop the cached value of, or `None` to drop all
+        :type bean: `object`
+        '''
+        if bean is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(bean)
+
+    ttl = property(operator.attrgetter('_ttl'),
+                   doc='Number of seconds values are cached')
+    hits = property(lambda s: s._hits.get(),
+                    doc='Number of cache hits, over all beans')
+    misses = property(lambda s: s._misses.get(),
+                      doc='Number of cache misses, over all beans')
+    size = property(lambda s: len(s._entries),
+                    doc='Number of beans values are cached of')
+    evictions = property(lambda s: s._entries.evictions,
+                         doc='Number of cached values evicted')
+
+def test_attribute_cache():
+    '''Test `AttributeCache` hits, misses and invalidation'''
+    calls = []
+    def compute(bean): #pylint: disable-msg=C0111
+        calls.append(bean)
+        return len(calls)
+
+    cache = AttributeCache(60)
+    assert cache.get('a', compute) == 1
+    assert cache.get('a', compute) == 1
+    assert cache.get('b', compute) == 2
+    assert (cache.hits, cache.misses, cache.size) == (1, 2, 2)
+
+    cache.invalidate('a')
+    assert cache.get('a', compute) == 3
+    cache.invalidate()
+    assert cache.size == 0
+
+
 class TypedProperty(property):
     '''
     A descriptor, similar to the builtin `property`, which also takes a type
     definition
+
+    Expensive getters can be cached by passing a `ttl` (and optionally a
+    `maxsize`): reads through an `MBeanAdapter` then return the coerced value
+    computed at most `ttl` seconds earlier. The cache hit and miss counters are
+    exposed as extra attributes on the MBean; they count the reads of all
+    beans sharing the property, i.e. instances of the same class. Reads from
+    Python code are never cached.
+
+    Numeric properties created with `sample` set are recorded periodically by
+    the `Sampler` of any adapter exposing them.
+
+    Every assignment drops the cached value of the bean. Properties created
+    with `tracked` set declare their value only changes through assignments:
+    they count the assignments of every bean, see `changes`, so a versioned
+    adapter (see `adapter_class`) only reads them again once they're assigned.
     '''
     def __init__(self, type_, *args_, **kwargs):
         '''Initialize a `TypedProperty`
 
-        All ``*args_`` and ``**kwargs`` are passed as-is to the builtin
+        All other ``*args_`` and ``**kwargs`` are passed as-is to the builtin
         `property` constructor.
 
         :param type\_: type of the property value
         :type type\_: `type`
+        :param ttl: number of seconds values read through JMX are cached
+        :type ttl: `float`
+        :param maxsize: maximum number of beans values are cached of, by
+                        default unlimited
+        :type maxsize: `int`
+        :param sample: record the value in a `Sampler`
+        :type sample: `bool`
+        :param tracked: the value only changes through assignments
+        :type tracked: `bool`
         '''
+        ttl = kwargs.pop('ttl', None)
+        maxsize = kwargs.pop('maxsize', None)
+        sample = kwargs.pop('sample', False)
+        tracked = kwargs.pop('tracked', False)
+
         property.__init__(self, *args_, **kwargs)
         self._type = type_
+        self._sampled = sample
+        self._tracked = tracked
+        # Change count of every assigned bean, if tracked
+        self._changes = LRUCache() if tracked else None
+        self._cache = AttributeCache(ttl, maxsize) if ttl else None
 
         # Make sure the local __doc__ attribute is set correctly
         # 'property' seems to do this, but somehow instances of TypedProperty
@@ -234,6 +643,87 @@ class TypedProperty(property):
 
     type = property(operator.attrgetter('_type'),
                     doc='Type of the property value')
+    cache = property(operator.attrgetter('_cache'),
+                     doc='`AttributeCache` of the property, if any')
+    sampled = property(operator.attrgetter('_sampled'),
+                       doc='Whether the property value is sampled')
+    tracked = property(operator.attrgetter('_tracked'),
+                       doc='Whether the value only changes through ' \
+                           'assignments')
+
+    def changes(self, bean):
+        '''Retrieve the number of assignments of the property on `bean`, if
+        it's `tracked`
+
+        :param bean: bean to count the assignments of
+        :type bean: `object`
+
+        :return: number of assignments
+        :rtype: `long`
+        '''
+        count = self._changes.get(bean) if self._tracked else None
+        return 0 if count is None else count.get()
+
+    def __set__(self, obj, value):
+        property.__set__(self, obj, value)
+
+        if self._tracked:
+            count = self._changes.get(obj)
+            if count is None:
+                count = self._changes.setdefault(obj, AtomicLong())
+            count.incrementAndGet()
+
+        if self._cache is not None:
+            self._cache.invalidate(obj)
+
+    def invalidate(self, bean=None):
+        '''Drop the cached values of the property, if it's cached
+
+        :param bean: bean to drop the cached value of, or `None` to drop all
+        :type bean: `object`
+        '''
+        if self._cache is not None:
+            self._cache.invalidate(bean)
+
+    def mbean_attributes(self, name):
+        '''List the extra attributes to expose on MBeans using this property
+
+        :param name: name of the property
+        :type name: `str`
+
+        :return: ``(name, type, description, getter)`` tuples, the getter
+                 taking the bean as its single argument
+        :rtype: ``iterable<tuple>``
+        '''
+        cache = self._cache
+        if cache is None:
+            return ()
+
+        return (
+            ('%sCacheHits' % name, java.lang.Long,
+             'Number of cached reads of %s, over all beans of the class' % \
+                 name,
+             lambda _: cache.hits),
+            ('%sCacheMisses' % name, java.lang.Long,
+             'Number of uncached reads of %s, over all beans of the class' % \
+                 name,
+             lambda _: cache.misses),
+        )
+
+    def mbean_changes(self, name):
+        '''List the change counts of the attributes exposing this property
+
+        :param name: name of the property
+        :type name: `str`
+
+        :return: ``(name, changes)`` pairs, `changes` taking the bean as its
+                 single argument, if the property is `tracked`
+        :rtype: ``iterable<tuple>``
+        '''
+        if not self._tracked:
+            return ()
+
+        return ((name, self.changes), )
 
 def test_typed_property():
     '''Test `TypedProperty`'''
@@ -246,19 +736,62 @@ def test_typed_property():
     assert C.i.type == java.lang.String
     assert C.i.fget is getter
     assert C.i.fset is setter
+    assert C.i.cache is None
+    assert not C.i.sampled
+    assert C.i.mbean_attributes('i') == ()
+    assert C.i.mbean_changes('i') == ()
+
+    class D(object): #pylint: disable-msg=C0111
+        i = TypedProperty(java.lang.String, fget=getter, fset=setter,
+                          tracked=True)
+
+    a, b = D(), D()
+    a.i = 'a'
+    a.i = 'b'
+    assert (D.i.changes(a), D.i.changes(b)) == (2, 0)
+
+def test_cached_typed_property():
+    '''Test `TypedProperty` caching options'''
+    class C(object): #pylint: disable-msg=C0111
+        i = TypedProperty(java.lang.Integer, fget=lambda _: 1, ttl=5,
+                          maxsize=10)
+
+    assert C.i.cache.ttl == 5
+    assert [a[0] for a in C.i.mbean_attributes('i')] == ['iCacheHits',
+                                                         'iCacheMisses']
 
 
 class Array(object):
-    '''Representation of a Java array'''
-    __slots__ = '_type',
+    '''Representation of a Java array
+
+    Arrays of Java primitives are declared using their ``jarray`` typecode,
+    e.g. ``Array('d')`` for ``double[]``. Values of such arrays aren't boxed:
+    an ``array.array`` (or a Java array) of the same typecode is exported
+    as-is, since Jython stores it in a Java array already, other sequences
+    are copied into a new Java array at once.
+    '''
+    __slots__ = '_type', '_typecode',
+
+    # Java primitive type names and binary class name suffixes, by typecode
+    PRIMITIVES = {
+        'z': ('boolean', 'Z'),
+        'b': ('byte', 'B'),
+        'c': ('char', 'C'),
+        'h': ('short', 'S'),
+        'i': ('int', 'I'),
+        'l': ('long', 'J'),
+        'f': ('float', 'F'),
+        'd': ('double', 'D'),
+    }
 
     def __init__(self, type_):
         '''Initialize a new array representation
 
-        :param type\_: type contained in the array
-        :type type\_: `type`
+        :param type\_: type contained in the array, or a primitive typecode
+        :type type\_: `type` or `str`
         '''
         self._type = type_
+        self._typecode = type_ if type_ in self.PRIMITIVES else None
 
     def __call__(self, values):
         '''Coerce the given values into a Java array
@@ -271,597 +804,5885 @@ class Array(object):
         :return: Java array containing all values
         :rtype: ``jarray.array``
         '''
-        return jarray.array(tuple(self._type(value) for value in values),
-                            self._type)
+        typecode = self._typecode
+        if typecode is None:
+            return jarray.array(tuple(self._type(value) for value in values),
+                                self._type)
+
+        if isinstance(values, array.array):
+            if values.typecode == typecode:
+                return values
+            values = values.tolist()
+
+        return jarray.array(values, typecode)
 
     #pylint: disable-msg=W0212
-    __module__ = property(fget=lambda s: s._type.__module__,
+    __module__ = property(fget=lambda s: '' if s._typecode \
+                                            else s._type.__module__,
                           doc='Type definition module name')
-    __name__ = property(fget=lambda s: '%s[]' % s._type.__name__,
+    __name__ = property(fget=lambda s: '%s[]' % (
+                                s.PRIMITIVES[s._typecode][0] if s._typecode \
+                                else s._type.__name__),
                         doc='Array type name')
+    typename = property(fget=lambda s: '[%s' % s.PRIMITIVES[s._typecode][1] \
+                                       if s._typecode \
+                                       else '%s.%s' % (s.__module__,
+                                                       s.__name__),
+                        doc='Array type name as used by JMX')
+    typecode = property(fget=operator.attrgetter('_typecode'),
+                        doc='Typecode of primitive arrays, or `None`')
+    type = property(fget=operator.attrgetter('_type'),
+                    doc='Type contained in the array')
 
 def test_array():
     '''Test array type wrapper'''
     type_ = Array(java.lang.String)
     assert type_.__module__ == java.lang.String.__module__
     assert type_.__name__ == '%s[]' % java.lang.String.__name__
-    # TODO Test array coercion
+    assert classname(type_) == 'java.lang.String[]'
+    assert list(type_(('a', 'b'))) == ['a', 'b']
+
+def test_primitive_array():
+    '''Test primitive array type wrapper'''
+    type_ = Array('d')
+    assert type_.__name__ == 'double[]'
+    assert classname(type_) == '[D'
+
+    values = array.array('d', (1.0, 2.0))
+    assert type_(values) is values
+    assert type_([1, 2]).typecode == 'd'
+    assert list(type_(array.array('i', (1, 2)))) == [1.0, 2.0]
+
+
+# Open types of all simple (Java) types
+SIMPLE_TYPES = {
+    java.lang.Boolean: SimpleType.BOOLEAN,
+    java.lang.Byte: SimpleType.BYTE,
+    java.lang.Character: SimpleType.CHARACTER,
+    java.lang.Short: SimpleType.SHORT,
+    java.lang.Integer: SimpleType.INTEGER,
+    java.lang.Long: SimpleType.LONG,
+    java.lang.Float: SimpleType.FLOAT,
+    java.lang.Double: SimpleType.DOUBLE,
+    java.lang.String: SimpleType.STRING,
+    java.math.BigDecimal: SimpleType.BIGDECIMAL,
+    java.math.BigInteger: SimpleType.BIGINTEGER,
+    java.util.Date: SimpleType.DATE,
+    ObjectName: SimpleType.OBJECTNAME,
+}
+
+def open_type(type_):
+    '''Calculate the ``OpenType`` of a type definition
+
+    :param type\_: type definition, a simple Java type, a `Composite`, a
+                   `Tabular` or an `Array` of any of these
+    :type type\_: `type`
+
+    :return: open type
+    :rtype: ``javax.management.openmbean.OpenType``
+    '''
+    opentype = getattr(type_, 'opentype', None)
+    if opentype is not None:
+        return opentype
 
+    if isinstance(type_, Array):
+        if type_.typecode:
+            return ArrayType.getPrimitiveArrayType(
+                       java.lang.Class.forName(type_.typename))
+        return ArrayType(1, open_type(type_.type))
 
-class NotificationTrigger(object):
-    '''An MBean notification/signal slot'''
-    __slots__ = '_name', '_sendNotification', '_nextId', '_source',
+    try:
+        return SIMPLE_TYPES[type_]
+    except (KeyError, TypeError):
+        raise TypeError('No open type for %s' % classname(type_))
 
-    def __init__(self, name):
-        self._name = name
+def test_open_type():
+    '''Test `open_type`'''
+    assert open_type(java.lang.Long) == SimpleType.LONG
+    assert open_type(Array(java.lang.String)).elementOpenType == \
+        SimpleType.STRING
+    assert open_type(Array('d')).className == '[D'
 
-        self._sendNotification = None
-        self._nextId = None
-        self._source = None
+    try:
+        open_type(java.lang.Thread)
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError not raised'
 
-    def __call__(self, message=None, userData=None):
-        '''Emit notification
 
-        Note: both arguments will be coerced into ``java.lang.String``.
+class Composite(object):
+    '''Representation of an open ``CompositeData`` type
 
-        :param message: notification message
-        :type message: `unicode`
-        :param userData: notification ``userData``
-        :type userData: `unicode`
-        '''
-        # If not all of these are set, we aren't registered yet. No-op.
-        if not all((self._sendNotification, self._nextId, self._source, )):
-            return
+    Related values can be exposed as a single composite attribute, so clients
+    can retrieve all of them in one read. The ``CompositeType`` is built once,
+    when the type is defined.
 
-        if not message:
-            notification = Notification(self.name, self._source, self._nextId())
-        else:
-            notification = Notification(self.name, self._source, self._nextId(),
-                                        java.lang.String(message))
+    Values are coerced from a `dict`, or from a sequence holding the item
+    values in order. Missing items are ``null``.
 
-        if userData:
-            notification.setUserData(java.lang.String(userData))
+    Example:
+
+    >>> stats = Composite('Stats', (
+    ...     ('hits', java.lang.Long, 'Number of cache hits'),
+    ...     ('misses', java.lang.Long),
+    ... ))
+    '''
+    __slots__ = '_opentype', '_keys', '_types',
 
-        self._sendNotification(notification)
+    def __init__(self, name, items, description=None):
+        '''Initialize a new composite type
 
-    name = property(operator.attrgetter('_name'), doc='Notification type name')
+        :param name: type name
+        :type name: `str`
+        :param items: ``(key, type)`` or ``(key, type, description)`` tuples
+        :type items: ``iterable<tuple>``
+        :param description: type description
+        :type description: `str`
+        '''
+        items = [item if len(item) == 3 else (item[0], item[1], item[0])
+                 for item in items]
 
-    def _setSendNotification(self, value):
-        '''Set the callable to use to emit notifications'''
-        if self._sendNotification:
-            raise RuntimeError('Can\'t set sendNotification twice')
+        self._keys = tuple(key for key, _, _ in items)
+        self._types = tuple(type_ for _, type_, _ in items)
+        self._opentype = CompositeType(name, description or name, self._keys,
+                                       tuple(doc for _, _, doc in items),
+                                       tuple(open_type(type_)
+                                             for type_ in self._types))
 
-        self._sendNotification = value
+    def __call__(self, value):
+        '''Coerce the given value into ``CompositeData``
 
-    sendNotification = property(fset=_setSendNotification,
-                                doc='Setter for function to call when ' \
-                                    'sending notifications')
+        :param value: values of all items
+        :type value: `dict` or ``iterable``
 
-    def _setNextId(self, value):
+        :return: composite data
+        :rtype: ``CompositeData``
         '''
-        Set the callable to use to retrieve the next notification sequence
-        number
-        '''
-        if self._nextId:
-            raise RuntimeError('Can\'t set nextId twice')
+        if isinstance(value, CompositeData):
+            return value
 
-        self._nextId = value
+        if isinstance(value, dict):
+            values = [value.get(key) for key in self._keys]
+        else:
+            values = list(value)
+            if len(values) != len(self._keys):
+                raise ValueError('Expected %d values' % len(self._keys))
 
-    nextId = property(fset=_setNextId, doc='Setter for the nextId function')
+        return CompositeDataSupport(self._opentype, self._keys,
+                                    [None if v is None else type_(v)
+                                     for type_, v in zip(self._types, values)])
 
-    def _setSource(self, value):
-        '''Set the source of all notifications'''
-        if self._source:
-            raise RuntimeError('Can\'t set source twice')
+    opentype = property(operator.attrgetter('_opentype'),
+                        doc='``CompositeType`` of the values')
+    keys = property(operator.attrgetter('_keys'), doc='Item names')
+    typename = 'javax.management.openmbean.CompositeData'
 
-        self._source = value
+def test_composite():
+    '''Test `Composite` type wrapper'''
+    type_ = Composite('Stats', (('hits', java.lang.Long, 'Cache hits'),
+                                ('name', java.lang.String)))
+    assert classname(type_) == 'javax.management.openmbean.CompositeData'
+    assert type_.opentype.getDescription('hits') == 'Cache hits'
 
-    source = property(fset=_setSource, doc='Setter for the notification source')
+    value = type_({'hits': 1, 'name': 'c'})
+    assert value.get('hits') == 1
+    assert type_((2, 'c')).get('hits') == 2
+    assert type_({'hits': 3}).get('name') is None
 
-signal = NotificationTrigger
 
+class Tabular(object):
+    '''Representation of an open ``TabularData`` type
 
-# TODO This is not correct, the returned function is locked by a global lock
-# (for all instances), not instance-specific
-def synchronised(fun):
-    '''Decorator to add a lock around a function
+    Values are coerced from a sequence of rows, every row being coerced using
+    the `Composite` row type.
+    '''
+    __slots__ = '_opentype', '_row',
 
-    Think ``synchronised`` in Java.
+    def __init__(self, row, index, name=None, description=None):
+        '''Initialize a new tabular type
 
-    :param fun: function to decorate
-    :type fun: `callable`
+        :param row: type of the rows
+        :type row: `Composite`
+        :param index: names of the row items which uniquely identify a row
+        :type index: ``iterable<str>``
+        :param name: type name
+        :type name: `str`
+        :param description: type description
+        :type description: `str`
+        '''
+        name = name or '%sTable' % row.opentype.typeName
+        self._row = row
+        self._opentype = TabularType(name, description or name, row.opentype,
+                                     tuple(index))
 
-    :return: decorated function
-    :rtype: `callable`
-    '''
-    lock = threading.Lock()
+    def __call__(self, rows):
+        '''Coerce the given rows into ``TabularData``
 
-    @functools.wraps(fun)
-    def _wrapped(*args_, **kwargs): #pylint: disable-msg=C0111
-        lock.acquire()
-        try:
-            return fun(*args_, **kwargs)
-        finally:
-            lock.release()
+        :param rows: all rows
+        :type rows: ``iterable``
 
-    return _wrapped
+        :return: tabular data
+        :rtype: ``TabularData``
+        '''
+        if isinstance(rows, TabularData):
+            return rows
 
-def test_synchronised():
-    '''Test `synchronised`'''
-    import time
+        data = TabularDataSupport(self._opentype)
+        for row in rows:
+            data.put(self._row(row))
 
-    @synchronised
-    def f(): #pylint: disable-msg=C0111
-        time.sleep(1)
+        return data
 
-    t1 = threading.Thread(target=f)
-    t2 = threading.Thread(target=f)
+    opentype = property(operator.attrgetter('_opentype'),
+                        doc='``TabularType`` of the values')
+    row = property(operator.attrgetter('_row'), doc='Type of the rows')
+    typename = 'javax.management.openmbean.TabularData'
 
-    start = time.time()
-    t1.start()
-    t2.start()
-    t1.join()
-    t2.join()
-    end = time.time()
+def test_tabular():
+    '''Test `Tabular` type wrapper'''
+    type_ = Tabular(Composite('Module', (('name', java.lang.String),
+                                         ('size', java.lang.Integer))),
+                    ('name', ))
+    assert classname(type_) == 'javax.management.openmbean.TabularData'
 
-    assert 1.9 < (end - start) < 2.5
+    value = type_(({'name': 'a', 'size': 1}, ('b', 2)))
+    assert value.size() == 2
+    assert value.get(('b', )).get('size') == 2
 
 
-#pylint: disable-msg=E0601
-list_attributes = lambda obj: itertools.imap(
-                                  lambda name: (name, getattr(obj, name)),
-                                  itertools.ifilter(
-                                      lambda name: not name.startswith('_'),
-                                      dir(obj)))
-#pylint: enable-msg=E0601
-list_attributes.__doc__ = '''
-List all public, non-internal attributes of an object
+class NotificationTrigger(object):
+    '''An MBean notification/signal slot
+
+    Triggers are declared on the bean class, but notifications are emitted on
+    behalf of a bean instance: when an `MBeanAdapter` is registered, it stores
+    a `BoundNotificationTrigger` in the instance dictionary of its bean,
+    shadowing the class-level trigger. Calling a trigger which isn't bound to
+    an adapter is a no-op.
+
+    Signals firing in bursts can be tamed using the `max_rate` and `coalesce`
+    options:
+
+    `max_rate`
+        Maximum number of notifications emitted per second. Notifications
+        exceeding the rate are dropped, unless `coalesce` is set as well.
+    `coalesce`
+        Length of a coalescing window, in seconds. Notifications which aren't
+        emitted immediately are collected during the window, and emitted as a
+        single notification when it ends. Its message is the message of the
+        first collected notification, its ``userData`` a map containing the
+        ``count``, ``firstMessage`` and ``lastMessage``. If `max_rate` isn't
+        set, all notifications are coalesced.
 
-This function yields all ``(name, attribute)`` pairs for all attributes on the
-given object whose name doesn't start with an underscore.
+    Example:
 
-:param obj: object to inspect
-:type obj: `object`
+    >>> class C(object):
+    ...     errors = signal('errors', max_rate=10, coalesce=1.0)
+    '''
+    __slots__ = '_name', '_max_rate', '_coalesce',
 
-:return: ``(name, attribute)`` pairs of all public attributes on the object
-:rtype: ``iterable<tuple<str, object>>``
-'''.strip()
+    def __init__(self, name, max_rate=None, coalesce=None):
+        '''Initialize a new `NotificationTrigger`
 
-def test_list_attributes():
-    '''Test `list_attributes`'''
-    class C(object): #pylint: disable-msg=C0111
-        def __init__(self):
-            pass
+        :param name: notification type name
+        :type name: `str`
+        :param max_rate: maximum number of notifications per second
+        :type max_rate: `float`
+        :param coalesce: coalescing window length, in seconds
+        :type coalesce: `float`
+        '''
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError('max_rate should be positive')
+        if coalesce is not None and coalesce <= 0:
+            raise ValueError('coalesce should be positive')
 
-        def hello(self): #pylint: disable-msg=C0111
-            pass
+        self._name = name
+        self._max_rate = max_rate
+        self._coalesce = coalesce
 
-        def _bye(self): #pylint: disable-msg=C0111
-            pass
+    def __call__(self, message=None, userData=None):
+        '''Emit notification
 
-        i = property()
-        _j = property()
+        The trigger isn't bound to a registered adapter, so this is a no-op.
+        '''
+        pass
 
-    assert set(list_attributes(C)) == set((('hello', C.hello), ('i', C.i)))
+    def __get__(self, obj, type_=None):
+        '''Descriptor access, used when no bound trigger shadows this one'''
+        return self
 
+    name = property(operator.attrgetter('_name'), doc='Notification type name')
+    max_rate = property(operator.attrgetter('_max_rate'),
+                        doc='Maximum number of notifications per second')
+    coalesce = property(operator.attrgetter('_coalesce'),
+                        doc='Coalescing window length, in seconds')
 
-#TODO Use class logger
-def logged(fun):
-    '''A decorator to log all exceptions raised in a method
+    def bind(self, adapter):
+        '''Create a trigger emitting notifications through `adapter`
 
-    The Java JMX subsystems swallows all exceptions raised in MBean methods,
-    which makes debugging rather hard. This decorator can be wrapped around a
-    method, after which any exception raised while executing the method will be
-    logged using logging.exception, and re-raised.
+        :param adapter: adapter used to send notifications
+        :type adapter: `MBeanAdapter`
 
-    :param fun: function to decorate
-    :type fun: `callable`
+        :return: bound trigger
+        :rtype: `BoundNotificationTrigger`
+        '''
+        if self._max_rate or self._coalesce:
+            return ThrottledNotificationTrigger(self, adapter)
 
-    :return: decorated function
-    :rtype: `callable`
-    '''
-    @functools.wraps(fun)
-    def _wrapped(*args_, **kwargs): #pylint: disable-msg=C0111
-        try:
-            return fun(*args_, **kwargs)
-        except:
-            logging.exception('Error executing %s', fun.__name__)
-            raise
+        return BoundNotificationTrigger(self, adapter)
 
-    return _wrapped
+signal = NotificationTrigger
 
-def test_logged():
-    '''Make sure `logged` passes through the exception'''
-    raised_exc = Exception('Hello world')
 
-    @logged
-    def f(): #pylint: disable-msg=C0111
-        raise raised_exc
+class BoundNotificationTrigger(object):
+    '''A `NotificationTrigger` bound to a registered `MBeanAdapter`'''
+    __slots__ = '_trigger', '_name', '_adapter', '_source',
 
-    try:
-        f()
-    except Exception, exc: #pylint: disable-msg=W0703
-        assert exc is raised_exc
-    else:
-        assert False, 'Exception not raised'
+    def __init__(self, trigger, adapter):
+        self._trigger = trigger
+        self._name = trigger.name
+        self._adapter = adapter
+        self._source = adapter.source
 
+    def __call__(self, message=None, userData=None):
+        '''Emit notification
 
-class MBeanAdapter(NotificationBroadcasterSupport, DynamicMBean, object):
-    '''An adapter for plain Python classes to act as MBeans in JMX'''
+        Nothing is allocated if no listener of the adapter is interested in
+        notifications of this type.
 
-    __slots__ = '_bean', '_registered', '_name', '_currentId', '_beaninfo', \
-                '_notificationinfo', '_logger',
+        Note: both arguments will be coerced into ``java.lang.String``.
+
+        :param message: notification message
+        :type message: `unicode`
+        :param userData: notification ``userData``
+        :type userData: `unicode`
+        '''
+        #pylint: disable-msg=W0212
+        if self._name not in self._adapter._interested:
+            return
+
+        self._send(message, userData)
+
+    def _send(self, message, userData):
+        '''Create a notification and send it through the adapter'''
+        adapter = self._adapter
+
+        if not message:
+            notification = Notification(self._name, self._source,
+                                        adapter._nextId())
+        else:
+            notification = Notification(self._name, self._source,
+                                        adapter._nextId(),
+                                        java.lang.String(message))
+
+        if userData:
+            if isinstance(userData, basestring):
+                userData = java.lang.String(userData)
+            notification.setUserData(userData)
+
+        adapter.sendNotification(notification)
+
+    def unbind(self):
+        '''Release all resources held on behalf of the adapter'''
+        pass
+
+    name = property(operator.attrgetter('_name'), doc='Notification type name')
+    adapter = property(operator.attrgetter('_adapter'),
+                       doc='Adapter used to send notifications')
+
+def test_notification_trigger():
+    '''Test unbound and bound `NotificationTrigger` behaviour'''
+    class C(object): #pylint: disable-msg=C0111
+        test = signal('test')
+
+    c = C()
+    assert C.test is c.test
+    assert c.test.name == 'test'
+    c.test('No-op') # Unbound triggers don't emit anything
+
+    sent = []
+    class FakeAdapter(object): #pylint: disable-msg=C0111
+        source = 'C'
+        _interested = frozenset()
+        _nextId = lambda self: len(sent) + 1
+        sendNotification = sent.append
+
+    adapter = FakeAdapter()
+    c.__dict__['test'] = C.test.bind(adapter)
+    c.test('Nobody listens')
+    assert not sent
+
+    adapter._interested = frozenset(('test', )) #pylint: disable-msg=W0212
+    c.test('Hello', 'world')
+    assert len(sent) == 1
+    assert sent[0].type == 'test'
+    assert sent[0].message == 'Hello'
+    assert sent[0].userData == 'world'
+
+    del c.test
+    assert c.test is C.test
+
+
+class ThrottledNotificationTrigger(BoundNotificationTrigger):
+    '''A bound trigger enforcing the `max_rate` and `coalesce` options of its
+    `NotificationTrigger`
+
+    The rate is enforced using a token bucket, holding up to `max_rate`
+    tokens, and at least one so rates below one notification per second still
+    let notifications through.
+    '''
+    __slots__ = '_lock', '_maxRate', '_capacity', '_window', '_tokens', \
+                '_lastRefill', '_suppressed', '_count', '_firstMessage', \
+                '_lastMessage', '_lastUserData',
+
+    def __init__(self, trigger, adapter):
+        BoundNotificationTrigger.__init__(self, trigger, adapter)
+
+        self._lock = threading.Lock()
+        self._maxRate = trigger.max_rate
+        self._capacity = max(1.0, self._maxRate or 0)
+        self._window = trigger.coalesce
+
+        self._tokens = self._capacity
+        self._lastRefill = time.time()
+        self._suppressed = 0
+
+        self._count = 0
+        self._firstMessage = None
+        self._lastMessage = None
+        self._lastUserData = None
+
+    def __call__(self, message=None, userData=None):
+        '''Emit notification, or collect it for coalescing
+
+        :param message: notification message
+        :type message: `unicode`
+        :param userData: notification ``userData``
+        :type userData: `unicode`
+        '''
+        #pylint: disable-msg=W0212
+        if self._name not in self._adapter._interested:
+            return
+
+        immediate = schedule = False
+
+        self._lock.acquire()
+        try:
+            if self._maxRate:
+                now = time.time()
+                tokens = min(self._capacity, self._tokens + \
+                                             (now - self._lastRefill) * \
+                                             self._maxRate)
+                self._lastRefill = now
+
+                immediate = tokens >= 1
+                self._tokens = tokens - 1 if immediate else tokens
+
+            if not immediate:
+                if not self._window:
+                    self._suppressed += 1
+                    return
+
+                if self._count == 0:
+                    self._firstMessage = message
+                    schedule = True
+
+                self._count += 1
+                self._lastMessage = message
+                self._lastUserData = userData
+        finally:
+            self._lock.release()
+
+        if immediate:
+            self._send(message, userData)
+        elif schedule:
+            scheduler().schedule(self._dispatchFlush,
+                                 long(self._window * 1000),
+                                 TimeUnit.MILLISECONDS)
+
+    def _dispatchFlush(self):
+        '''Hand the flush of the current window to the delivery executor
+
+        Listeners of adapters without a `NotificationQueue` are called on the
+        flushing thread, which must not be the shared scheduler thread.
+        '''
+        delivery_executor().execute(self._flush)
+
+    def _flush(self):
+        '''Emit all notifications collected in the current window'''
+        self._lock.acquire()
+        try:
+            count, first = self._count, self._firstMessage
+            last, userData = self._lastMessage, self._lastUserData
+
+            self._count = 0
+            self._firstMessage = self._lastMessage = self._lastUserData = None
+        finally:
+            self._lock.release()
+
+        #pylint: disable-msg=W0212
+        if count == 0 or self._name not in self._adapter._interested:
+            return
+
+        if count == 1:
+            self._send(last, userData)
+            return
+
+        data = java.util.HashMap()
+        data.put('count', java.lang.Long(count))
+        data.put('firstMessage', java.lang.String(first or ''))
+        data.put('lastMessage', java.lang.String(last or ''))
+
+        self._send(first, data)
+
+    suppressed = property(operator.attrgetter('_suppressed'),
+                          doc='Number of notifications dropped because the ' \
+                              'rate was exceeded')
+
+def test_throttled_notification_trigger():
+    '''Test `ThrottledNotificationTrigger` rate limiting and coalescing'''
+    sent = []
+    class FakeAdapter(object): #pylint: disable-msg=C0111
+        source = 'C'
+        _interested = frozenset(('test', ))
+        _nextId = lambda self: len(sent) + 1
+        sendNotification = sent.append
+
+    bound = signal('test', max_rate=2).bind(FakeAdapter())
+    assert isinstance(bound, ThrottledNotificationTrigger)
+    for i in xrange(3):
+        bound('Message %d' % i)
+    assert [n.message for n in sent] == ['Message 0', 'Message 1']
+    assert bound.suppressed == 1
+
+    del sent[:]
+    bound = signal('test', coalesce=60).bind(FakeAdapter())
+    for i in xrange(3):
+        bound('Message %d' % i)
+    assert not sent
+
+    bound._flush() #pylint: disable-msg=W0212
+    assert len(sent) == 1
+    assert sent[0].message == 'Message 0'
+    assert sent[0].userData.get('count') == 3
+    assert sent[0].userData.get('lastMessage') == 'Message 2'
+
+    bound._flush() #pylint: disable-msg=W0212
+    assert len(sent) == 1
+
+    # Scheduled flushes are delivered on the delivery executor
+    del sent[:]
+    bound('Message')
+    delivered = threading.Event()
+    FakeAdapter.sendNotification = lambda _, n: (sent.append(n),
+                                                 delivered.set())
+    bound._dispatchFlush() #pylint: disable-msg=W0212
+    delivered.wait(5)
+    assert [n.message for n in sent] == ['Message']
+    FakeAdapter.sendNotification = sent.append
+
+    # Fractional rates still let a notification through every 1 / max_rate
+    # seconds
+    del sent[:]
+    bound = signal('test', max_rate=0.5).bind(FakeAdapter())
+    bound('First')
+    bound('Second')
+    assert [n.message for n in sent] == ['First']
+    assert bound.suppressed == 1
+
+    bound._lastRefill -= 2 #pylint: disable-msg=W0212
+    bound('Third')
+    assert [n.message for n in sent] == ['First', 'Third']
+
+    try:
+        signal('test', max_rate=0)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+
+class Threshold(NotificationTrigger):
+    '''A notification emitted when an attribute crosses a threshold
+
+    Thresholds are declared on the bean class, next to the attribute they
+    watch. While the bean is registered, the attribute is read locally by a
+    `ThresholdMonitor` at a fixed interval, and a notification is emitted only
+    when the value crosses the `high` or `low` threshold. Its ``userData`` is
+    either ``high`` or ``low``.
+
+    After a crossing, the threshold is only re-armed once the value moved back
+    by more than `hysteresis`, so a value hovering around a threshold doesn't
+    cause a flood of notifications. Attributes nobody listens to are not
+    evaluated at all.
+
+    Example:
+
+    >>> class C(object):
+    ...     load = TypedProperty(java.lang.Double, fget=...)
+    ...     loadAlarm = Threshold('load', high=0.9, low=0.1, hysteresis=0.05)
+    '''
+    __slots__ = '_attribute', '_high', '_low', '_hysteresis', '_monitor',
+
+    def __init__(self, attribute, high=None, low=None, hysteresis=0.0,
+                 name=None, monitor=None):
+        '''Initialize a new `Threshold`
+
+        :param attribute: name of the watched attribute
+        :type attribute: `str`
+        :param high: high threshold, if any
+        :type high: `float`
+        :param low: low threshold, if any
+        :type low: `float`
+        :param hysteresis: distance the value must move back to re-arm a
+                           threshold
+        :type hysteresis: `float`
+        :param name: notification type name, by default
+                     ``<attribute>.threshold``
+        :type name: `str`
+        :param monitor: monitor evaluating the threshold, by default
+                        `threshold_monitor`
+        :type monitor: `ThresholdMonitor`
+        '''
+        if high is None and low is None:
+            raise ValueError('No threshold given')
+        if high is not None and low is not None and low >= high:
+            raise ValueError('Low threshold should be below high threshold')
+        if hysteresis < 0:
+            raise ValueError('hysteresis should not be negative')
+
+        NotificationTrigger.__init__(self, name or '%s.threshold' % attribute)
+
+        self._attribute = attribute
+        self._high = high
+        self._low = low
+        self._hysteresis = hysteresis
+        self._monitor = monitor
+
+    attribute = property(operator.attrgetter('_attribute'),
+                         doc='Name of the watched attribute')
+    high = property(operator.attrgetter('_high'), doc='High threshold')
+    low = property(operator.attrgetter('_low'), doc='Low threshold')
+    hysteresis = property(operator.attrgetter('_hysteresis'),
+                          doc='Distance required to re-arm a threshold')
+
+    def bind(self, adapter):
+        '''Start evaluating the threshold on the bean of `adapter`
+
+        :param adapter: adapter used to read the attribute and send
+                        notifications
+        :type adapter: `MBeanAdapter`
+
+        :return: bound threshold
+        :rtype: `BoundThreshold`
+        '''
+        bound = BoundThreshold(self, adapter)
+        (self._monitor or threshold_monitor).add(bound)
+        return bound
+
+
+class BoundThreshold(BoundNotificationTrigger):
+    '''A `Threshold` bound to a registered `MBeanAdapter`
+
+    The crossing state is only touched by the evaluating monitor.
+    '''
+    __slots__ = '_getter', '_bean', '_state', '_monitor',
+
+    NORMAL, HIGH, LOW = 'normal', 'high', 'low'
+
+    def __init__(self, trigger, adapter):
+        BoundNotificationTrigger.__init__(self, trigger, adapter)
+
+        try:
+            self._getter = adapter.metadata.getters[trigger.attribute][0]
+        except KeyError:
+            raise ValueError('No readable attribute %s for threshold %s' % (
+                                 trigger.attribute, trigger.name))
+
+        #pylint: disable-msg=W0212
+        self._bean = adapter._bean
+        self._state = self.NORMAL
+        self._monitor = trigger._monitor or threshold_monitor
+
+    def unbind(self):
+        '''Stop evaluating the threshold'''
+        self._monitor.remove(self)
+
+    def evaluate(self):
+        '''Read the attribute, and emit a notification if it crossed a
+        threshold
+
+        :return: whether the attribute was evaluated
+        :rtype: `bool`
+        '''
+        #pylint: disable-msg=W0212
+        if self._name not in self._adapter._interested:
+            return False
+
+        value = float(self._getter(self._bean))
+        trigger = self._trigger
+        high, low = trigger.high, trigger.low
+        state = self._state
+
+        if state == self.HIGH:
+            if value < high - trigger.hysteresis:
+                state = self.NORMAL
+        elif state == self.LOW:
+            if value > low + trigger.hysteresis:
+                state = self.NORMAL
+
+        if state == self.NORMAL:
+            if high is not None and value >= high:
+                state = self.HIGH
+                self._send('%s crossed the high threshold %s: %s' % (
+                               trigger.attribute, high, value), self.HIGH)
+            elif low is not None and value <= low:
+                state = self.LOW
+                self._send('%s crossed the low threshold %s: %s' % (
+                               trigger.attribute, low, value), self.LOW)
+
+        self._state = state
+        return True
+
+    state = property(operator.attrgetter('_state'),
+                     doc='Current state, `NORMAL`, `HIGH` or `LOW`')
+
+def test_threshold():
+    '''Test `Threshold` crossings and hysteresis'''
+    sent = []
+    class Metadata(object): #pylint: disable-msg=C0111
+        getters = {'load': (lambda bean: bean.load, identity)}
+
+    class Bean(object): #pylint: disable-msg=C0111
+        load = 0.5
+
+    class FakeAdapter(object): #pylint: disable-msg=C0111
+        source = 'C'
+        metadata = Metadata()
+        _bean = Bean()
+        _interested = frozenset()
+        _nextId = lambda self: len(sent) + 1
+        sendNotification = sent.append
+
+    class Monitor(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self.thresholds = []
+            self.add = self.thresholds.append
+            self.remove = self.thresholds.remove
+
+    monitor = Monitor()
+    adapter = FakeAdapter()
+    threshold = Threshold('load', high=0.9, low=0.1, hysteresis=0.1,
+                          monitor=monitor)
+    assert threshold.name == 'load.threshold'
+
+    bound = threshold.bind(adapter)
+    assert monitor.thresholds == [bound]
+    assert not bound.evaluate()
+
+    #pylint: disable-msg=W0212
+    adapter._interested = frozenset(('load.threshold', ))
+    for load in (0.5, 0.95, 1.0, 0.85, 0.95, 0.7, 0.9, 0.05, 0.0):
+        adapter._bean.load = load
+        assert bound.evaluate()
+
+    assert [n.userData for n in sent] == ['high', 'high', 'low']
+    assert bound.state == BoundThreshold.LOW
+
+    bound.unbind()
+    assert not monitor.thresholds
+
+    # A threshold on an unknown attribute doesn't leave the others bound
+    class C(object): #pylint: disable-msg=C0111
+        load = TypedProperty(java.lang.Double, fget=lambda _: 0.5)
+        loadAlarm = Threshold('load', high=0.9, monitor=monitor)
+        missingAlarm = Threshold('missing', high=0.9, monitor=monitor)
+
+    c = C()
+    try:
+        MBeanAdapter(c)._bindTriggers()
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+    assert not monitor.thresholds
+    assert 'loadAlarm' not in c.__dict__
+
+    # Nor does registering under an invalid name
+    class D(object): #pylint: disable-msg=C0111
+        load = TypedProperty(java.lang.Double, fget=lambda _: 0.5)
+        loadAlarm = Threshold('load', high=0.9, monitor=monitor)
+
+    d = D()
+    try:
+        MBeanAdapter(d).register('invalid')
+    except java.lang.Exception:
+        pass
+    else:
+        assert False, 'Exception not raised'
+    assert not monitor.thresholds
+    assert 'loadAlarm' not in d.__dict__
+
+    for kwargs in ({}, {'high': 1, 'low': 2}, {'high': 1, 'hysteresis': -1}):
+        try:
+            Threshold('load', **kwargs)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError not raised'
+
+
+class StripedLong(object):
+    '''A sum of longs, striped over a number of cells to avoid contention
+
+    This is a minimal replacement for ``java.util.concurrent.atomic.LongAdder``
+    on JVMs which don't provide it (before Java 8). Every thread updates the
+    cell selected by its thread ID.
+    '''
+    __slots__ = '_cells', '_mask',
+
+    def __init__(self):
+        # Use a power of two of at least twice the number of processors
+        stripes = 1
+        processors = java.lang.Runtime.getRuntime().availableProcessors()
+        while stripes < 2 * processors:
+            stripes *= 2
+
+        self._cells = AtomicLongArray(stripes)
+        self._mask = stripes - 1
+
+    def add(self, value):
+        '''Add `value` to the sum'''
+        self._cells.addAndGet(
+            java.lang.Thread.currentThread().getId() & self._mask, value)
+
+    def increment(self):
+        '''Add one to the sum'''
+        self.add(1)
+
+    def sum(self):
+        '''Calculate the current sum'''
+        cells = self._cells
+        return sum(cells.get(i) for i in xrange(cells.length()))
+
+    def reset(self):
+        '''Reset the sum to zero'''
+        cells = self._cells
+        for i in xrange(cells.length()):
+            cells.set(i, 0)
+
+def test_striped_long():
+    '''Test `StripedLong`'''
+    value = StripedLong()
+    value.add(5)
+    value.increment()
+    assert value.sum() == 6
+    value.reset()
+    assert value.sum() == 0
+
+
+# Contention-free counter implementation
+adder = LongAdder or StripedLong
+
+
+class Metric(object):
+    '''Base class of metric descriptors
+
+    Metrics are declared on the bean class. Accessing a metric on a bean
+    returns its value object, which is created on first access and stored in
+    the instance dictionary, so any later access is a plain attribute lookup.
+    All values are exposed as read-only attributes by `MBeanAdapter`.
+
+    Subclasses set `create` to a callable, taking no arguments, which creates
+    a new value object, and `ATTRIBUTES` to the attributes exposing it.
+    '''
+
+    def __init__(self, doc=''):
+        '''Initialize a new metric
+
+        :param doc: metric description
+        :type doc: `str`
+        '''
+        if not callable(getattr(self, 'create', None)):
+            raise TypeError('%s doesn\'t define create' % \
+                            classname(type(self)))
+
+        self._name = None
+        self.__doc__ = doc
+
+    def __get__(self, obj, type_=None):
+        if obj is None:
+            return self
+
+        return obj.__dict__.setdefault(self._attrname(type_ or type(obj)),
+                                       self.create())
+
+    def _attrname(self, cls):
+        '''Look up the name of the metric on its class'''
+        if self._name is None:
+            for klass in inspect.getmro(cls):
+                for name, value in vars(klass).iteritems():
+                    if value is self:
+                        self._name = name
+                        return name
+
+            raise AttributeError('Metric not found on %s' % classname(cls))
+
+        return self._name
+
+    def mbean_attributes(self, name):
+        '''List the attributes exposing the value of the metric
+
+        :param name: name of the metric
+        :type name: `str`
+
+        :return: ``(name, type, description, getter)`` tuples
+        :rtype: ``iterable<tuple>``
+        '''
+        self._name = name
+        doc = format_docstring(self.__doc__ or '') or name
+
+        return tuple(('%s%s' % (name, suffix), type_,
+                      '%s (%s)' % (doc, description) if description else doc,
+                      lambda bean, attr=attr: getattr(getattr(bean, name),
+                                                      attr))
+                     for suffix, attr, type_, description in self.ATTRIBUTES)
+
+    def mbean_changes(self, name):
+        '''List the change counts of the attributes exposing the metric
+
+        Only values counting their updates in a `changes` attribute are
+        tracked: the values of most metrics change over time.
+
+        :param name: name of the metric
+        :type name: `str`
+
+        :return: ``(name, changes)`` pairs, `changes` taking the bean as its
+                 single argument
+        :rtype: ``iterable<tuple>``
+        '''
+        if not self.TRACKED:
+            return ()
+
+        changes = lambda bean: getattr(bean, name).changes
+        return tuple(('%s%s' % (name, suffix), changes)
+                     for suffix, _, _, _ in self.ATTRIBUTES)
+
+    # (name suffix, value attribute, type, description) of all attributes
+    ATTRIBUTES = ()
+    # Whether the value objects count their updates
+    TRACKED = False
+
+
+class CounterValue(object):
+    '''Value of a `Counter`'''
+    __slots__ = '_value', '_changes',
+
+    def __init__(self):
+        self._value = adder()
+        self._changes = adder()
+
+    def inc(self, value=1):
+        '''Increment the counter'''
+        self._value.add(value)
+        self._changes.increment()
+
+    def dec(self, value=1):
+        '''Decrement the counter'''
+        self._value.add(-value)
+        self._changes.increment()
+
+    def reset(self):
+        '''Reset the counter to zero'''
+        self._value.reset()
+        self._changes.increment()
+
+    value = property(lambda s: s._value.sum(), doc='Current value')
+    changes = property(lambda s: s._changes.sum(), doc='Number of updates')
+
+
+class Counter(Metric):
+    '''A counter, which can be incremented and decremented
+
+    Counters are striped: concurrent updates from many threads don't contend
+    on the value, nor on its update count.
+
+    Example:
+
+    >>> class C(object):
+    ...     requests = Counter('Number of requests')
+    ...
+    ...     def handle(self):
+    ...         self.requests.inc()
+    '''
+    ATTRIBUTES = (('', 'value', java.lang.Long, None), )
+    TRACKED = True
+
+    create = CounterValue
+
+
+class GaugeValue(object):
+    '''Value of a `Gauge`'''
+    __slots__ = '_value', '_changes',
+
+    def __init__(self, value):
+        self._value = value
+        self._changes = adder()
+
+    def set(self, value):
+        '''Set the current value'''
+        self._value = value
+        self._changes.increment()
+
+    value = property(operator.attrgetter('_value'), set, doc='Current value')
+    changes = property(lambda s: s._changes.sum(), doc='Number of updates')
+
+
+class Gauge(Metric):
+    '''A gauge, holding the last value set on it
+
+    Gauges which were never set hold their `initial` value, so reading them
+    through JMX never fails.
+    '''
+
+    def __init__(self, type_=java.lang.Long, doc='', initial=0):
+        '''Initialize a new gauge
+
+        :param type\\_: type of the gauge value
+        :type type\\_: `type`
+        :param doc: gauge description
+        :type doc: `str`
+        :param initial: value of the gauge until it's set, coercible into
+                        `type_`
+        :type initial: `object`
+        '''
+        Metric.__init__(self, doc)
+        self._type = type_
+        self._initial = initial
+
+    def create(self):
+        '''Create a new gauge value object'''
+        return GaugeValue(self._initial)
+
+    TRACKED = True
+
+    ATTRIBUTES = property(lambda s: (('', 'value', s._type, None), ))
+
+
+class EWMA(object):
+    '''An exponentially-weighted moving average rate, updated every
+    `TICK_INTERVAL` seconds
+
+    This is the moving average used by UNIX load averages.
+    '''
+    __slots__ = '_alpha', '_rate',
+
+    TICK_INTERVAL = 5.0
+
+    def __init__(self, minutes):
+        '''Initialize a new `EWMA`
+
+        :param minutes: number of minutes to average over
+        :type minutes: `int`
+        '''
+        self._alpha = 1 - math.exp(-self.TICK_INTERVAL / 60.0 / minutes)
+        self._rate = None
+
+    def tick(self, count):
+        '''Update the rate with the number of events of the last interval'''
+        rate = count / self.TICK_INTERVAL
+        if self._rate is None:
+            self._rate = rate
+        else:
+            self._rate += self._alpha * (rate - self._rate)
+
+    rate = property(lambda s: s._rate or 0.0, doc='Rate, per second')
+
+def test_ewma():
+    '''Test `EWMA`'''
+    ewma = EWMA(1)
+    ewma.tick(10)
+    assert ewma.rate == 2.0
+    ewma.tick(0)
+    assert 0 < ewma.rate < 2.0
+
+
+class MeterValue(object):
+    '''Value of a `Meter`
+
+    Rates are updated lazily, whenever the meter is marked or read.
+    '''
+    __slots__ = '_count', '_start', '_lastTick', '_lastCount', '_rates', \
+                '_lock',
+
+    # Ticks to catch up on at most, later ones wouldn't change the rates
+    MAX_TICKS = 1000
+
+    def __init__(self):
+        self._count = adder()
+        self._start = self._lastTick = time.time()
+        self._lastCount = 0
+        self._rates = EWMA(1), EWMA(5), EWMA(15)
+        self._lock = threading.Lock()
+
+    def mark(self, count=1):
+        '''Mark the occurrence of `count` events'''
+        self._count.add(count)
+
+        if time.time() - self._lastTick >= EWMA.TICK_INTERVAL:
+            self._tick()
+
+    def _tick(self):
+        '''Update all rates, if an interval passed since the last update'''
+        # Only a single thread needs to do this
+        if not self._lock.acquire(False):
+            return
+
+        try:
+            ticks = int((time.time() - self._lastTick) // EWMA.TICK_INTERVAL)
+            if ticks <= 0:
+                return
+
+            self._lastTick += ticks * EWMA.TICK_INTERVAL
+
+            count = self._count.sum()
+            delta, self._lastCount = count - self._lastCount, count
+
+            for rate in self._rates:
+                rate.tick(delta)
+                for _ in xrange(min(ticks, self.MAX_TICKS) - 1):
+                    rate.tick(0)
+        finally:
+            self._lock.release()
+
+    def _rate(self, index):
+        '''Retrieve an up-to-date moving average rate'''
+        self._tick()
+        return self._rates[index].rate
+
+    count = property(lambda s: s._count.sum(), doc='Number of events')
+    meanRate = property(lambda s: s.count / max(time.time() - s._start, 1e-3),
+                        doc='Mean rate since creation, per second')
+    oneMinuteRate = property(lambda s: s._rate(0),
+                             doc='One-minute moving average rate, per second')
+    fiveMinuteRate = property(lambda s: s._rate(1),
+                              doc='Five-minute moving average rate, per ' \
+                                  'second')
+    fifteenMinuteRate = property(lambda s: s._rate(2),
+                                 doc='Fifteen-minute moving average rate, ' \
+                                     'per second')
+
+
+# Attributes of all rate-like metrics
+RATE_ATTRIBUTES = (
+    ('Count', 'count', java.lang.Long, 'count'),
+    ('MeanRate', 'meanRate', java.lang.Double, 'mean rate per second'),
+    ('OneMinuteRate', 'oneMinuteRate', java.lang.Double,
+     'one-minute rate per second'),
+    ('FiveMinuteRate', 'fiveMinuteRate', java.lang.Double,
+     'five-minute rate per second'),
+    ('FifteenMinuteRate', 'fifteenMinuteRate', java.lang.Double,
+     'fifteen-minute rate per second'),
+)
+
+
+class Meter(Metric):
+    '''A meter, measuring the rate of events
+
+    Meters expose their count, mean rate, and one-, five- and fifteen-minute
+    moving average rates.
+    '''
+    ATTRIBUTES = RATE_ATTRIBUTES
+
+    create = MeterValue
+
+
+class Snapshot(object):
+    '''Statistics of the values in a histogram reservoir at some moment
+
+    :see: `HistogramValue.snapshot`
+    '''
+    __slots__ = '_values', '_scale', 'timestamp', 'count', 'min', 'max', \
+                'mean',
+
+    def __init__(self, values, count, min_, max_, scale=1):
+        '''Initialize a new snapshot
+
+        :param values: sorted reservoir values
+        :type values: `list`
+        :param count: number of recorded values
+        :type count: `long`
+        :param min\\_: smallest recorded value
+        :type min\\_: `long`
+        :param max\\_: largest recorded value
+        :type max\\_: `long`
+        :param scale: factor applied to all exported values
+        :type scale: `float`
+        '''
+        self._values = values
+        self._scale = scale
+        self.timestamp = time.time()
+        self.count = count
+        self.min = min_ * scale if count else 0.0
+        self.max = max_ * scale if count else 0.0
+        self.mean = \
+            float(sum(values)) / len(values) * scale if values else 0.0
+
+    def percentile(self, quantile):
+        '''Calculate a percentile, interpolating between reservoir values
+
+        :param quantile: quantile to calculate, between 0 and 1
+        :type quantile: `float`
+
+        :return: value at `quantile`
+        :rtype: `float`
+        '''
+        values = self._values
+        if not values:
+            return 0.0
+
+        position = quantile * (len(values) - 1)
+        index = int(position)
+        if index + 1 >= len(values):
+            return values[-1] * self._scale
+
+        lower, upper = values[index], values[index + 1]
+        return (lower + (position - index) * (upper - lower)) * self._scale
+
+def test_snapshot():
+    '''Test `Snapshot`'''
+    snapshot = Snapshot(range(1, 101), 100, 1, 100)
+    assert snapshot.min == 1
+    assert snapshot.max == 100
+    assert snapshot.mean == 50.5
+    assert snapshot.percentile(0) == 1
+    assert snapshot.percentile(0.5) == 50.5
+    assert snapshot.percentile(1) == 100
+
+    snapshot = Snapshot([], 0, 0, 0)
+    assert snapshot.percentile(0.99) == 0.0
+
+
+class HistogramValue(object):
+    '''Value of a `Histogram`
+
+    Values are sampled into a fixed-size reservoir (Vitter's algorithm R), so
+    memory use is bounded and recording a value never blocks. Statistics are
+    calculated on a snapshot of the reservoir, which is reused by all reads
+    within `SNAPSHOT_INTERVAL` seconds: reading all percentiles of a
+    histogram sorts its reservoir only once.
+    '''
+    __slots__ = '_reservoir', '_count', '_min', '_max', '_scale', \
+                '_snapshot', '_lock',
+
+    # Number of values kept in the reservoir
+    RESERVOIR_SIZE = 1028
+    # Time, in seconds, during which a snapshot is reused
+    SNAPSHOT_INTERVAL = 1.0
+
+    def __init__(self, scale=1):
+        '''Initialize a new histogram value
+
+        :param scale: factor applied to all exported values
+        :type scale: `float`
+        '''
+        self._reservoir = AtomicLongArray(self.RESERVOIR_SIZE)
+        self._count = AtomicLong()
+        self._min = AtomicLong(java.lang.Long.MAX_VALUE)
+        self._max = AtomicLong(java.lang.Long.MIN_VALUE)
+        self._scale = scale
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def update(self, value):
+        '''Record a value
+
+        :param value: value to record
+        :type value: `long`
+        '''
+        value = long(value)
+
+        count = self._count.incrementAndGet()
+        if count <= self.RESERVOIR_SIZE:
+            self._reservoir.set(count - 1, value)
+        else:
+            index = long(random.random() * count)
+            if index < self.RESERVOIR_SIZE:
+                self._reservoir.set(index, value)
+
+        minimum = self._min
+        current = minimum.get()
+        while value < current and not minimum.compareAndSet(current, value):
+            current = minimum.get()
+
+        maximum = self._max
+        current = maximum.get()
+        while value > current and not maximum.compareAndSet(current, value):
+            current = maximum.get()
+
+    def snapshot(self):
+        '''Retrieve a recent snapshot of the histogram
+
+        :return: snapshot, at most `SNAPSHOT_INTERVAL` seconds old
+        :rtype: `Snapshot`
+        '''
+        snapshot = self._snapshot
+        if snapshot is not None and \
+            time.time() - snapshot.timestamp < self.SNAPSHOT_INTERVAL:
+            return snapshot
+
+        self._lock.acquire()
+        try:
+            # Another thread might have taken a snapshot in the meantime
+            snapshot = self._snapshot
+            if snapshot is None or \
+                time.time() - snapshot.timestamp >= self.SNAPSHOT_INTERVAL:
+                count = self._count.get()
+                reservoir = self._reservoir
+                values = sorted(reservoir.get(i) for i in
+                                xrange(min(count, self.RESERVOIR_SIZE)))
+                snapshot = Snapshot(values, count, self._min.get(),
+                                    self._max.get(), self._scale)
+                self._snapshot = snapshot
+
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        '''Discard all recorded values'''
+        self._lock.acquire()
+        try:
+            self._count.set(0)
+            self._min.set(java.lang.Long.MAX_VALUE)
+            self._max.set(java.lang.Long.MIN_VALUE)
+            self._snapshot = None
+        finally:
+            self._lock.release()
+
+    count = property(lambda s: s._count.get(), doc='Number of values')
+    min = property(lambda s: s.snapshot().min, doc='Smallest value')
+    max = property(lambda s: s.snapshot().max, doc='Largest value')
+    mean = property(lambda s: s.snapshot().mean, doc='Mean value')
+    p50 = property(lambda s: s.snapshot().percentile(0.5), doc='Median')
+    p75 = property(lambda s: s.snapshot().percentile(0.75),
+                   doc='75th percentile')
+    p95 = property(lambda s: s.snapshot().percentile(0.95),
+                   doc='95th percentile')
+    p99 = property(lambda s: s.snapshot().percentile(0.99),
+                   doc='99th percentile')
+
+def test_histogram_value():
+    '''Test `HistogramValue`'''
+    histogram = HistogramValue()
+    for i in xrange(1, 101):
+        histogram.update(i)
+
+    assert histogram.count == 100
+    assert histogram.min == 1
+    assert histogram.max == 100
+    assert histogram.p50 == 50.5
+
+    # Snapshots are reused
+    histogram.update(1000)
+    assert histogram.max == 100
+    assert histogram.snapshot() is histogram.snapshot()
+
+    # The reservoir is bounded, but minimum and maximum are exact
+    for i in xrange(10 * HistogramValue.RESERVOIR_SIZE):
+        histogram.update(i % 500)
+    histogram.reset()
+    histogram.update(-1)
+    assert histogram.count == 1
+    assert histogram.min == histogram.max == -1
+
+
+# Attributes of all histogram-like metrics
+HISTOGRAM_ATTRIBUTES = (
+    ('Min', 'min', java.lang.Double, 'minimum'),
+    ('Max', 'max', java.lang.Double, 'maximum'),
+    ('Mean', 'mean', java.lang.Double, 'mean'),
+    ('P50', 'p50', java.lang.Double, 'median'),
+    ('P75', 'p75', java.lang.Double, '75th percentile'),
+    ('P95', 'p95', java.lang.Double, '95th percentile'),
+    ('P99', 'p99', java.lang.Double, '99th percentile'),
+)
+
+
+class Histogram(Metric):
+    '''A histogram, measuring the distribution of values
+
+    Histograms expose their count, minimum, maximum, mean, and median, 75th,
+    95th and 99th percentiles. Memory use is bounded, see `HistogramValue`.
+
+    Example:
+
+    >>> class C(object):
+    ...     sizes = Histogram('Request sizes')
+    ...
+    ...     def handle(self, request):
+    ...         self.sizes.update(len(request))
+    '''
+    ATTRIBUTES = (('Count', 'count', java.lang.Long, 'count'), ) + \
+                 HISTOGRAM_ATTRIBUTES
+
+    create = HistogramValue
+
+
+class TimerContext(object):
+    '''Context manager timing a block of code, see `TimerValue.time`'''
+    __slots__ = '_timer', '_start',
+
+    def __init__(self, timer):
+        self._timer = timer
+        self._start = None
+
+    def __enter__(self):
+        self._start = java.lang.System.nanoTime()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._timer.update((java.lang.System.nanoTime() - self._start) / 1e9)
+
+
+class TimerValue(MeterValue):
+    '''Value of a `Timer`
+
+    Durations are recorded in a `HistogramValue`, in nanoseconds, and
+    exported in milliseconds.
+    '''
+    __slots__ = '_total', '_histogram',
+
+    def __init__(self):
+        MeterValue.__init__(self)
+        self._total = adder()
+        self._histogram = HistogramValue(scale=1e-6)
+
+    def update(self, seconds):
+        '''Record a duration
+
+        :param seconds: duration, in seconds
+        :type seconds: `float`
+        '''
+        nanos = long(seconds * 1e9)
+        self._total.add(nanos)
+        self._histogram.update(nanos)
+        self.mark()
+
+    def time(self):
+        '''Create a context manager timing the block it manages
+
+        :return: timer context
+        :rtype: `TimerContext`
+        '''
+        return TimerContext(self)
+
+    totalTime = property(lambda s: s._total.sum() / 1e6,
+                         doc='Total duration, in milliseconds')
+    meanTime = property(lambda s: s.totalTime / max(s.count, 1),
+                        doc='Mean duration, in milliseconds')
+    histogram = property(operator.attrgetter('_histogram'),
+                         doc='Distribution of durations, in milliseconds')
+    minTime = property(lambda s: s._histogram.min,
+                       doc='Minimum duration, in milliseconds')
+    maxTime = property(lambda s: s._histogram.max,
+                       doc='Maximum duration, in milliseconds')
+    p50Time = property(lambda s: s._histogram.p50,
+                       doc='Median duration, in milliseconds')
+    p75Time = property(lambda s: s._histogram.p75,
+                       doc='75th percentile duration, in milliseconds')
+    p95Time = property(lambda s: s._histogram.p95,
+                       doc='95th percentile duration, in milliseconds')
+    p99Time = property(lambda s: s._histogram.p99,
+                       doc='99th percentile duration, in milliseconds')
+
+
+class Timer(Metric):
+    '''A timer, measuring the rate and duration of events
+
+    Durations can be recorded explicitly, by timing a block of code, or by
+    decorating a method:
+
+    >>> class C(object):
+    ...     latency = Timer('Request latency')
+    ...
+    ...     def handle(self):
+    ...         with self.latency.time():
+    ...             pass
+    ...
+    ...     @latency.timed
+    ...     def process(self):
+    ...         pass
+    '''
+    ATTRIBUTES = RATE_ATTRIBUTES + (
+        ('MeanTime', 'meanTime', java.lang.Double, 'mean duration in ms'),
+        ('TotalTime', 'totalTime', java.lang.Double, 'total duration in ms'),
+        ('MinTime', 'minTime', java.lang.Double, 'minimum duration in ms'),
+        ('MaxTime', 'maxTime', java.lang.Double, 'maximum duration in ms'),
+        ('P50Time', 'p50Time', java.lang.Double, 'median duration in ms'),
+        ('P75Time', 'p75Time', java.lang.Double,
+         '75th percentile duration in ms'),
+        ('P95Time', 'p95Time', java.lang.Double,
+         '95th percentile duration in ms'),
+        ('P99Time', 'p99Time', java.lang.Double,
+         '99th percentile duration in ms'),
+    )
+
+    create = TimerValue
+
+    def timed(self, fun):
+        '''Decorator recording the duration of all calls of a method
+
+        :param fun: method to decorate
+        :type fun: `callable`
+
+        :return: decorated method
+        :rtype: `callable`
+        '''
+        @functools.wraps(fun)
+        def _wrapped(bean, *args_, **kwargs): #pylint: disable-msg=C0111
+            timer = self.__get__(bean, type(bean))
+            start = java.lang.System.nanoTime()
+            try:
+                return fun(bean, *args_, **kwargs)
+            finally:
+                timer.update((java.lang.System.nanoTime() - start) / 1e9)
+
+        # Keep the signature available for introspection
+        _wrapped.__wrapped__ = fun
+
+        return _wrapped
+
+def test_metrics():
+    '''Test `Counter`, `Gauge`, `Meter`, `Histogram` and `Timer`'''
+    class C(object): #pylint: disable-msg=C0111
+        requests = Counter('Requests')
+        size = Gauge(java.lang.Integer)
+        ratio = Gauge(java.lang.Double)
+        events = Meter()
+        sizes = Histogram()
+        latency = Timer()
+
+        @latency.timed
+        def handle(self): #pylint: disable-msg=C0111
+            pass
+
+    c = C()
+    assert c.requests is c.requests
+    assert C.requests is C.__dict__['requests']
+
+    c.requests.inc()
+    c.requests.inc(2)
+    c.requests.dec()
+    assert c.requests.value == 2
+    assert C().requests.value == 0
+
+    # Gauges which were never set are readable
+    adapter = MBeanAdapter(C())
+    assert adapter.getAttribute('size') == 0
+    assert adapter.getAttribute('ratio') == 0.0
+    assert len(adapter.getAttributes(['size', 'ratio', 'requests'])) == 3
+
+    c.size.set(5)
+    assert c.size.value == 5
+
+    class Invalid(Metric): #pylint: disable-msg=C0111
+        pass
+
+    try:
+        Invalid()
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError not raised'
+
+    c.events.mark()
+    assert c.events.count == 1
+    assert c.events.oneMinuteRate == 0.0
+
+    c.sizes.update(10)
+    c.sizes.update(20)
+    assert c.sizes.count == 2
+    assert c.sizes.p50 == 15
+
+    c.handle()
+    c.latency.update(0.5)
+    assert c.latency.count == 2
+    assert c.latency.totalTime >= 500
+
+    attributes = dict((name, getter) for name, _, _, getter
+                      in C.requests.mbean_attributes('requests'))
+    assert attributes['requests'](c) == 2
+    attributes = dict((name, getter) for name, _, _, getter
+                      in C.latency.mbean_attributes('latency'))
+    assert attributes['latencyCount'](c) == 2
+    assert sorted(attributes) == ['latencyCount', 'latencyFifteenMinuteRate',
+                                  'latencyFiveMinuteRate', 'latencyMaxTime',
+                                  'latencyMeanRate', 'latencyMeanTime',
+                                  'latencyMinTime', 'latencyOneMinuteRate',
+                                  'latencyP50Time', 'latencyP75Time',
+                                  'latencyP95Time', 'latencyP99Time',
+                                  'latencyTotalTime']
+    assert attributes['latencyMaxTime'](c) >= 500
+
+
+def synchronised(fun):
+    '''Decorator to add a lock around a function
+
+    Think ``synchronised`` in Java, on a static method: a single lock is used
+    for all calls. Use `synchronised_method` to lock methods per instance.
+
+    :param fun: function to decorate
+    :type fun: `callable`
+
+    :return: decorated function
+    :rtype: `callable`
+    '''
+    lock = threading.Lock()
+
+    @functools.wraps(fun)
+    def _wrapped(*args_, **kwargs): #pylint: disable-msg=C0111
+        lock.acquire()
+        try:
+            return fun(*args_, **kwargs)
+        finally:
+            lock.release()
+
+    return _wrapped
+
+def test_synchronised():
+    '''Test `synchronised`'''
+    import time
+
+    @synchronised
+    def f(): #pylint: disable-msg=C0111
+        time.sleep(1)
+
+    t1 = threading.Thread(target=f)
+    t2 = threading.Thread(target=f)
+
+    start = time.time()
+    t1.start()
+    t2.start()
+    t1.join()
+    t2.join()
+    end = time.time()
+
+    assert 1.9 < (end - start) < 2.5
+
+
+def synchronised_method(fun):
+    '''Decorator to add a lock around a method
+
+    Think ``synchronised`` in Java: calls on the same instance exclude each
+    other, calls on different instances don't. The lock is retrieved from the
+    ``_lock`` attribute of the instance.
+
+    :param fun: method to decorate
+    :type fun: `callable`
+
+    :return: decorated method
+    :rtype: `callable`
+    '''
+    @functools.wraps(fun)
+    def _wrapped(self, *args_, **kwargs): #pylint: disable-msg=C0111
+        lock = self._lock #pylint: disable-msg=W0212
+        lock.acquire()
+        try:
+            return fun(self, *args_, **kwargs)
+        finally:
+            lock.release()
+
+    return _wrapped
+
+def test_synchronised_method():
+    '''Test `synchronised_method`'''
+    import time
+
+    class C(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self._lock = threading.Lock()
+
+        @synchronised_method
+        def f(self): #pylint: disable-msg=C0111
+            time.sleep(1)
+
+    def run(*instances): #pylint: disable-msg=C0111
+        threads = [threading.Thread(target=i.f) for i in instances]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    c = C()
+    assert 1.9 < run(c, c) < 2.5
+    assert 0.9 < run(C(), C()) < 1.5
+
+
+#pylint: disable-msg=E0601
+list_attributes = lambda obj: itertools.imap(
+                                  lambda name: (name, getattr(obj, name)),
+                                  itertools.ifilter(
+                                      lambda name: not name.startswith('_'),
+                                      dir(obj)))
+#pylint: enable-msg=E0601
+list_attributes.__doc__ = '''
+List all public, non-internal attributes of an object
+
+This function yields all ``(name, attribute)`` pairs for all attributes on the
+given object whose name doesn't start with an underscore.
+
+:param obj: object to inspect
+:type obj: `object`
+
+:return: ``(name, attribute)`` pairs of all public attributes on the object
+:rtype: ``iterable<tuple<str, object>>``
+'''.strip()
+
+def test_list_attributes():
+    '''Test `list_attributes`'''
+    class C(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            pass
+
+        def hello(self): #pylint: disable-msg=C0111
+            pass
+
+        def _bye(self): #pylint: disable-msg=C0111
+            pass
+
+        i = property()
+        _j = property()
+
+    assert set(list_attributes(C)) == set((('hello', C.hello), ('i', C.i)))
+
+
+#TODO Use class logger
+def class_fingerprint(cls):
+    '''Calculate a fingerprint of all public attributes defined on a class
+
+    The fingerprint compares equal to a previously calculated one as long as
+    no public attribute has been added to, removed from or replaced on the
+    class or any of its bases.
+
+    :param cls: class to fingerprint
+    :type cls: `type`
+
+    :return: class fingerprint
+    :rtype: `tuple`
+    '''
+    return tuple((klass, tuple((name, value)
+                               for name, value in vars(klass).iteritems()
+                               if not name.startswith('_')))
+                 for klass in inspect.getmro(cls))
+
+def test_class_fingerprint():
+    '''Test `class_fingerprint` changes when the class changes'''
+    class C(object): #pylint: disable-msg=C0111
+        i = property()
+
+    fingerprint = class_fingerprint(C)
+    assert class_fingerprint(C) == fingerprint
+
+    C._j = property() #pylint: disable-msg=W0212
+    assert class_fingerprint(C) == fingerprint
+
+    C.j = property()
+    assert class_fingerprint(C) != fingerprint
+
+
+def attribute_info(name, type_, doc, readable, writable):
+    '''Create the ``MBeanAttributeInfo`` of an attribute
+
+    Attributes of an open type (`Composite` or `Tabular`) are described by an
+    ``OpenMBeanAttributeInfoSupport``, so clients know their structure.
+
+    :param name: attribute name
+    :type name: `str`
+    :param type\_: attribute value type
+    :type type\_: `type`
+    :param doc: attribute description
+    :type doc: `str`
+    :param readable: whether the attribute is readable
+    :type readable: `bool`
+    :param writable: whether the attribute is writable
+    :type writable: `bool`
+
+    :return: attribute info
+    :rtype: ``MBeanAttributeInfo``
+    '''
+    if isinstance(type_, (Composite, Tabular)):
+        return OpenMBeanAttributeInfoSupport(name, doc or name, type_.opentype,
+                                             readable, writable, False)
+
+    return MBeanAttributeInfo(name, classname(type_), doc, readable, writable,
+                              False)
+
+
+def filter_accepts(filter_, type_):
+    '''Check whether a notification filter might accept a notification type
+
+    Only ``NotificationFilterSupport`` filters can be checked without an
+    actual notification, any other filter might accept every type.
+
+    :param filter\_: notification filter, or `None`
+    :type filter\_: ``NotificationFilter``
+    :param type\_: notification type
+    :type type\_: `str`
+
+    :return: whether notifications of the given type might pass the filter
+    :rtype: `bool`
+    '''
+    if filter_ is None:
+        return True
+
+    if type(filter_) is not NotificationFilterSupport:
+        return True
+
+    # See NotificationFilterSupport.isNotificationEnabled
+    return any(type_.startswith(prefix)
+               for prefix in filter_.getEnabledTypes())
+
+def test_filter_accepts():
+    '''Test `filter_accepts`'''
+    assert filter_accepts(None, 'test')
+
+    filter_ = NotificationFilterSupport()
+    assert not filter_accepts(filter_, 'test')
+    filter_.enableType('te')
+    assert filter_accepts(filter_, 'test')
+    assert not filter_accepts(filter_, 'other')
+
+
+def object_name(name):
+    '''Convert a name into an ``ObjectName``, if it isn't one already
+
+    :param name: name to convert
+    :type name: `str` or ``ObjectName``
+
+    :return: object name
+    :rtype: ``ObjectName``
+    '''
+    return name if isinstance(name, ObjectName) else ObjectName(name)
+
+
+_mbean_server = None
+
+def mbean_server():
+    '''Retrieve the platform ``MBeanServer``
+
+    ``ManagementFactory.getPlatformMBeanServer`` is synchronised, the server
+    is looked up once and cached to avoid contention.
+
+    :return: the platform MBean server
+    :rtype: ``javax.management.MBeanServer``
+    '''
+    global _mbean_server #pylint: disable-msg=W0603
+
+    server = _mbean_server
+    if server is None:
+        server = _mbean_server = ManagementFactory.getPlatformMBeanServer()
+
+    return server
+
+
+class ClassMetadata(object):
+    '''Introspection results of a bean class
+
+    All information calculated here only depends on the bean class, so one
+    instance is shared by all adapters exposing beans of that class. Instances
+    should be retrieved through `metadata_cache`.
+
+    Everything required to dispatch calls is calculated up front. The
+    ``MBeanInfo``, which requires formatting all docstrings and inspecting all
+    method signatures, is only calculated when first requested.
+    '''
+    __slots__ = '_cls', '_fingerprint', '_property_type', '_return_type', \
+                '_triggers', '_extra', '_getters', '_types', '_sampled', \
+                '_changes', '_invokers', '_overloads', '_notificationinfo', \
+                '_skeleton', '_beaninfo', '_lock', '_scheduled',
+
+    def __init__(self, cls, fingerprint, property_type, return_type):
+        '''Introspect a bean class
+
+        :param cls: bean class
+        :type cls: `type`
+        :param fingerprint: fingerprint of `cls` at introspection time
+        :type fingerprint: `tuple`
+        :param property_type: default property value type
+        :type property_type: `type`
+        :param return_type: default method return type
+        :type return_type: `type`
+        '''
+        self._cls = cls
+        self._fingerprint = fingerprint
+        self._property_type = property_type
+        self._return_type = return_type
+
+        logging.getLogger('mbeanadapter').debug('Inspecting %s',
+                                                classname(cls))
+
+        self._triggers = tuple(
+            (name, attr) for name, attr in list_attributes(cls)
+            if isinstance(attr, NotificationTrigger))
+
+        # Read-only attributes contributed by class members
+        self._extra = tuple(itertools.chain(*[
+                                attr.mbean_attributes(name)
+                                for name, attr in list_attributes(cls)
+                                if hasattr(attr, 'mbean_attributes')]))
+
+        # Attribute dispatch table: one lookup gives the getter function and
+        # the type to coerce its result into
+        self._getters = dict((name, (getter, type_))
+                             for name, type_, _, getter in self._extra)
+        self._getters.update(self._getter(name, attr)
+                             for name, attr in self._properties()
+                             if callable(attr.fget))
+
+        # Value types of all readable attributes, used to coerce snapshots
+        self._types = dict((name, type_)
+                           for name, type_, _, _ in self._extra)
+        self._types.update((name, self._attributeType(attr))
+                           for name, attr in self._properties()
+                           if callable(attr.fget))
+
+        # Names of all attributes recorded by a Sampler
+        self._sampled = tuple(name for name, attr in self._properties()
+                              if getattr(attr, 'sampled', False)
+                              and callable(attr.fget))
+
+        # Change counts of the attributes which only change through updates
+        # counted by their class member
+        self._changes = dict(itertools.chain(*[
+                                 attr.mbean_changes(name)
+                                 for name, attr in list_attributes(cls)
+                                 if hasattr(attr, 'mbean_changes')]))
+
+        # Operation dispatch table: one lookup by name and signature gives the
+        # function, the argument coercers and the return type
+        self._invokers = {}
+        # Mapping of operation names to all their invokers
+        self._overloads = {}
+        for name, attr in self._methods():
+            name = getattr(attr, '__operation__', name)
+            types_ = self._argumentTypes(attr)
+            key = name, tuple(binary_classname(type_) for type_ in types_)
+            if key in self._invokers:
+                raise TypeError('Duplicate signature of operation %s' % name)
+
+            fun = attr.im_func
+            limits = getattr(attr, '__bulkhead__', None)
+            if limits is not None:
+                fun = functools.partial(limits.call, fun)
+            # Cache hits don't count against the bulkhead
+            cache = getattr(attr, '__cache__', None)
+            if cache is not None:
+                fun = functools.partial(cache.call, fun)
+
+            invoker = fun, types_, getattr(attr, '__returns__',
+                                           self._return_type)
+            executor = getattr(attr, '__async__', None)
+            if executor is not None:
+                invoker = self._asyncInvoker(name, executor, *invoker)
+
+            self._invokers[key] = invoker
+            self._overloads.setdefault(name, []).append(invoker)
+
+        notificationinfo = MBeanNotificationInfo(
+                               tuple(attr.name for _, attr in self._triggers),
+                               classname(Notification),
+                               'Notifications emitted through JythonMX')
+        self._notificationinfo = (notificationinfo, )
+
+        # Minimal MBeanInfo, enough for the MBeanServer to register a bean
+        self._skeleton = MBeanInfo(classname(cls), '', None, None, None,
+                                   self._notificationinfo)
+
+        self._beaninfo = None
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def prepare(self):
+        '''Calculate the ``MBeanInfo`` on a background thread, if required'''
+        if self._beaninfo is not None or self._scheduled:
+            return
+
+        self._lock.acquire()
+        try:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        finally:
+            self._lock.release()
+
+        def introspect():
+            '''Calculate the ``MBeanInfo``, logging any failure'''
+            try:
+                self._getBeaninfo()
+            except: #pylint: disable-msg=W0702
+                logging.getLogger('mbeanadapter').exception(
+                    'Error inspecting %s', classname(self._cls))
+
+        scheduler().execute(introspect)
+
+    def _getBeaninfo(self):
+        '''Retrieve the ``MBeanInfo``, calculating it if required'''
+        # Short path
+        beaninfo = self._beaninfo
+        if beaninfo is not None:
+            return beaninfo
+
+        self._lock.acquire()
+        try:
+            if self._beaninfo is None:
+                cls = self._cls
+                self._beaninfo = MBeanInfo(classname(cls),
+                                           format_docstring(cls.__doc__ or ''),
+                                           tuple(self._attributes()), None,
+                                           tuple(self._operations()),
+                                           self._notificationinfo)
+
+            return self._beaninfo
+        finally:
+            self._lock.release()
+
+    def _properties(self):
+        '''List all properties found on the bean type'''
+        return filter(lambda (_, a): isinstance(a, property),
+                      list_attributes(self._cls))
+
+    def _attributeType(self, attr):
+        '''Calculate property value type'''
+        return attr.type if isinstance(attr, TypedProperty) \
+                         else self._property_type
+
+    def _getter(self, name, attr):
+        '''Calculate the dispatch table entry of a property'''
+        type_ = self._attributeType(attr)
+        cache = getattr(attr, 'cache', None)
+        if cache is None:
+            return name, (attr.fget, type_)
+
+        fget = attr.fget
+        compute = lambda bean: type_(fget(bean))
+        return name, (lambda bean: cache.get(bean, compute), identity)
+
+    def descriptions(self):
+        '''Calculate the descriptions of all attributes exposed on the MBean,
+        without calculating the ``MBeanInfo``
+
+        :return: mapping of attribute names to their description
+        :rtype: `dict`
+        '''
+        descriptions = dict((name, format_docstring(attr.__doc__ or ''))
+                            for name, attr in self._properties())
+        descriptions.update((name, doc) for name, _, doc, _ in self._extra)
+        return descriptions
+
+    def _attributes(self):
+        '''Calculate and list all attributes exposed on the MBean'''
+        for name, attr in self._properties():
+            yield attribute_info(name, self._attributeType(attr),
+                                 format_docstring(attr.__doc__ or ''),
+                                 callable(attr.fget), callable(attr.fset))
+
+        for name, type_, doc, _ in self._extra:
+            yield attribute_info(name, type_, doc, True, False)
+
+    def _asyncInvoker(self, name, executor, fun, types_, return_type):
+        '''Create the invoker of an asynchronous operation
+
+        The invoker submits the operation to `executor`, and returns the job
+        ID. The completion notification triggers of the operation are added
+        to the triggers of the class.
+        '''
+        completed = NotificationTrigger('%s.completed' % name)
+        failed = NotificationTrigger('%s.failed' % name)
+
+        # Overloads share their triggers
+        if completed.name not in dict(self._triggers):
+            self._triggers += ((completed.name, completed),
+                               (failed.name, failed))
+
+        def submit(bean, *args_):
+            '''Submit the operation, returning the job ID'''
+            def run():
+                '''Run the operation, returning its coerced result'''
+                value = fun(bean, *args_)
+                if return_type is java.lang.Void:
+                    return None
+                return return_type(value)
+
+            # Use the triggers bound to the adapter of the bean, if any
+            dict_ = getattr(bean, '__dict__', {})
+            return executor._submit(name, run, #pylint: disable-msg=W0212
+                                    dict_.get(completed.name, completed),
+                                    dict_.get(failed.name, failed))
+
+        return submit, types_, java.lang.Long
+
+    def _methods(self):
+        '''List all plain methods found on the bean type'''
+        return [(name, attr) for name, attr in list_attributes(self._cls)
+                if isinstance(attr, types.MethodType) and attr.im_self is None]
+
+    def _argumentTypes(self, attr):
+        '''Calculate the argument types of a method'''
+        return tuple(type_[0] if isinstance(type_, tuple) else type_
+                     for type_ in getattr(attr, '__args__', ()))
+
+    def _operations(self):
+        '''Calculate and list all methods exposed on the MBean'''
+        # List all callable attributes found on the bean type
+        for name, attr in filter(lambda (_, a): callable(a),
+                                 list_attributes(self._cls)):
+            # If it's a NotificationTrigger, skip
+            if isinstance(attr, NotificationTrigger):
+                continue
+
+            # Make sure it's a method
+            if not isinstance(attr, types.MethodType):
+                raise TypeError('MBean methods can\'t be staticmethods')
+
+            # Make sure it's not a classmethod
+            if attr.im_self:
+                raise TypeError('MBean methods can\'t have classmethods')
+
+            # Make sure it has no *args, **kwargs or argument defaults
+            spec = inspect.getargspec(getattr(attr, '__wrapped__', attr))
+            if spec[1:] != (None, None, None):
+                raise TypeError('MBean methods can\'t have *args, ' \
+                                '**kwargs or defaults')
+
+            # Make sure an @args decorator is used, if the method takes any
+            # arguments (next to self)
+            names = spec[0]
+            if len(names[1:]) > 0 and not hasattr(attr, '__args__'):
+                raise TypeError('No @args definition on method %s' % name)
+
+            # Calculate the method return type (string), asynchronous
+            # operations return a job ID
+            return_type = classname(java.lang.Long
+                                    if hasattr(attr, '__async__')
+                                    else getattr(attr, '__returns__',
+                                                 self._return_type))
+
+            # Yield method info for the current method
+            # All methods are ACTIONs for now.
+            yield MBeanOperationInfo(getattr(attr, '__operation__',
+                                             attr.__name__),
+                                     format_docstring(attr.__doc__ or ''),
+                                     tuple(self._parameters(attr, names[1:])),
+                                     return_type, MBeanOperationInfo.ACTION)
+
+    def _parameters(self, attr, names):
+        '''List all method parameters taken by the method'''
+        # Check whether this is a zero-argument method
+        if not hasattr(attr, '__args__'):
+            assert len(names) == 0
+            return
+
+        arg_types = attr.__args__
+
+        # Validate number of argument type definitions
+        if len(names) != len(arg_types):
+            raise ValueError('Invalid number of argument definitions')
+
+        # Loop through all arguments and their type definition
+        for name, type_ in zip(names, arg_types):
+            # Figure out type and docstring, if given
+            if isinstance(type_, tuple):
+                type_, doc = type_
+            else:
+                type_, doc = type_, None
+
+            # Yield the parameter info for the current parameter
+            yield MBeanParameterInfo(name, binary_classname(type_), doc)
+
+    fingerprint = property(operator.attrgetter('_fingerprint'),
+                           doc='Fingerprint of the class when introspected')
+    source = property(lambda s: s._cls.__name__,
+                      doc='Source of all notifications emitted by the beans')
+    triggers = property(operator.attrgetter('_triggers'),
+                        doc='``(name, NotificationTrigger)`` pairs defined ' \
+                            'on the class')
+    getters = property(operator.attrgetter('_getters'),
+                       doc='Mapping of readable attribute names to ' \
+                           '``(getter, coercer)`` pairs')
+    types = property(operator.attrgetter('_types'),
+                     doc='Mapping of readable attribute names to their type')
+    sampled = property(operator.attrgetter('_sampled'),
+                       doc='Names of all attributes recorded by a `Sampler`')
+    changes = property(operator.attrgetter('_changes'),
+                       doc='Mapping of tracked attribute names to functions ' \
+                           'returning their change count, given a bean')
+    invokers = property(operator.attrgetter('_invokers'),
+                        doc='Mapping of ``(name, signature)`` pairs to ' \
+                            '``(function, argument types, return type)`` ' \
+                            'invokers')
+    overloads = property(operator.attrgetter('_overloads'),
+                         doc='Mapping of operation names to all their ' \
+                             'invokers')
+    beaninfo = property(_getBeaninfo, doc='``MBeanInfo`` describing the MBean')
+    skeleton = property(operator.attrgetter('_skeleton'),
+                        doc='``MBeanInfo`` only containing the class name ' \
+                            'and notifications')
+    introspected = property(lambda s: s._beaninfo is not None,
+                            doc='Whether the ``MBeanInfo`` was calculated')
+    notificationinfo = property(operator.attrgetter('_notificationinfo'),
+                                doc='``MBeanNotificationInfo`` array ' \
+                                    'describing the notifications emitted ' \
+                                    'by the MBean')
+
+
+class MetadataCache(object):
+    '''A thread-safe cache of `ClassMetadata`, keyed by bean class
+
+    Classes are introspected, and fingerprinted, once: adapters created later
+    share the cached entry without looking at the class again. Code changing
+    a bean class after its first use has to call `invalidate` for the change
+    to show up.
+    '''
+    __slots__ = '_cache', '_lock',
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, cls, property_type, return_type):
+        '''Retrieve the metadata of a bean class, introspecting it if required
+
+        :param cls: bean class
+        :type cls: `type`
+        :param property_type: default property value type
+        :type property_type: `type`
+        :param return_type: default method return type
+        :type return_type: `type`
+
+        :return: metadata of the class
+        :rtype: `ClassMetadata`
+        '''
+        key = cls, property_type, return_type
+
+        # Short path, no locking required
+        metadata = self._cache.get(key)
+        if metadata is not None:
+            return metadata
+
+        self._lock.acquire()
+        try:
+            # Some other thread might have done the work in the meantime
+            metadata = self._cache.get(key)
+            if metadata is None:
+                metadata = ClassMetadata(cls, class_fingerprint(cls),
+                                         property_type, return_type)
+                self._cache[key] = metadata
+
+            return metadata
+        finally:
+            self._lock.release()
+
+    def invalidate(self, cls=None):
+        '''Drop cached metadata
+
+        :param cls: class to drop all metadata of, or `None` to clear the cache
+        :type cls: `type`
+        '''
+        self._lock.acquire()
+        try:
+            if cls is None:
+                self._cache.clear()
+            else:
+                for key in [key for key in self._cache if key[0] is cls]:
+                    del self._cache[key]
+        finally:
+            self._lock.release()
+
+metadata_cache = MetadataCache()
+
+def test_metadata_cache():
+    '''Test `MetadataCache` sharing and invalidation'''
+    class C(object): #pylint: disable-msg=C0111
+        i = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+        test = signal('test')
+
+    cache = MetadataCache()
+    metadata = cache.get(C, java.lang.String, java.lang.Void)
+    assert cache.get(C, java.lang.String, java.lang.Void) is metadata
+    assert not metadata.introspected
+    assert not metadata.skeleton.attributes
+    assert [a.name for a in metadata.beaninfo.attributes] == ['i']
+    assert metadata.introspected
+    assert metadata.getters == {'i': (C.i.fget, java.lang.Integer)}
+    assert metadata.triggers == (('test', C.test), )
+
+    C.j = property(fget=lambda _: 'j')
+    assert cache.get(C, java.lang.String, java.lang.Void) is metadata
+
+    cache.invalidate(C)
+    updated = cache.get(C, java.lang.String, java.lang.Void)
+    assert updated is not metadata
+    assert updated.fingerprint != metadata.fingerprint
+    assert sorted(a.name for a in updated.beaninfo.attributes) == ['i', 'j']
+
+    cache.invalidate(C)
+    assert cache.get(C, java.lang.String, java.lang.Void) is not updated
+
+
+class DaemonThreadFactory(ThreadFactory):
+    '''A ``ThreadFactory`` creating named daemon threads
+
+    Threads created by JythonMX should never keep the JVM alive.
+    '''
+    def __init__(self, name):
+        '''Initialize a new `DaemonThreadFactory`
+
+        :param name: name prefix of all created threads
+        :type name: `str`
+        '''
+        self._name = name
+        self._count = AtomicLong()
+
+    def newThread(self, runnable):
+        '''Create a new daemon thread running `runnable`'''
+        name = '%s-%d' % (self._name, self._count.incrementAndGet())
+        thread = java.lang.Thread(runnable, name)
+        thread.setDaemon(True)
+        return thread
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def scheduler():
+    '''Retrieve the scheduler used for all of JythonMX' periodic and delayed
+    tasks
+
+    The scheduler is created on first use, and runs on a daemon thread.
+
+    :return: shared scheduler
+    :rtype: ``java.util.concurrent.ScheduledExecutorService``
+    '''
+    global _scheduler #pylint: disable-msg=W0603
+
+    if _scheduler is None:
+        _scheduler_lock.acquire()
+        try:
+            if _scheduler is None:
+                _scheduler = Executors.newSingleThreadScheduledExecutor(
+                                 DaemonThreadFactory('jythonmx-scheduler'))
+        finally:
+            _scheduler_lock.release()
+
+    return _scheduler
+
+
+_delivery_executor = None
+_delivery_executor_lock = threading.Lock()
+
+def delivery_executor():
+    '''Retrieve the executor delivering notifications emitted by JythonMX
+    itself, e.g. coalesced notifications, off the scheduler thread
+
+    The executor is created on first use, and runs on daemon threads.
+
+    :return: shared delivery executor
+    :rtype: ``java.util.concurrent.ExecutorService``
+    '''
+    global _delivery_executor #pylint: disable-msg=W0603
+
+    if _delivery_executor is None:
+        _delivery_executor_lock.acquire()
+        try:
+            if _delivery_executor is None:
+                _delivery_executor = Executors.newCachedThreadPool(
+                                         DaemonThreadFactory(
+                                             'jythonmx-delivery'))
+        finally:
+            _delivery_executor_lock.release()
+
+    return _delivery_executor
+
+
+class NotificationQueue(object):
+    '''A bounded queue of notifications, delivered asynchronously
+
+    An `MBeanAdapter` using a queue hands all notifications to it, and returns
+    to the emitting thread immediately. The queue is drained by a task running
+    on an executor, which delivers the notifications to the listeners of their
+    adapter. A single queue can be shared by any number of adapters.
+
+    Once the queue is full, the overflow policy decides what happens:
+
+    `DROP_OLDEST`
+        Discard the oldest queued notification to make room
+    `DROP_NEWEST`
+        Discard the notification being emitted
+    `BLOCK`
+        Block the emitting thread until there's room in the queue
+
+    The queue can be registered as an MBean itself, to expose its counters.
+    '''
+    DROP_OLDEST = 'drop-oldest'
+    DROP_NEWEST = 'drop-newest'
+    BLOCK = 'block'
+
+    def __init__(self, capacity=1024, policy=DROP_OLDEST, executor=None):
+        '''Initialize a new `NotificationQueue`
+
+        :param capacity: maximum number of queued notifications
+        :type capacity: `int`
+        :param policy: overflow policy
+        :type policy: `str`
+        :param executor: executor to run the delivery task on, by default a
+                         dedicated daemon thread is used
+        :type executor: ``java.util.concurrent.Executor``
+        '''
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.BLOCK):
+            raise ValueError('Unknown overflow policy: %s' % policy)
+
+        self._capacity = capacity
+        self._policy = policy
+        self._executor = executor or Executors.newSingleThreadExecutor(
+                                DaemonThreadFactory('jythonmx-notifications'))
+
+        self._queue = ArrayBlockingQueue(capacity)
+        self._draining = AtomicBoolean(False)
+
+        self._enqueued = AtomicLong()
+        self._dropped = AtomicLong()
+        self._delivered = AtomicLong()
+
+        self._logger = logging.getLogger('mbeanadapter.notificationqueue')
+
+    def _put(self, adapter, notification):
+        '''Queue a notification for delivery to the listeners of `adapter`
+
+        :param adapter: adapter emitting the notification
+        :type adapter: `MBeanAdapter`
+        :param notification: notification to deliver
+        :type notification: ``Notification``
+        '''
+        item = adapter, notification
+
+        if self._policy == self.BLOCK:
+            self._queue.put(item)
+        elif self._policy == self.DROP_NEWEST:
+            if not self._queue.offer(item):
+                self._dropped.incrementAndGet()
+                return
+        else:
+            while not self._queue.offer(item):
+                if self._queue.poll() is not None:
+                    self._dropped.incrementAndGet()
+
+        self._enqueued.incrementAndGet()
+        self._schedule()
+
+    def _schedule(self):
+        '''Make sure a delivery task is running'''
+        if self._draining.compareAndSet(False, True):
+            self._executor.execute(self._drain)
+
+    def _drain(self):
+        '''Deliver all queued notifications'''
+        try:
+            while True:
+                item = self._queue.poll()
+                if item is None:
+                    break
+
+                adapter, notification = item
+                try:
+                    adapter._deliver(notification) #pylint: disable-msg=W0212
+                except: #pylint: disable-msg=W0702
+                    self._logger.exception('Error delivering notification')
+
+                self._delivered.incrementAndGet()
+        finally:
+            self._draining.set(False)
+
+        # Notifications queued after the last poll, but before the flag was
+        # reset, didn't schedule a new task
+        if not self._queue.isEmpty():
+            self._schedule()
+
+    capacity = TypedProperty(java.lang.Integer,
+                             fget=operator.attrgetter('_capacity'),
+                             doc='Maximum number of queued notifications')
+    policy = property(fget=operator.attrgetter('_policy'),
+                      doc='Overflow policy')
+    queued = TypedProperty(java.lang.Integer,
+                           fget=lambda s: s._queue.size(),
+                           doc='Number of notifications currently queued')
+    enqueued = TypedProperty(java.lang.Long,
+                             fget=lambda s: s._enqueued.get(),
+                             doc='Total number of notifications queued')
+    dropped = TypedProperty(java.lang.Long,
+                            fget=lambda s: s._dropped.get(),
+                            doc='Total number of notifications dropped ' \
+                                'because the queue was full')
+    delivered = TypedProperty(java.lang.Long,
+                              fget=lambda s: s._delivered.get(),
+                              doc='Total number of notifications delivered')
+
+def test_notification_queue():
+    '''Test `NotificationQueue` overflow policies and delivery'''
+    class Executor(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self.tasks = []
+
+        def execute(self, task): #pylint: disable-msg=C0111
+            self.tasks.append(task)
+
+    class Adapter(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self.delivered = []
+            self._deliver = self.delivered.append
+
+    for policy, expected in ((NotificationQueue.DROP_OLDEST, [2, 3]),
+                             (NotificationQueue.DROP_NEWEST, [1, 2]), ):
+        executor = Executor()
+        adapter = Adapter()
+        queue = NotificationQueue(2, policy, executor)
+
+        for i in (1, 2, 3):
+            queue._put(adapter, i) #pylint: disable-msg=W0212
+
+        assert len(executor.tasks) == 1
+        assert queue.queued == 2
+        assert queue.dropped == 1
+
+        executor.tasks.pop()()
+        assert adapter.delivered == expected
+        assert queue.queued == 0
+        assert queue.delivered == 2
+
+    try:
+        NotificationQueue(policy='unknown')
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+
+class ThresholdMonitor(object):
+    '''Evaluates all bound `Threshold` triggers at a fixed interval
+
+    A single task evaluates all thresholds, on the shared JythonMX scheduler
+    by default. The monitor can be registered as an MBean itself, to expose
+    the number of monitored thresholds and the cost of evaluating them.
+    '''
+    def __init__(self, interval=1.0, executor=None):
+        '''Initialize a new `ThresholdMonitor`
+
+        :param interval: number of seconds between evaluations
+        :type interval: `float`
+        :param executor: executor to run the evaluation task on, by default
+                         the shared JythonMX scheduler is used
+        :type executor: ``java.util.concurrent.ScheduledExecutorService``
+        '''
+        if interval <= 0:
+            raise ValueError('Evaluation interval must be positive')
+
+        self._interval = interval
+        self._executor = executor
+
+        # Replaced as a whole on every change, so evaluation needs no lock
+        self._thresholds = ()
+        self._lock = threading.Lock()
+        self._task = None
+
+        self._evaluated = 0
+        self._evaluations = AtomicLong()
+        self._errors = AtomicLong()
+        self._evaluationTime = 0.0
+
+        self._logger = logging.getLogger('mbeanadapter.thresholdmonitor')
+
+    def add(self, threshold):
+        '''Start evaluating a bound threshold
+
+        :param threshold: threshold to evaluate
+        :type threshold: `BoundThreshold`
+        '''
+        self._lock.acquire()
+        try:
+            self._thresholds += (threshold, )
+
+            if self._task is None:
+                interval = long(self._interval * 1000)
+                self._task = (self._executor or scheduler()) \
+                    .scheduleAtFixedRate(self._evaluate, interval, interval,
+                                         TimeUnit.MILLISECONDS)
+        finally:
+            self._lock.release()
+
+    def remove(self, threshold):
+        '''Stop evaluating a bound threshold
+
+        :param threshold: threshold to remove
+        :type threshold: `BoundThreshold`
+        '''
+        self._lock.acquire()
+        try:
+            self._thresholds = tuple(t for t in self._thresholds
+                                     if t is not threshold)
+
+            if not self._thresholds and self._task is not None:
+                self._task.cancel(False)
+                self._task = None
+        finally:
+            self._lock.release()
+
+    def _evaluate(self):
+        '''Evaluate all thresholds once'''
+        start = java.lang.System.nanoTime()
+
+        evaluated = 0
+        for threshold in self._thresholds:
+            try:
+                if threshold.evaluate():
+                    evaluated += 1
+            except: #pylint: disable-msg=W0702
+                self._errors.incrementAndGet()
+                self._logger.exception('Error evaluating threshold %s',
+                                       threshold.name)
+
+        self._evaluated = evaluated
+        self._evaluations.addAndGet(evaluated)
+        self._evaluationTime = (java.lang.System.nanoTime() - start) / 1e6
+
+    interval = TypedProperty(java.lang.Double,
+                             fget=operator.attrgetter('_interval'),
+                             doc='Number of seconds between evaluations')
+    monitors = TypedProperty(java.lang.Integer,
+                             fget=lambda s: len(s._thresholds),
+                             doc='Number of monitored thresholds')
+    evaluated = TypedProperty(java.lang.Integer,
+                              fget=operator.attrgetter('_evaluated'),
+                              doc='Number of thresholds evaluated during ' \
+                                  'the last run, thresholds nobody listens ' \
+                                  'to are skipped')
+    evaluations = TypedProperty(java.lang.Long,
+                                fget=lambda s: s._evaluations.get(),
+                                doc='Total number of threshold evaluations')
+    errors = TypedProperty(java.lang.Long,
+                           fget=lambda s: s._errors.get(),
+                           doc='Total number of failed evaluations')
+    evaluationTime = TypedProperty(java.lang.Double,
+                                   fget=operator.attrgetter('_evaluationTime'),
+                                   doc='Duration of the last run, in ms')
+
+def test_threshold_monitor():
+    '''Test `ThresholdMonitor` scheduling and counters'''
+    class Threshold_(object): #pylint: disable-msg=C0111
+        name = 'test'
+
+        def __init__(self, result):
+            self.result = result
+
+        def evaluate(self): #pylint: disable-msg=C0111
+            if self.result is None:
+                raise RuntimeError
+            return self.result
+
+    class Task(object): #pylint: disable-msg=C0111
+        cancelled = False
+
+        def cancel(self, interrupt): #pylint: disable-msg=C0111
+            self.cancelled = True
+
+    class Executor(object): #pylint: disable-msg=C0111
+        task = None
+
+        def scheduleAtFixedRate(self, *args_): #pylint: disable-msg=C0111
+            self.task = Task()
+            return self.task
+
+    executor = Executor()
+    monitor = ThresholdMonitor(executor=executor)
+    thresholds = [Threshold_(True), Threshold_(False), Threshold_(None)]
+    for threshold in thresholds:
+        monitor.add(threshold)
+    assert monitor.monitors == 3
+
+    monitor._evaluate() #pylint: disable-msg=W0212
+    assert monitor.evaluated == 1
+    assert monitor.errors == 1
+
+    for threshold in thresholds:
+        monitor.remove(threshold)
+    assert monitor.monitors == 0
+    assert executor.task.cancelled
+
+
+# Default monitor of all thresholds
+threshold_monitor = ThresholdMonitor()
+
+
+class Job(java.lang.Runnable):
+    '''An asynchronous operation submitted to an `OperationExecutor`'''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, id_, name, call, completed, failed):
+        '''Initialize a new `Job`
+
+        :param id\\_: job ID
+        :type id\\_: `long`
+        :param name: operation name
+        :type name: `str`
+        :param call: function running the operation, returning its coerced
+                     result
+        :type call: `callable`
+        :param completed: trigger fired when the operation completes
+        :type completed: `NotificationTrigger`
+        :param failed: trigger fired when the operation fails
+        :type failed: `NotificationTrigger`
+        '''
+        self.id = id_
+        self.name = name
+        self.status = self.QUEUED
+        self.future = None
+
+        self._call = call
+        self._completed = completed
+        self._failed = failed
+
+    def run(self):
+        '''Run the operation, and emit its completion notification'''
+        self.status = self.RUNNING
+
+        data = java.util.HashMap()
+        data.put('jobId', java.lang.Long(self.id))
+
+        try:
+            result = self._call()
+        except (Exception, java.lang.Exception), exc:
+            self.status = self.FAILED
+            data.put('error', java.lang.String(str(exc)))
+            logging.getLogger('mbeanadapter.operations').exception(
+                'Error executing %s', self.name)
+            self._failed('Job %d (%s) failed' % (self.id, self.name), data)
+        else:
+            self.status = self.COMPLETED
+            data.put('result', result)
+            self._completed('Job %d (%s) completed' % (self.id, self.name),
+                            data)
+
+
+class OperationExecutor(object):
+    '''A bounded thread pool running asynchronous operations
+
+    Operations are queued until a thread is available, and rejected once the
+    queue is full. The status of the most recent jobs is kept, so clients can
+    poll it, or cancel jobs which haven't finished yet.
+
+    The executor can be registered as an MBean itself, to expose its
+    configuration and counters, and the job status and cancel operations.
+    '''
+    def __init__(self, pool_size=4, queue_size=64, history=1024):
+        '''Initialize a new `OperationExecutor`
+
+        :param pool_size: number of threads running operations
+        :type pool_size: `int`
+        :param queue_size: maximum number of queued operations
+        :type queue_size: `int`
+        :param history: number of jobs whose status is kept
+        :type history: `int`
+        '''
+        self._poolSize = pool_size
+        self._queueSize = queue_size
+
+        self._queue = ArrayBlockingQueue(queue_size)
+        self._executor = ThreadPoolExecutor(
+                             pool_size, pool_size, 60, TimeUnit.SECONDS,
+                             self._queue,
+                             DaemonThreadFactory('jythonmx-operations'))
+        self._executor.allowCoreThreadTimeOut(True)
+
+        self._jobs = LRUCache(history)
+        self._ids = AtomicLong()
+
+        self._submitted = AtomicLong()
+        self._rejected = AtomicLong()
+
+    def _submit(self, name, call, completed, failed):
+        '''Submit an operation
+
+        :param name: operation name
+        :type name: `str`
+        :param call: function running the operation, returning its coerced
+                     result
+        :type call: `callable`
+        :param completed: trigger fired when the operation completes
+        :type completed: `NotificationTrigger`
+        :param failed: trigger fired when the operation fails
+        :type failed: `NotificationTrigger`
+
+        :return: job ID
+        :rtype: `long`
+        '''
+        job = Job(self._ids.incrementAndGet(), name, call, completed, failed)
+        job.future = FutureTask(job, None)
+        self._jobs[long(job.id)] = job
+
+        try:
+            self._executor.execute(job.future)
+        except RejectedExecutionException:
+            self._jobs.pop(long(job.id))
+            self._rejected.incrementAndGet()
+            raise RuntimeError('Operation queue full, %s rejected' % name)
+
+        self._submitted.incrementAndGet()
+        return job.id
+
+    @returns(java.lang.String)
+    @args((java.lang.Long, 'Job ID'))
+    def getJobStatus(self, jobId):
+        '''Retrieve the status of a job: queued, running, completed, failed,
+        cancelled, or unknown if it's no longer tracked'''
+        job = self._jobs.get(long(jobId))
+        if job is None:
+            return 'unknown'
+        if job.future.isCancelled():
+            return Job.CANCELLED
+        return job.status
+
+    @returns(java.lang.Boolean)
+    @args((java.lang.Long, 'Job ID'))
+    def cancelJob(self, jobId):
+        '''Cancel a job, interrupting it if it's running'''
+        job = self._jobs.get(long(jobId))
+        if job is None:
+            return False
+        return job.future.cancel(True)
+
+    poolSize = TypedProperty(java.lang.Integer,
+                             fget=operator.attrgetter('_poolSize'),
+                             doc='Number of threads running operations')
+    queueSize = TypedProperty(java.lang.Integer,
+                              fget=operator.attrgetter('_queueSize'),
+                              doc='Maximum number of queued operations')
+    queued = TypedProperty(java.lang.Integer,
+                           fget=lambda s: s._queue.size(),
+                           doc='Number of operations currently queued')
+    active = TypedProperty(java.lang.Integer,
+                           fget=lambda s: s._executor.getActiveCount(),
+                           doc='Number of operations currently running')
+    submitted = TypedProperty(java.lang.Long,
+                              fget=lambda s: s._submitted.get(),
+                              doc='Total number of operations submitted')
+    completed = TypedProperty(java.lang.Long,
+                              fget=lambda s: \
+                                  s._executor.getCompletedTaskCount(),
+                              doc='Total number of operations finished')
+    rejected = TypedProperty(java.lang.Long,
+                             fget=lambda s: s._rejected.get(),
+                             doc='Total number of operations rejected ' \
+                                 'because the queue was full')
+
+def test_operation_executor():
+    '''Test `OperationExecutor` job execution and status'''
+    events = ArrayBlockingQueue(2)
+    completed = lambda message, data: events.put(('completed', data))
+    failed = lambda message, data: events.put(('failed', data))
+
+    def fail(): #pylint: disable-msg=C0111
+        raise RuntimeError('Failure')
+
+    #pylint: disable-msg=W0212
+    executor = OperationExecutor(pool_size=1, queue_size=1)
+    job = executor._submit('test', lambda: 'done', completed, failed)
+    kind, data = events.poll(5, TimeUnit.SECONDS)
+    assert kind == 'completed'
+    assert data.get('jobId') == job
+    assert data.get('result') == 'done'
+    assert executor.getJobStatus(job) == Job.COMPLETED
+    assert not executor.cancelJob(job)
+
+    job = executor._submit('test', fail, completed, failed)
+    kind, data = events.poll(5, TimeUnit.SECONDS)
+    assert kind == 'failed'
+    assert data.get('error') == 'Failure'
+    assert executor.getJobStatus(job) == Job.FAILED
+    assert executor.getJobStatus(-1) == 'unknown'
+    assert executor.submitted == 2
+
+
+# Default executor of all asynchronous operations
+operation_executor = OperationExecutor()
+
+
+def add_mbean_attributes(fun, provider):
+    '''Expose extra attributes through the `mbean_attributes` hook of a method
+
+    Attributes of several providers, e.g. decorators, are chained.
+
+    :param fun: method to extend
+    :type fun: `callable`
+    :param provider: function listing ``(name, type, description, getter)``
+                     tuples, given the name of the method
+    :type provider: `callable`
+    '''
+    previous = getattr(fun, 'mbean_attributes', None)
+    if previous is None:
+        fun.mbean_attributes = provider
+    else:
+        fun.mbean_attributes = lambda name: tuple(previous(name)) + \
+                                            tuple(provider(name))
+
+def test_add_mbean_attributes():
+    '''Test `add_mbean_attributes` chaining'''
+    def f(): #pylint: disable-msg=C0111
+        pass
+
+    add_mbean_attributes(f, lambda name: ((name + 'A', ), ))
+    add_mbean_attributes(f, lambda name: ((name + 'B', ), ))
+    #pylint: disable-msg=E1101
+    assert f.mbean_attributes('f') == (('fA', ), ('fB', ))
+
+
+class BulkheadCall(java.lang.Runnable):
+    '''A call of an operation, run by a `Bulkhead`
+
+    The call holds a permit of the bulkhead, which is released once it
+    finishes, or when it's cancelled before it started. Starting and
+    cancelling race for the pending state, so exactly one of them happens, and
+    a call never runs without its permit.
+    '''
+    PENDING, RUNNING, FINISHED, OVERRUNNING, CANCELLED = 0, 1, 2, 3, 4
+
+    def __init__(self, fun, args_, permits, overrunning):
+        self._fun = fun
+        self._args = args_
+        self._permits = permits
+        self._overrunning = overrunning
+        self._state = AtomicInteger(self.PENDING)
+
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        '''Run the call, storing its result or exception, unless it was
+        cancelled already'''
+        if not self._state.compareAndSet(self.PENDING, self.RUNNING):
+            return
+
+        try:
+            self.result = self._fun(*self._args)
+        except: #pylint: disable-msg=W0702
+            self.exc_info = sys.exc_info()
+        finally:
+            self._permits.release()
+            if not self._state.compareAndSet(self.RUNNING, self.FINISHED):
+                self._overrunning.decrementAndGet()
+
+    def overrun(self):
+        '''Account for the call running past its timeout, if it's running'''
+        self._overrunning.incrementAndGet()
+        if not self._state.compareAndSet(self.RUNNING, self.OVERRUNNING):
+            self._overrunning.decrementAndGet()
+
+    def cancel(self):
+        '''Release the permit held by the call, if it didn't start yet, and
+        make sure it never will'''
+        if self._state.compareAndSet(self.PENDING, self.CANCELLED):
+            self._permits.release()
+
+
+class BulkheadTask(FutureTask):
+    '''The future of a `BulkheadCall`'''
+    def __init__(self, call):
+        FutureTask.__init__(self, call, None)
+        self._call = call
+
+    def done(self):
+        '''Release the permit of calls cancelled before they started'''
+        if self.isCancelled():
+            self._call.cancel()
+
+
+class Bulkhead(object):
+    '''Limits the concurrency and duration of calls of an operation
+
+    Calls through JMX are run on a dedicated thread pool of `concurrency`
+    threads. Once all threads are busy, up to `queue` calls wait for one,
+    any further calls are rejected at once: admission is controlled by a
+    semaphore holding ``concurrency + queue`` permits. Calls from Python code
+    aren't limited.
+
+    Calls not finished after `timeout` seconds fail, and their thread is
+    interrupted. Interrupting a thread doesn't stop Python code though, only
+    blocking Java calls: a call which timed out keeps running, and holding its
+    permit, until the method returns. Timeouts bound how long clients wait,
+    not the capacity used by slow calls. The number of such calls is exposed
+    as `overrunning`.
+
+    :see: `bulkhead`
+    '''
+    def __init__(self, concurrency, queue=0, timeout=None):
+        '''Initialize a new `Bulkhead`
+
+        :param concurrency: maximum number of concurrent executions
+        :type concurrency: `int`
+        :param queue: maximum number of calls waiting for a thread
+        :type queue: `int`
+        :param timeout: maximum duration of a call, in seconds
+        :type timeout: `float`
+        '''
+        if concurrency <= 0:
+            raise ValueError('concurrency should be positive')
+        if queue < 0:
+            raise ValueError('queue should not be negative')
+        if timeout is not None and timeout <= 0:
+            raise ValueError('timeout should be positive')
+
+        self._concurrency = concurrency
+        self._queueSize = queue
+        self._timeout = timeout
+
+        self._permits = Semaphore(concurrency + queue)
+        self._queue = LinkedBlockingQueue()
+        self._executor = ThreadPoolExecutor(
+                             concurrency, concurrency, 60, TimeUnit.SECONDS,
+                             self._queue,
+                             DaemonThreadFactory('jythonmx-bulkhead'))
+        self._executor.allowCoreThreadTimeOut(True)
+
+        self._rejected = AtomicLong()
+        self._timeouts = AtomicLong()
+        self._overrunning = AtomicInteger()
+
+    def call(self, fun, *args_):
+        '''Call `fun`, within the limits of the bulkhead
+
+        :param fun: function to call
+        :type fun: `callable`
+
+        :return: result of `fun`
+        :rtype: `object`
+        '''
+        if not self._permits.tryAcquire():
+            self._rejected.incrementAndGet()
+            raise RuntimeError('Too many concurrent calls')
+
+        call = BulkheadCall(fun, args_, self._permits, self._overrunning)
+        future = BulkheadTask(call)
+        self._executor.execute(future)
+
+        try:
+            if self._timeout is None:
+                future.get()
+            else:
+                future.get(long(self._timeout * 1000), TimeUnit.MILLISECONDS)
+        except TimeoutException:
+            future.cancel(True)
+            call.overrun()
+            self._timeouts.incrementAndGet()
+            raise RuntimeError('Call timed out after %s seconds' % \
+                               self._timeout)
+
+        if call.exc_info is not None:
+            raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+
+        return call.result
+
+    def mbean_attributes(self, name):
+        '''List the attributes exposing the counters of the bulkhead
+
+        :param name: name of the operation
+        :type name: `str`
+
+        :return: ``(name, type, description, getter)`` tuples
+        :rtype: ``iterable<tuple>``
+        '''
+        executor = self._executor
+        return (
+            ('%sActive' % name, java.lang.Integer,
+             'Number of running calls of %s' % name,
+             lambda _: executor.getActiveCount()),
+            ('%sQueued' % name, java.lang.Integer,
+             'Number of calls of %s waiting for a thread' % name,
+             lambda _: self._queue.size()),
+            ('%sRejected' % name, java.lang.Long,
+             'Number of calls of %s rejected because of the concurrency ' \
+             'limit' % name,
+             lambda _: self._rejected.get()),
+            ('%sTimeouts' % name, java.lang.Long,
+             'Number of calls of %s which timed out' % name,
+             lambda _: self._timeouts.get()),
+            ('%sOverrunning' % name, java.lang.Integer,
+             'Number of timed out calls of %s still running' % name,
+             lambda _: self._overrunning.get()),
+        )
+
+    concurrency = property(operator.attrgetter('_concurrency'),
+                           doc='Maximum number of concurrent executions')
+    queue = property(operator.attrgetter('_queueSize'),
+                     doc='Maximum number of calls waiting for a thread')
+    timeout = property(operator.attrgetter('_timeout'),
+                       doc='Maximum duration of a call, in seconds')
+    rejected = property(lambda s: s._rejected.get(),
+                        doc='Number of rejected calls')
+    timeouts = property(lambda s: s._timeouts.get(),
+                        doc='Number of calls which timed out')
+    overrunning = property(lambda s: s._overrunning.get(),
+                           doc='Number of timed out calls still running, ' \
+                               'and holding a permit')
+
+
+def bulkhead(concurrency, queue=0, timeout=None):
+    '''Limit the concurrency and duration of calls of an operation
+
+    Calls exceeding the limits fail with an ``MBeanException``. The number of
+    active, queued, rejected, timed out and still running timed out calls are
+    exposed as ``<operation>Active``, ``<operation>Queued``,
+    ``<operation>Rejected``, ``<operation>Timeouts`` and
+    ``<operation>Overrunning`` attributes. Calls which timed out keep running
+    until the method returns, see `Bulkhead`.
+
+    Example:
+
+    >>> class C(object):
+    ...     @bulkhead(2, queue=5, timeout=30)
+    ...     @returns(java.lang.Long)
+    ...     def reindex(self):
+    ...         pass
+
+    :see: `Bulkhead`
+
+    :param concurrency: maximum number of concurrent executions
+    :type concurrency: `int`
+    :param queue: maximum number of calls waiting for a thread
+    :type queue: `int`
+    :param timeout: maximum duration of a call, in seconds
+    :type timeout: `float`
+    '''
+    limits = Bulkhead(concurrency, queue, timeout)
+
+    def tagger(fun):
+        '''Set the bulkhead of `fun`'''
+        fun.__bulkhead__ = limits
+        add_mbean_attributes(fun, limits.mbean_attributes)
+        return fun
+
+    return tagger
+
+def test_bulkhead():
+    '''Test `Bulkhead` limits'''
+    started = ArrayBlockingQueue(2)
+    release = ArrayBlockingQueue(2)
+
+    def block(): #pylint: disable-msg=C0111
+        started.put(True)
+        release.poll(5, TimeUnit.SECONDS)
+        return 'done'
+
+    limits = Bulkhead(1)
+    assert limits.call(lambda a, b: a + b, 1, 2) == 3
+    try:
+        limits.call(operator.div, 1, 0)
+    except ZeroDivisionError:
+        pass
+    else:
+        assert False, 'ZeroDivisionError not raised'
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(limits.call(block)))
+    worker.start()
+    assert started.poll(5, TimeUnit.SECONDS)
+    try:
+        limits.call(block)
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'RuntimeError not raised'
+    release.put(True)
+    worker.join()
+    assert results == ['done']
+    assert limits.rejected == 1
+
+    # Interrupts don't stop Python code, the timed out call keeps its permit
+    finished = []
+    def spin(): #pylint: disable-msg=C0111
+        deadline = time.time() + 5
+        while not finished and time.time() < deadline:
+            pass
+
+    limits = Bulkhead(1, timeout=0.1)
+    for fun in (spin, lambda: None):
+        try:
+            limits.call(fun)
+        except RuntimeError:
+            pass
+        else:
+            assert False, 'RuntimeError not raised'
+    assert limits.timeouts == 1
+    assert limits.rejected == 1
+    assert limits.overrunning == 1
+
+    finished.append(True)
+    deadline = time.time() + 5
+    while limits.overrunning and time.time() < deadline:
+        time.sleep(0.01)
+    assert limits.overrunning == 0
+    assert limits.call(lambda: 1) == 1
+
+    # A call cancelled before it started releases its permit, and never runs
+    permits = Semaphore(1)
+    permits.acquire()
+    calls = []
+    call = BulkheadCall(calls.append, (1, ), permits, AtomicInteger())
+    call.cancel()
+    call.run()
+    call.cancel()
+    assert not calls
+    assert permits.availablePermits() == 1
+
+    attributes = [a[0] for a in limits.mbean_attributes('block')]
+    assert attributes == ['blockActive', 'blockQueued', 'blockRejected',
+                          'blockTimeouts', 'blockOverrunning']
+
+
+class OperationCache(AttributeCache):
+    '''A cache of operation results, per bean and arguments, expiring after a
+    TTL
+
+    Results are cached in a bounded LRU mapping, keyed by the bean and the
+    coerced arguments of the call. Failed calls aren't cached, nor are calls
+    taking unhashable arguments, e.g. arrays.
+
+    :see: `cached`
+    '''
+    __slots__ = ()
+
+    def __init__(self, ttl, maxsize=128):
+        '''Initialize a new `OperationCache`
+
+        :param ttl: number of seconds results are cached
+        :type ttl: `float`
+        :param maxsize: maximum number of cached results
+        :type maxsize: `int`
+        '''
+        # Keys are created on every call, they can't be referenced weakly
+        if maxsize is None:
+            raise ValueError('maxsize is required')
+
+        AttributeCache.__init__(self, ttl, maxsize)
+
+    def call(self, fun, bean, *args_):
+        '''Call `fun`, unless a result of an earlier call with the same
+        arguments is cached
+
+        :param fun: function to call
+        :type fun: `callable`
+        :param bean: bean to call `fun` on
+        :type bean: `object`
+
+        :return: cached or computed result
+        :rtype: `object`
+        '''
+        key = bean, args_
+        try:
+            hash(key)
+        except TypeError:
+            return fun(bean, *args_)
+
+        return self.get(key, lambda _: fun(bean, *args_))
+
+    def invalidate(self, bean=None, *args_):
+        '''Drop cached results
+
+        :param bean: bean to drop the cached result of, or `None` to drop all
+        :type bean: `object`
+        '''
+        AttributeCache.invalidate(self,
+                                  None if bean is None else (bean, args_))
+
+    def mbean_attributes(self, name):
+        '''List the attributes exposing the counters of the cache
+
+        :param name: name of the operation
+        :type name: `str`
+
+        :return: ``(name, type, description, getter)`` tuples
+        :rtype: ``iterable<tuple>``
+        '''
+        return (
+            ('%sCacheHitRatio' % name, java.lang.Double,
+             'Ratio of calls of %s answered from the cache' % name,
+             lambda _: self.hits / float(max(self.hits + self.misses, 1))),
+            ('%sCacheEvictions' % name, java.lang.Long,
+             'Number of cached results of %s evicted' % name,
+             lambda _: self.evictions),
+            ('%sCacheSize' % name, java.lang.Integer,
+             'Number of cached results of %s' % name,
+             lambda _: self.size),
+        )
+
+
+def cached(ttl, maxsize=128):
+    '''Cache the results of an operation invoked through JMX
+
+    Results are cached for `ttl` seconds, per bean and coerced arguments, and
+    at most `maxsize` of them are kept. Calls from Python code aren't cached.
+    The application can drop cached results through the ``invalidate``
+    function of the method, see `OperationCache.invalidate`. The hit ratio,
+    number of evictions and cache size are exposed as
+    ``<operation>CacheHitRatio``, ``<operation>CacheEvictions`` and
+    ``<operation>CacheSize`` attributes.
+
+    Example:
+
+    >>> class C(object):
+    ...     @cached(ttl=60, maxsize=1000)
+    ...     @returns(java.lang.String)
+    ...     @args(java.lang.String)
+    ...     def describe(self, name):
+    ...         pass
+
+    >>> C.describe.invalidate(bean, 'entity')
+
+    :param ttl: number of seconds results are cached
+    :type ttl: `float`
+    :param maxsize: maximum number of cached results
+    :type maxsize: `int`
+    '''
+    cache = OperationCache(ttl, maxsize)
+
+    def tagger(fun):
+        '''Set the result cache of `fun`'''
+        fun.__cache__ = cache
+        fun.invalidate = cache.invalidate
+        add_mbean_attributes(fun, cache.mbean_attributes)
+        return fun
+
+    return tagger
+
+def test_cached():
+    '''Test `cached` operations'''
+    calls = []
+
+    class C(object): #pylint: disable-msg=C0111
+        @cached(60, maxsize=2)
+        def double(self, value): #pylint: disable-msg=C0111
+            calls.append(value)
+            return value * 2
+
+    #pylint: disable-msg=E1101
+    cache = C.double.__cache__
+    c = C()
+    double = C.__dict__['double']
+    assert [cache.call(double, c, i) for i in (1, 1, 2, 3, 1)] == \
+        [2, 2, 4, 6, 2]
+    assert calls == [1, 2, 3, 1]
+    assert cache.evictions == 2
+
+    C.double.invalidate(c, 1)
+    assert cache.call(double, c, 1) == 2
+    assert calls == [1, 2, 3, 1, 1]
+
+    C.double.invalidate()
+    assert cache.size == 0
+    ratio = dict((a[0], a[3]) for a in cache.mbean_attributes('double'))
+    assert ratio['doubleCacheHitRatio'](c) == 1 / 6.0
+
+    # Calls taking unhashable arguments aren't cached
+    del calls[:]
+    for _ in xrange(2):
+        assert cache.call(double, c, [1, 2]) == [1, 2, 1, 2]
+    assert len(calls) == 2
+    assert cache.size == 0
+
+    values = jarray.array([1, 2], 'i')
+    assert list(cache.call(double, c, values)) == [1, 2, 1, 2]
+
+
+class Series(object):
+    '''A fixed-size ring buffer of timestamped samples
+
+    Timestamps and values are stored in primitive Java arrays, allocated once.
+    Once the buffer is full, every new sample overwrites the oldest one.
+    '''
+    __slots__ = '_timestamps', '_values', '_position', '_count',
+
+    def __init__(self, size):
+        '''Initialize a new `Series`
+
+        :param size: maximum number of samples kept
+        :type size: `int`
+        '''
+        self._timestamps = jarray.zeros(size, 'l')
+        self._values = jarray.zeros(size, 'd')
+        self._position = 0
+        self._count = 0
+
+    def append(self, timestamp, value):
+        '''Record a sample
+
+        :param timestamp: time of the sample, in milliseconds since the epoch
+        :type timestamp: `long`
+        :param value: sampled value
+        :type value: `float`
+        '''
+        position = self._position
+        self._timestamps[position] = timestamp
+        self._values[position] = value
+
+        self._position = (position + 1) % len(self._values)
+        self._count = min(self._count + 1, len(self._values))
+
+    def since(self, timestamp):
+        '''Retrieve all samples taken after `timestamp`, oldest first
+
+        :param timestamp: time, in milliseconds since the epoch
+        :type timestamp: `long`
+
+        :return: timestamps and values of all samples
+        :rtype: ``tuple<jarray.array, jarray.array>``
+        '''
+        size = len(self._values)
+        start = (self._position - self._count) % size
+        indices = [i % size for i in xrange(start, start + self._count)]
+        indices = [i for i in indices if self._timestamps[i] > timestamp]
+
+        return jarray.array([self._timestamps[i] for i in indices], 'l'), \
+               jarray.array([self._values[i] for i in indices], 'd')
+
+    def __len__(self):
+        return self._count
+
+def test_series():
+    '''Test `Series`'''
+    series = Series(3)
+    assert len(series) == 0
+    assert list(series.since(0)[0]) == []
+
+    for i in xrange(1, 5):
+        series.append(i * 1000, i / 2.0)
+
+    assert len(series) == 3
+    timestamps, values = series.since(0)
+    assert list(timestamps) == [2000, 3000, 4000]
+    assert list(values) == [1.0, 1.5, 2.0]
+    assert list(series.since(3000)[1]) == [2.0]
+
+
+class Sampler(object):
+    '''Records `TypedProperty` values of registered beans at a fixed interval
+
+    Adapters created with a sampler record all properties declared with
+    ``sample=True`` while they're registered, into a `Series` per attribute.
+    Clients can then retrieve minutes of history in a single call, instead of
+    polling the attribute itself.
+
+    The sampler can be registered as an MBean itself, to expose its history
+    and counters:
+
+    >>> sampler = Sampler(interval=1, size=300)
+    >>> MBeanAdapter(sampler).register('JythonMX:type=Sampler')
+    >>> MBeanAdapter(bean, sampler=sampler).register('Demo:type=Bean')
+    '''
+    _SERIES = Composite('Series', (
+        ('timestamps', Array('l'), 'Sample times, in ms since the epoch'),
+        ('values', Array('d'), 'Sampled values'),
+    ), 'Sampled attribute values')
+
+    def __init__(self, interval=1.0, size=600, executor=None):
+        '''Initialize a new `Sampler`
+
+        :param interval: number of seconds between samples
+        :type interval: `float`
+        :param size: number of samples kept per attribute
+        :type size: `int`
+        :param executor: executor to run the sampling task on, by default the
+                         shared JythonMX scheduler is used
+        :type executor: ``java.util.concurrent.ScheduledExecutorService``
+        '''
+        if interval <= 0:
+            raise ValueError('Sample interval must be positive')
+
+        self._interval = interval
+        self._size = size
+        self._executor = executor
+
+        # Canonical bean name to (adapter, {attribute: Series}) mapping
+        self._adapters = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+        self._samples = AtomicLong()
+        self._errors = AtomicLong()
+        self._sampleTime = 0.0
+
+        self._logger = logging.getLogger('mbeanadapter.sampler')
+
+    def _track(self, adapter):
+        '''Start sampling the attributes of a registered adapter'''
+        names = adapter.metadata.sampled
+        if not names:
+            return
+
+        series = dict((name, Series(self._size)) for name in names)
+
+        self._lock.acquire()
+        try:
+            self._adapters[adapter.name.getCanonicalName()] = adapter, series
+
+            if self._task is None:
+                interval = long(self._interval * 1000)
+                self._task = (self._executor or scheduler()) \
+                    .scheduleAtFixedRate(self._sample, interval, interval,
+                                         TimeUnit.MILLISECONDS)
+        finally:
+            self._lock.release()
+
+    def _untrack(self, adapter):
+        '''Stop sampling the attributes of an adapter, dropping its history'''
+        self._lock.acquire()
+        try:
+            self._adapters.pop(adapter.name.getCanonicalName(), None)
+
+            if not self._adapters and self._task is not None:
+                self._task.cancel(False)
+                self._task = None
+        finally:
+            self._lock.release()
+
+    def _sample(self):
+        '''Record the current value of all sampled attributes'''
+        start = java.lang.System.nanoTime()
+        timestamp = java.lang.System.currentTimeMillis()
+
+        # Read the values without holding the lock, getters might be slow
+        samples = []
+        for adapter, series in self._adapters.values():
+            for name, buffer_ in series.iteritems():
+                try:
+                    samples.append((buffer_, float(adapter.getAttribute(name))))
+                except: #pylint: disable-msg=W0702
+                    self._errors.incrementAndGet()
+
+        self._lock.acquire()
+        try:
+            for buffer_, value in samples:
+                buffer_.append(timestamp, value)
+        finally:
+            self._lock.release()
+
+        self._samples.addAndGet(len(samples))
+        self._sampleTime = (java.lang.System.nanoTime() - start) / 1e6
+
+    @returns(_SERIES)
+    @args((java.lang.String, 'ObjectName of the bean'),
+          (java.lang.String, 'Sampled attribute'),
+          (java.lang.Long, 'Only return samples taken after this time, in ' \
+                           'ms since the epoch'))
+    def getSeries(self, name, attribute, since):
+        '''Retrieve the recorded samples of an attribute'''
+        key = object_name(name).getCanonicalName()
+
+        self._lock.acquire()
+        try:
+            try:
+                buffer_ = self._adapters[key][1][attribute]
+            except KeyError:
+                raise ValueError('Attribute %s of %s is not sampled' % (
+                                     attribute, name))
+
+            return buffer_.since(since)
+        finally:
+            self._lock.release()
+
+    interval = TypedProperty(java.lang.Double,
+                             fget=operator.attrgetter('_interval'),
+                             doc='Number of seconds between samples')
+    size = TypedProperty(java.lang.Integer,
+                         fget=operator.attrgetter('_size'),
+                         doc='Number of samples kept per attribute')
+    series = TypedProperty(java.lang.Integer,
+                           fget=lambda s: sum(len(series) for _, series
+                                              in s._adapters.values()),
+                           doc='Number of sampled attributes')
+    samples = TypedProperty(java.lang.Long,
+                            fget=lambda s: s._samples.get(),
+                            doc='Total number of samples recorded')
+    errors = TypedProperty(java.lang.Long,
+                           fget=lambda s: s._errors.get(),
+                           doc='Total number of failed attribute reads')
+    sampleTime = TypedProperty(java.lang.Double,
+                               fget=operator.attrgetter('_sampleTime'),
+                               doc='Duration of the last sampling run, in ms')
+
+def test_sampler():
+    '''Test `Sampler` with a fake adapter'''
+    class Metadata(object): #pylint: disable-msg=C0111
+        sampled = ('load', 'broken', )
+
+    class Adapter(object): #pylint: disable-msg=C0111
+        metadata = Metadata()
+        name = object_name('JythonMXTest:type=Sampled')
+
+        def getAttribute(self, name): #pylint: disable-msg=C0111
+            if name == 'broken':
+                raise RuntimeError(name)
+            return 0.5
+
+    class Task(object): #pylint: disable-msg=C0111
+        cancelled = False
+
+        def cancel(self, interrupt): #pylint: disable-msg=C0111
+            self.cancelled = True
+
+    class Executor(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self.task = None
+
+        def scheduleAtFixedRate(self, *args_): #pylint: disable-msg=C0111
+            self.task = Task()
+            return self.task
+
+    executor = Executor()
+    sampler = Sampler(size=10, executor=executor)
+    adapter = Adapter()
+
+    sampler._track(adapter) #pylint: disable-msg=W0212
+    assert executor.task is not None
+    assert sampler.series == 2
+
+    sampler._sample() #pylint: disable-msg=W0212
+    sampler._sample() #pylint: disable-msg=W0212
+    assert sampler.samples == 2
+    assert sampler.errors == 2
+
+    timestamps, values = sampler.getSeries('JythonMXTest:type=Sampled', 'load',
+                                           0)
+    assert list(values) == [0.5, 0.5]
+    assert timestamps[0] <= timestamps[1]
+
+    try:
+        sampler.getSeries('JythonMXTest:type=Sampled', 'unknown', 0)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+    sampler._untrack(adapter) #pylint: disable-msg=W0212
+    assert executor.task.cancelled
+    assert sampler.series == 0
+
+
+class AdapterIndex(object):
+    '''Index of all registered adapters, by name
+
+    Adapters add themselves when registered, so exporters can find them
+    without going through the ``MBeanServer``.
+    '''
+    def __init__(self):
+        # Canonical name to adapter mapping
+        self._adapters = {}
+
+    def add(self, adapter):
+        '''Add a registered adapter
+
+        :param adapter: adapter to add
+        :type adapter: `MBeanAdapter`
+        '''
+        self._adapters[adapter.name.getCanonicalName()] = adapter
+
+    def remove(self, adapter):
+        '''Remove an adapter
+
+        :param adapter: adapter to remove
+        :type adapter: `MBeanAdapter`
+        '''
+        self._adapters.pop(adapter.name.getCanonicalName(), None)
+
+    def query(self, pattern):
+        '''List all adapters whose name matches `pattern`
+
+        :param pattern: name or pattern to match
+        :type pattern: `str` or ``ObjectName``
+
+        :return: matching adapters
+        :rtype: ``list<MBeanAdapter>``
+        '''
+        pattern = object_name(pattern)
+
+        if not pattern.isPattern():
+            adapter = self._adapters.get(pattern.getCanonicalName())
+            return [adapter] if adapter is not None else []
+
+        return [adapter for adapter in self._adapters.values()
+                if pattern.apply(adapter.name)]
+
+    def __len__(self):
+        return len(self._adapters)
+
+def test_adapter_index():
+    '''Test `AdapterIndex` queries'''
+    class Adapter(object): #pylint: disable-msg=C0111
+        def __init__(self, name):
+            self.name = object_name(name)
+
+    index = AdapterIndex()
+    adapters = [Adapter('JythonMXTest:type=A,name=%d' % i) for i in (1, 2)]
+    adapters.append(Adapter('JythonMXTest:type=B'))
+    for adapter in adapters:
+        index.add(adapter)
+
+    assert len(index) == 3
+    assert index.query('JythonMXTest:name=1,type=A') == adapters[:1]
+    assert len(index.query('JythonMXTest:type=A,*')) == 2
+    assert index.query('Other:*') == []
+
+    index.remove(adapters[0])
+    assert len(index.query('JythonMXTest:*')) == 2
+
+
+# Index of all registered adapters
+adapter_index = AdapterIndex()
+
+
+class MBeanAdapter(NotificationBroadcasterSupport, DynamicMBean, object):
+    '''An adapter for plain Python classes to act as MBeans in JMX
+
+    The plain adapter doesn't log exceptions raised by the bean, which the
+    Java JMX subsystem mostly swallows, nor trace calls: use an adapter class
+    created by `adapter_class` to enable tracing, or any other mode.
+    '''
+
+    __slots__ = '_bean', '_registered', '_name', '_sequence', '_metadata', \
+                '_getters', '_logger', '_lock', '_listeners', '_interested', \
+                '_listenerLock', '_queue', '_lazy', '_registering', \
+                '_sampler', '_invokers',
 
     # Default property value type
     DEFAULT_PROPERTY_TYPE = java.lang.String
     # Default method return type
     DEFAULT_FUNCTION_RETURN_TYPE = java.lang.Void
 
-    def __init__(self, bean):
-        '''Initialize a new `MBeanAdapter`
+    def __init__(self, bean, queue=None, lazy=False, sampler=None):
+        '''Initialize a new `MBeanAdapter`
+
+        Notifications are delivered to listeners synchronously, on the thread
+        emitting them, unless a `NotificationQueue` is given.
+
+        The ``MBeanServer`` requests the ``MBeanInfo`` of every bean being
+        registered, which requires a full introspection of the bean class. In
+        `lazy` mode, the server is handed a minimal ``MBeanInfo`` during
+        registration instead, and the full introspection is performed on a
+        background thread, or when a client first requests it.
+
+        While registered, all sampled properties of the bean are recorded by
+        the given `Sampler`, if any.
+
+        :param bean: instance to expose on JMX
+        :type bean: `object`
+        :param queue: queue used to deliver notifications asynchronously
+        :type queue: `NotificationQueue`
+        :param lazy: defer introspection of the bean class
+        :type lazy: `bool`
+        :param sampler: sampler recording the sampled properties of the bean
+        :type sampler: `Sampler`
+        '''
+        NotificationBroadcasterSupport.__init__(self)
+
+        self._bean = bean
+        self._queue = queue
+        self._sampler = sampler
+        self._lock = threading.Lock()
+
+        self._registered = False
+        self._registering = False
+        self._lazy = lazy
+        self._name = None
+
+        self._metadata = None
+        self._getters = None
+        self._invokers = None
+        self._loadMetadata()
+
+        self._logger = logging.getLogger('mbeanadapter')
+
+        self._sequence = AtomicLong()
+
+        # All (listener, filter, handback) registrations, and the set of
+        # notification types at least one of them might be interested in
+        self._listeners = ()
+        self._interested = frozenset()
+        self._listenerLock = threading.Lock()
+
+    # Public API
+    @synchronised_method
+    def register(self, name):
+        '''Register the bean in JMX using the given `name`
+
+        :param name: name to register the bean as
+        :type name: `str`
+        '''
+        if self._registered:
+            raise RuntimeError('Adapter already registered')
+
+        self._logger = logging.getLogger('mbeanadapter.%s' % name)
+
+        self._logger.debug('Registering adapter')
+
+        # Reject invalid names before any trigger is bound
+        object_name_ = object_name(name)
+
+        # Pick up the current class metadata, the class might have changed
+        # since this adapter was created
+        self._loadMetadata()
+        self._updateInterest()
+        self._bindTriggers()
+
+        self._name = object_name_
+        self._registering = self._lazy
+        try:
+            mbean_server().registerMBean(self, self._name)
+        except:
+            self._name = None
+            self._unbindTriggers()
+            raise
+        finally:
+            self._registering = False
+
+        self._registered = True
+        adapter_index.add(self)
+
+        if self._lazy:
+            self._metadata.prepare()
+
+        if self._sampler is not None:
+            self._sampler._track(self) #pylint: disable-msg=W0212
+
+    @synchronised_method
+    def unregister(self):
+        '''Unregister the bean from JMX'''
+        if not self._registered:
+            raise RuntimeError('Adapter not registered')
+
+        assert self._name
+
+        self._logger.debug('Unregistering adapter')
+
+        mbean_server().unregisterMBean(self._name)
+
+        adapter_index.remove(self)
+
+        if self._sampler is not None:
+            self._sampler._untrack(self) #pylint: disable-msg=W0212
+
+        self._unbindTriggers()
+
+        self._name = None
+        self._registered = False
+
+    name = property(operator.attrgetter('_name'),
+                    doc='``ObjectName`` the bean is registered as, if any')
+    registered = property(operator.attrgetter('_registered'),
+                          doc='Whether the bean is registered')
+
+    # Private stuff
+    def _loadMetadata(self):
+        '''Retrieve the (shared) `ClassMetadata` of the bean class'''
+        metadata = metadata_cache.get(self._bean.__class__,
+                                      self.DEFAULT_PROPERTY_TYPE,
+                                      self.DEFAULT_FUNCTION_RETURN_TYPE)
+
+        self._metadata = metadata
+        self._getters = metadata.getters
+        self._invokers = metadata.invokers
+
+    metadata = property(operator.attrgetter('_metadata'),
+                        doc='`ClassMetadata` of the bean class')
+    beaninfo = property(lambda s: s.metadata.beaninfo,
+                        doc='``MBeanInfo`` describing the MBean')
+    notificationinfo = property(lambda s: s.metadata.notificationinfo,
+                                doc='``MBeanNotificationInfo`` array ' \
+                                    'describing the notifications emitted ' \
+                                    'by the MBean')
+    source = property(lambda s: s.metadata.source,
+                      doc='Source of all notifications emitted by the MBean')
+
+    def _bindTriggers(self):
+        '''Bind all notification triggers of the bean to this adapter'''
+        triggers = self.metadata.triggers
+        if not triggers:
+            return
+
+        try:
+            dict_ = self._bean.__dict__
+        except AttributeError:
+            raise TypeError('Beans emitting notifications need a __dict__')
+
+        for name, _ in triggers:
+            bound = dict_.get(name)
+            if isinstance(bound, BoundNotificationTrigger) \
+               and bound.adapter is not self:
+                raise RuntimeError('Bean already bound to another adapter')
+
+        # Bind all triggers before installing any of them, so a failing one
+        # doesn't leave the others bound
+        bindings = []
+        try:
+            for name, trigger in triggers:
+                bindings.append((name, trigger.bind(self)))
+        except:
+            for _, bound in bindings:
+                bound.unbind()
+            raise
+
+        for name, bound in bindings:
+            previous = dict_.get(name)
+            if isinstance(previous, BoundNotificationTrigger):
+                previous.unbind()
+
+            dict_[name] = bound
+
+    def _unbindTriggers(self):
+        '''Remove all notification triggers bound to this adapter'''
+        dict_ = getattr(self._bean, '__dict__', {})
+
+        for name, _ in self.metadata.triggers:
+            bound = dict_.get(name)
+            if isinstance(bound, BoundNotificationTrigger) \
+               and bound.adapter is self:
+                bound.unbind()
+                del dict_[name]
+
+    def _nextId(self):
+        '''
+        Calculate and return a sequence number for notifications sent by the
+        MBean
+
+        :return: sequence ID
+        :rtype: ``number``
+        '''
+        return self._sequence.incrementAndGet()
+
+    def _updateInterest(self):
+        '''Recalculate the notification types listeners are interested in'''
+        self._listenerLock.acquire()
+        try:
+            listeners = self._listeners
+            self._interested = frozenset(
+                trigger.name for _, trigger in self.metadata.triggers
+                if any(filter_accepts(filter_, trigger.name)
+                       for _, filter_, _ in listeners))
+        finally:
+            self._listenerLock.release()
+
+    # DynamicMBean implementation
+    # These methods are on the hot path, so they don't log anything, see
+    # `TracingMBeanAdapter`
+    def getMBeanInfo(self):
+        '''Retrieve ``MBeanInfo`` for the bean
+
+        :return: ``MBeanInfo`` of the bean
+        :rtype: ``MBeanInfo``
+        '''
+        if self._registering:
+            return self._metadata.skeleton
+
+        return self._metadata.beaninfo
+
+    def getAttribute(self, name):
+        '''Get an attribute value from the bean
+
+        This is on the hot path of every JMX poller, so it only performs a
+        lookup in the attribute dispatch table of the bean class, and calls the
+        getter and coercer found there.
+
+        :param name: attribute to retrieve
+        :type name: `str`
+
+        :return: attribute value
+        :rtype: `object`
+        '''
+        try:
+            getter, coerce = self._getters[name]
+        except KeyError:
+            raise AttributeNotFoundException('No such attribute: %s' % name)
+
+        # Coerce before returning
+        return coerce(getter(self._bean))
+
+    def getAttributes(self, names):
+        '''Get multiple attributes at once
+
+        All names are resolved up front, unknown attributes are discarded.
+        Beans can make sure related values are read consistently:
+
+        ``__lock__``
+            A lock (any object with ``acquire`` and ``release`` methods), held
+            while all values are read
+        ``__snapshot__(names)``
+            A method returning a `dict` with the raw values of (some of) the
+            requested attributes, taken atomically by the bean. Values it
+            doesn't return are read through their getters.
+
+        Values are coerced after the lock is released.
+
+        :param names: attributes to retrieve
+        :type names: ``iterable<str>``
+
+        :return: requested attribute values, if available
+        :rtype: ``AttributeList``
+        '''
+        bean = self._bean
+        getters = self._getters
+        types = self._metadata.types
+
+        resolved = [(name, getters[name]) for name in names if name in getters]
+
+        # (name, value, coercer) tuples
+        values = []
+
+        lock = getattr(bean, '__lock__', None)
+        if lock is not None:
+            lock.acquire()
+        try:
+            snapshot = getattr(bean, '__snapshot__', None)
+            snapshot = snapshot([name for name, _ in resolved]) \
+                       if snapshot is not None else {}
+
+            for name, (getter, coerce) in resolved:
+                if name in snapshot:
+                    values.append((name, snapshot[name], types[name]))
+                else:
+                    values.append((name, getter(bean), coerce))
+        finally:
+            if lock is not None:
+                lock.release()
+
+        attributes = AttributeList(len(values))
+        for name, value, coerce in values:
+            attributes.add(Attribute(name, coerce(value)))
+
+        return attributes
+
+    def setAttribute(self, attribute):
+        '''Set the value of an attribute
+
+        :param attribute: attribute to set
+        :type attribute: ``Attribute``
+        '''
+        setattr(self._bean, attribute.name, attribute.value)
+
+    def setAttributes(self, attributes):
+        '''Set multiple attributes at once
+
+        :param attributes: attributes to set
+        :type attributes: ``iterable<Attribute>``
+        '''
+        map(self.setAttribute, attributes)
+
+    def invoke(self, name, args_, sig):
+        '''Invoke an operation on the bean
+
+        The operation is looked up by name and signature in the operation
+        dispatch table of the bean class. Clients passing no signature, or one
+        which doesn't match, can still call operations which aren't
+        overloaded for the given number of arguments. All arguments are
+        coerced into the types declared using `args` before calling the
+        method.
+
+        :param name: operation to invoke
+        :type name: `str`
+        :param args\_: arguments to pass to the method
+        :type args\_: ``iterable<object>``
+        :param sig: operation signature
+        :type sig: ``iterable<java.lang.String>``
+
+        :return: method call result
+        :rtype: `object`
+        '''
+        args_ = args_ or ()
+
+        invoker = self._invokers.get((name, tuple(sig or ())))
+        # Clients passing no signature hit the overload without arguments
+        if invoker is None or len(invoker[1]) != len(args_):
+            invoker = self._resolve(name, args_, sig)
+        fun, types_, return_type = invoker
+
+        try:
+            value = fun(self._bean, *[value if value is None else type_(value)
+                                      for type_, value in zip(types_, args_)])
+            # Coerce before returning
+            if return_type is java.lang.Void:
+                return
+            else:
+                return return_type(value)
+        except Exception, exc:
+            raise MBeanException(exc)
+
+    def _resolve(self, name, args_, sig):
+        '''Find the only overload of an operation taking the given number of
+        arguments
+
+        :return: ``(function, argument types, return type)`` invoker
+        :rtype: `tuple`
+        '''
+        candidates = [invoker
+                      for invoker in self._metadata.overloads.get(name, ())
+                      if len(invoker[1]) == len(args_)]
+
+        if len(candidates) != 1:
+            raise ReflectionException(java.lang.NoSuchMethodException(
+                '%s(%s)' % (name, ', '.join(sig or ()))))
+
+        return candidates[0]
+
+    # NotificationBroadcasterSupport
+    def addNotificationListener(self, listener, filter_, handback):
+        '''Add a listener for notifications emitted by the MBean
+
+        :param listener: listener to add
+        :type listener: ``NotificationListener``
+        :param filter\_: filter applied before calling the listener
+        :type filter\_: ``NotificationFilter``
+        :param handback: context passed to the listener
+        :type handback: `object`
+        '''
+        NotificationBroadcasterSupport.addNotificationListener(self, listener,
+                                                               filter_,
+                                                               handback)
+
+        self._listenerLock.acquire()
+        try:
+            self._listeners += ((listener, filter_, handback), )
+        finally:
+            self._listenerLock.release()
+
+        self._updateInterest()
+
+    def removeNotificationListener(self, listener, *args_):
+        '''Remove a listener for notifications emitted by the MBean
+
+        Either all registrations of `listener` are removed, or only the one
+        matching the given ``filter`` and ``handback`` arguments.
+
+        :param listener: listener to remove
+        :type listener: ``NotificationListener``
+        '''
+        NotificationBroadcasterSupport.removeNotificationListener(self,
+                                                                  listener,
+                                                                  *args_)
+
+        self._listenerLock.acquire()
+        try:
+            if not args_:
+                self._listeners = tuple(l for l in self._listeners
+                                        if l[0] != listener)
+            else:
+                listeners = list(self._listeners)
+                listeners.remove((listener, ) + tuple(args_))
+                self._listeners = tuple(listeners)
+        finally:
+            self._listenerLock.release()
+
+        self._updateInterest()
+
+    def getNotificationInfo(self):
+        '''Retrieve info of all notifications emitted by the MBean
+
+        :return: MBean notification info
+        :rtype: ``tuple<MBeanNotificationInfo>``
+        '''
+        return self._metadata.notificationinfo
+
+    def sendNotification(self, notification):
+        '''Emit a notification to all listeners
+
+        :param notification: Notification to emit
+        :type notification: ``Notification``
+        '''
+        queue = self._queue
+        if queue is None:
+            self._deliver(notification)
+        else:
+            queue._put(self, notification) #pylint: disable-msg=W0212
+
+    def _deliver(self, notification):
+        '''Deliver a notification to all listeners, on the current thread
+
+        :param notification: Notification to deliver
+        :type notification: ``Notification``
+        '''
+        NotificationBroadcasterSupport.sendNotification(self, notification)
+
+
+def test_get_attributes():
+    '''Test `MBeanAdapter.getAttributes` with a snapshot and lock hook'''
+    class Lock(object): #pylint: disable-msg=C0111
+        held = False
+        def acquire(self): #pylint: disable-msg=C0111
+            self.held = True
+        def release(self): #pylint: disable-msg=C0111
+            self.held = False
+
+    class C(object): #pylint: disable-msg=C0111
+        __lock__ = Lock()
+
+        def __snapshot__(self, names): #pylint: disable-msg=C0111
+            assert self.__lock__.held
+            return {'a': 1}
+
+        a = TypedProperty(java.lang.Integer, fget=lambda _: 0)
+        b = TypedProperty(java.lang.Integer,
+                          fget=lambda s: int(s.__lock__.held) + 1)
+
+    attributes = MBeanAdapter(C()).getAttributes(('a', 'b', 'unknown'))
+    assert [(a.name, a.value) for a in attributes] == [('a', 1), ('b', 2)]
+    assert not C.__lock__.held
+
+
+def test_invoke():
+    '''Test `MBeanAdapter.invoke` dispatch, overloads and coercion'''
+    class C(object): #pylint: disable-msg=C0111
+        @operation('add')
+        @returns(java.lang.Long)
+        @args(java.lang.Long, java.lang.Long)
+        def addNumbers(self, a, b): #pylint: disable-msg=C0111
+            return a + b
+
+        @operation('add')
+        @returns(java.lang.String)
+        @args(java.lang.String, (java.lang.String, 'Suffix'))
+        def addStrings(self, a, b): #pylint: disable-msg=C0111
+            return a + b
+
+        @operation('join')
+        @returns(java.lang.String)
+        @args(Array(java.lang.String))
+        def joinStrings(self, values): #pylint: disable-msg=C0111
+            return ','.join(values)
+
+        @operation('join')
+        @returns(java.lang.String)
+        @args(java.lang.String)
+        def joinString(self, value): #pylint: disable-msg=C0111
+            return value
+
+        def reset(self): #pylint: disable-msg=C0111
+            return 'ignored'
+
+    adapter = MBeanAdapter(C())
+    assert adapter.invoke('add', (1, 2),
+                          ('java.lang.Long', 'java.lang.Long')) == 3
+    assert adapter.invoke('add', (1, 2),
+                          ('java.lang.String', 'java.lang.String')) == '12'
+    assert adapter.invoke('reset', None, None) is None
+
+    # Signatures as sent by JMX proxies use binary class names
+    assert adapter.invoke('join', (('a', 'b'), ),
+                          ('[Ljava.lang.String;', )) == 'a,b'
+    assert adapter.invoke('join', ('a', ), ('java.lang.String', )) == 'a'
+
+    for name, args_ in (('add', (1, 2)), ('unknown', ()), ('reset', (1, ))):
+        try:
+            adapter.invoke(name, args_, None)
+        except ReflectionException:
+            pass
+        else:
+            assert False, 'ReflectionException not raised'
+
+    assert sorted(info.name for info in adapter.beaninfo.operations) == \
+        ['add', 'add', 'join', 'join', 'reset']
+    assert '[Ljava.lang.String;' in [parameter.type for info
+                                     in adapter.beaninfo.operations
+                                     for parameter in info.signature]
+
+
+def test_async_invoke():
+    '''Test `MBeanAdapter.invoke` of asynchronous operations'''
+    executor = OperationExecutor(pool_size=1)
+    done = ArrayBlockingQueue(1)
+
+    class C(object): #pylint: disable-msg=C0111
+        @async_operation(executor)
+        @returns(java.lang.String)
+        def reindex(self): #pylint: disable-msg=C0111
+            done.put(True)
+            return 'reindexed'
+
+    adapter = MBeanAdapter(C())
+    assert 'reindex.completed' in adapter.notificationinfo[0].notifTypes
+    assert [op.returnType for op in adapter.beaninfo.operations] == \
+        ['java.lang.Long']
+
+    job = adapter.invoke('reindex', None, None)
+    assert done.poll(5, TimeUnit.SECONDS)
+    assert executor.getJobStatus(job) in (Job.RUNNING, Job.COMPLETED)
+
+
+class MemberStats(object):
+    '''Access statistics of a single member of an MBean'''
+    __slots__ = '_calls', '_errors', '_histogram',
+
+    def __init__(self):
+        self._calls = adder()
+        self._errors = adder()
+        self._histogram = HistogramValue(scale=1e-6)
+
+    def record(self, nanos, failed=False):
+        '''Record an access
+
+        :param nanos: duration of the access, in nanoseconds
+        :type nanos: `long`
+        :param failed: whether the access raised an exception
+        :type failed: `bool`
+        '''
+        self._calls.increment()
+        if failed:
+            self._errors.increment()
+        self._histogram.update(nanos)
+
+    calls = property(lambda s: s._calls.sum(), doc='Number of accesses')
+    errors = property(lambda s: s._errors.sum(), doc='Number of failures')
+    histogram = property(operator.attrgetter('_histogram'),
+                         doc='Distribution of durations, in milliseconds')
+
+
+class AccessStats(object):
+    '''Statistics of all JMX accesses of instrumented adapters
+
+    Every `InstrumentedMBeanAdapter` records the number of calls, failures and
+    the duration of its ``getAttribute``, ``getAttributes``,
+    ``setAttribute``, ``invoke`` and ``sendNotification`` calls, per member.
+    The statistics are published by registering the `access_stats` instance
+    as `OBJECT_NAME`, which is done when the first instrumented adapter is
+    registered.
+    '''
+    OBJECT_NAME = 'JythonMX:type=Stats'
+
+    _MEMBERS = Tabular(Composite('MemberStats', (
+        ('bean', java.lang.String, 'ObjectName of the bean'),
+        ('kind', java.lang.String, 'Kind of access'),
+        ('member', java.lang.String,
+         'Attribute, operation or notification type'),
+        ('calls', java.lang.Long, 'Number of accesses'),
+        ('errors', java.lang.Long, 'Number of failed accesses'),
+        ('meanTime', java.lang.Double, 'Mean duration in ms'),
+        ('p50Time', java.lang.Double, 'Median duration in ms'),
+        ('p95Time', java.lang.Double, '95th percentile duration in ms'),
+        ('p99Time', java.lang.Double, '99th percentile duration in ms'),
+        ('maxTime', java.lang.Double, 'Maximum duration in ms'),
+    )), ('bean', 'kind', 'member'))
+
+    def __init__(self):
+        # Canonical bean name to {(kind, member): MemberStats} mapping
+        self._beans = {}
+        self._lock = threading.Lock()
+        self._adapter = None
+
+    def _statsOf(self, name):
+        '''Retrieve the statistics of all members of a bean, publishing the
+        statistics MBean if required
+
+        :param name: name of the bean
+        :type name: ``ObjectName``
+
+        :return: mapping of ``(kind, member)`` pairs to `MemberStats`
+        :rtype: `dict`
+        '''
+        self._lock.acquire()
+        try:
+            if self._adapter is None:
+                adapter = MBeanAdapter(self)
+                adapter.register(self.OBJECT_NAME)
+                self._adapter = adapter
+
+            return self._beans.setdefault(name.getCanonicalName(), {})
+        finally:
+            self._lock.release()
+
+    def _drop(self, name):
+        '''Discard the statistics of a bean'''
+        self._beans.pop(name.getCanonicalName(), None)
+
+    def _rows(self):
+        '''Calculate the rows of the `members` table'''
+        for bean, members in self._beans.items():
+            for (kind, member), stats in members.items():
+                snapshot = stats.histogram.snapshot()
+                yield (bean, kind, member, stats.calls, stats.errors,
+                       snapshot.mean, snapshot.percentile(0.5),
+                       snapshot.percentile(0.95), snapshot.percentile(0.99),
+                       snapshot.max)
+
+    def reset(self):
+        '''Reset the statistics of all beans'''
+        for members in self._beans.values():
+            members.clear()
+
+    beans = TypedProperty(java.lang.Integer, fget=lambda s: len(s._beans),
+                          doc='Number of instrumented beans')
+    calls = TypedProperty(java.lang.Long,
+                          fget=lambda s: sum(stats.calls
+                                             for members in s._beans.values()
+                                             for stats in members.values()),
+                          doc='Total number of accesses')
+    errors = TypedProperty(java.lang.Long,
+                           fget=lambda s: sum(stats.errors
+                                              for members in s._beans.values()
+                                              for stats in members.values()),
+                           doc='Total number of failed accesses')
+    members = TypedProperty(_MEMBERS, fget=lambda s: list(s._rows()),
+                            doc='Statistics per bean and member')
+
+
+# Statistics of all instrumented adapters
+access_stats = AccessStats()
+
+
+def _instrumented(base):
+    '''Extend the adapter class `base`, recording statistics of all JMX
+    accesses in `access_stats`
+
+    :param base: adapter class to extend
+    :type base: `type`
+
+    :return: instrumented adapter class
+    :rtype: `type`
+    '''
+    def timed(kind, fun, member):
+        '''Create a method recording the statistics of calls of `fun`
+
+        :param kind: kind of access
+        :type kind: `str`
+        :param fun: method to instrument
+        :type fun: `callable`
+        :param member: function calculating the member accessed, given the
+                       call arguments
+        :type member: `callable`
+
+        :return: instrumented method
+        :rtype: `callable`
+        '''
+        def _wrapped(self, *args_): #pylint: disable-msg=C0111
+            start = java.lang.System.nanoTime()
+            try:
+                result = fun(self, *args_)
+            except:
+                self._record(kind, member(*args_), start, True)
+                raise
+
+            self._record(kind, member(*args_), start, False)
+            return result
+
+        _wrapped.__name__ = fun.__name__
+        _wrapped.__doc__ = fun.__doc__
+
+        return _wrapped
+
+    class InstrumentedMBeanAdapter(base):
+        '''An `MBeanAdapter` recording statistics of all JMX accesses in
+        `access_stats`
+
+        Instrumentation is opted into through `adapter_class`, so
+        `MBeanAdapter` itself doesn't pay for it.
+        '''
+        __slots__ = '_stats',
+
+        def __init__(self, bean, *args_, **kwargs):
+            base.__init__(self, bean, *args_, **kwargs)
+            self._stats = {}
+
+        def register(self, name):
+            '''Register the bean in JMX using the given `name`, and start
+            recording statistics
+
+            :param name: name to register the bean as
+            :type name: `str`
+            '''
+            base.register(self, name)
+            #pylint: disable-msg=W0212
+            self._stats = access_stats._statsOf(self.name)
+
+        def unregister(self):
+            '''Unregister the bean from JMX, discarding its statistics'''
+            name = self.name
+            base.unregister(self)
+            access_stats._drop(name) #pylint: disable-msg=W0212
+            self._stats = {}
+
+        def _record(self, kind, member, start, failed):
+            '''Record an access which started at `start`'''
+            nanos = java.lang.System.nanoTime() - start
+
+            key = kind, member
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats.setdefault(key, MemberStats())
+
+            stats.record(nanos, failed)
+
+        getAttribute = timed('getAttribute', base.getAttribute, identity)
+        getAttributes = timed('getAttributes', base.getAttributes,
+                              lambda _: '*')
+        setAttribute = timed('setAttribute', base.setAttribute,
+                             lambda attribute: attribute.name)
+        invoke = timed('invoke', base.invoke, lambda name, *_: name)
+        sendNotification = timed('sendNotification', base.sendNotification,
+                                 lambda notification: notification.type)
+
+    return InstrumentedMBeanAdapter
+
+def _traced(base):
+    '''Extend the adapter class `base`, logging all calls made by JMX, and all
+    exceptions they raise
+
+    :param base: adapter class to extend
+    :type base: `type`
+
+    :return: tracing adapter class
+    :rtype: `type`
+    '''
+    def traced(fun):
+        '''Create a method tracing calls of `fun`, and logging exceptions
+
+        :param fun: method to trace
+        :type fun: `callable`
+
+        :return: traced method
+        :rtype: `callable`
+        '''
+        name = fun.__name__
+
+        def _wrapped(self, *args_): #pylint: disable-msg=C0111
+            if self._tracing:
+                self._logger.debug('%s%r', name, args_)
+
+            try:
+                return fun(self, *args_)
+            except:
+                self._logger.exception('Error executing %s', name)
+                raise
+
+        _wrapped.__name__ = name
+        _wrapped.__doc__ = fun.__doc__
+
+        return _wrapped
+
+    class TracingMBeanAdapter(base):
+        '''An `MBeanAdapter` logging all calls made by JMX, and all
+        exceptions they raise
+
+        The Java JMX subsystem swallows most exceptions raised by MBeans,
+        which makes debugging rather hard. This adapter logs every exception
+        raised by its ``DynamicMBean`` and notification methods, and traces
+        all calls at ``DEBUG`` level. Whether the logger is enabled for
+        ``DEBUG`` is checked once, when the adapter is created or registered,
+        not on every call.
+
+        Tracing is opted into through `adapter_class`, so `MBeanAdapter`
+        itself doesn't log anything on these paths.
+        '''
+        __slots__ = '_tracing',
+
+        def __init__(self, bean, *args_, **kwargs):
+            base.__init__(self, bean, *args_, **kwargs)
+            self._tracing = self._logger.isEnabledFor(logging.DEBUG)
+
+        def register(self, name):
+            '''Register the bean in JMX using the given `name`
 
-        :param bean: instance to expose on JMX
-        :type bean: `object`
-        '''
-        NotificationBroadcasterSupport.__init__(self)
+            :param name: name to register the bean as
+            :type name: `str`
+            '''
+            base.register(self, name)
+            self._tracing = self._logger.isEnabledFor(logging.DEBUG)
 
-        self._bean = bean
+        tracing = property(operator.attrgetter('_tracing'),
+                           doc='Whether calls are traced at ``DEBUG`` level')
 
-        self._registered = False
-        self._name = None
-        self._beaninfo = None
-        self._notificationinfo = None
+        getMBeanInfo = traced(base.getMBeanInfo)
+        getAttribute = traced(base.getAttribute)
+        getAttributes = traced(base.getAttributes)
+        setAttribute = traced(base.setAttribute)
+        setAttributes = traced(base.setAttributes)
+        invoke = traced(base.invoke)
+        getNotificationInfo = traced(base.getNotificationInfo)
+        sendNotification = traced(base.sendNotification)
 
-        self._logger = logging.getLogger('mbeanadapter')
+    return TracingMBeanAdapter
 
-        self._currentId = 0
 
-    # Public API
-    @synchronised
-    def register(self, name):
-        '''Register the bean in JMX using the given `name`
+def _versioned(base):
+    '''Extend the adapter class `base`, tracking a version of every attribute
+    so pollers can only retrieve the values which changed since their
+    previous poll
 
-        :param name: name to register the bean as
-        :type name: `str`
+    :param base: adapter class to extend
+    :type base: `type`
+
+    :return: versioned adapter class
+    :rtype: `type`
+    '''
+    class VersionedMBeanAdapter(base):
+        '''An `MBeanAdapter` tracking a version of every attribute, so
+        pollers can only retrieve the values which changed since their
+        previous poll
+
+        The adapter keeps a version clock, and clients poll using the
+        ``getChangedAttributes`` operation::
+
+            result = connection.invoke(name, 'getChangedAttributes',
+                                       [version], ['long'])
+            version = result['version']
+            changed = result['attributes']
+
+        Passing version 0 returns all attributes. Only the changed values
+        cross the wire, and a single call replaces one ``getAttribute`` call
+        per attribute.
+
+        Attributes of `Counter` and `Gauge` metrics and of `tracked`
+        `TypedProperty` members count their updates, per bean: they're only
+        read again once that count moved. Any other attribute is read on every
+        poll. Either way, an attribute only gets a new version when its value
+        differs from the previous poll.
+
+        Versioning is opted into through `adapter_class`, so `MBeanAdapter`
+        itself doesn't pay for it.
         '''
-        if self._registered:
-            raise RuntimeError('Adapter already registered')
+        __slots__ = '_clock', '_versions', '_versionLock',
+
+        # Name of the operation listing changed attributes
+        CHANGED_ATTRIBUTES = 'getChangedAttributes'
+
+        # ClassMetadata to MBeanInfo mapping, shared by all adapters
+        _beaninfos = {}
+
+        def __init__(self, bean, *args_, **kwargs):
+            base.__init__(self, bean, *args_, **kwargs)
+            self._clock = AtomicLong()
+            # Attribute name to (version, change count, value) mapping
+            self._versions = {}
+            self._versionLock = threading.Lock()
+
+        def _loadMetadata(self):
+            '''Retrieve the (shared) `ClassMetadata` of the bean class'''
+            base._loadMetadata(self)
+
+            if self.CHANGED_ATTRIBUTES in self._metadata.overloads:
+                raise TypeError('Operation name %s is reserved' % \
+                                self.CHANGED_ATTRIBUTES)
+
+        def _versionedBeaninfo(self):
+            '''Calculate the ``MBeanInfo`` of the bean, including the
+            ``getChangedAttributes`` operation'''
+            metadata = self._metadata
+
+            beaninfo = self._beaninfos.get(metadata)
+            if beaninfo is None:
+                info = metadata.beaninfo
+                operation = MBeanOperationInfo(
+                                self.CHANGED_ATTRIBUTES,
+                                'List the attributes changed since a ' \
+                                'version, and the current version',
+                                (MBeanParameterInfo('since',
+                                                    classname(java.lang.Long),
+                                                    'Version of the ' \
+                                                    'previous poll, or 0'), ),
+                                classname(java.util.Map),
+                                MBeanOperationInfo.INFO)
+                beaninfo = MBeanInfo(info.className, info.description,
+                                     info.attributes, info.constructors,
+                                     tuple(info.operations) + (operation, ),
+                                     info.notifications)
+                beaninfo = self._beaninfos.setdefault(metadata, beaninfo)
+
+            return beaninfo
+
+        beaninfo = property(_versionedBeaninfo,
+                            doc='``MBeanInfo`` describing the MBean')
+        version = property(lambda s: s._clock.get(),
+                           doc='Current version of the attributes')
+
+        def getMBeanInfo(self):
+            '''Retrieve ``MBeanInfo`` for the bean
+
+            :return: ``MBeanInfo`` of the bean
+            :rtype: ``MBeanInfo``
+            '''
+            if self._registering:
+                return self._metadata.skeleton
 
-        self._logger = logging.getLogger('mbeanadapter.%s' % name)
+            return self._versionedBeaninfo()
 
-        self._logger.debug('Registering adapter')
+        def getChangedAttributes(self, since):
+            '''List all attributes changed since version `since`
 
-        server = ManagementFactory.getPlatformMBeanServer()
-        self._name = ObjectName(name)
-        server.registerMBean(self, self._name)
+            :param since: version returned by the previous call, or 0
+            :type since: `long`
 
-        self._registered = True
+            :return: mapping of ``version`` to the current version, and of
+                     ``attributes`` to an ``AttributeList`` of the changed
+                     values
+            :rtype: ``java.util.Map``
+            '''
+            since = long(since or 0)
+            bean = self._bean
+            counters = self._metadata.changes
 
-    @synchronised
-    def unregister(self):
-        '''Unregister the bean from JMX'''
-        if not self._registered:
-            raise RuntimeError('Adapter not registered')
+            changed = AttributeList()
 
-        assert self._name
+            self._versionLock.acquire()
+            try:
+                previous = self._versions
+                # Rebuilt on every poll, dropping attributes which disappeared
+                versions = {}
+
+                # Only read tracked attributes whose change count moved
+                unread = []
+                counts = {}
+                for name in self._getters:
+                    counter = counters.get(name)
+                    recorded = previous.get(name)
+                    if counter is not None:
+                        count = counts[name] = counter(bean)
+                        if recorded is not None and recorded[1] == count:
+                            versions[name] = recorded
+                            continue
+
+                    unread.append(name)
+
+                read = frozenset(unread)
+                for attribute in self.getAttributes(unread):
+                    name, value = attribute.name, attribute.value
+
+                    recorded = previous.get(name)
+                    if recorded is None or recorded[2] != value:
+                        version = self._clock.incrementAndGet()
+                    else:
+                        version = recorded[0]
+
+                    versions[name] = version, counts.get(name), value
+                    if version > since:
+                        changed.add(attribute)
+
+                # Tracked attributes which weren't read didn't change since
+                # the previous poll, but clients might be further behind
+                for name, (version, _, value) in versions.iteritems():
+                    if since < version and name not in read:
+                        changed.add(Attribute(name, value))
+
+                self._versions = versions
+                version = self._clock.get()
+            finally:
+                self._versionLock.release()
+
+            result = java.util.HashMap()
+            result.put('version', java.lang.Long(version))
+            result.put('attributes', changed)
+
+            return result
+
+        def invoke(self, name, args_, sig):
+            '''Invoke an operation on the bean, or ``getChangedAttributes``
+
+            :param name: operation to invoke
+            :type name: `str`
+            :param args\_: arguments to pass to the method
+            :type args\_: ``iterable<object>``
+            :param sig: operation signature
+            :type sig: ``iterable<java.lang.String>``
+
+            :return: method call result
+            :rtype: `object`
+            '''
+            if name != self.CHANGED_ATTRIBUTES:
+                return base.invoke(self, name, args_, sig)
 
-        self._logger.debug('Unregistering adapter')
+            if len(args_ or ()) != 1:
+                raise ReflectionException(java.lang.NoSuchMethodException(
+                    '%s(%s)' % (name, ', '.join(sig or ()))))
 
-        server = ManagementFactory.getPlatformMBeanServer()
-        server.unregisterMBean(self._name)
+            return self.getChangedAttributes(args_[0])
 
-        self._name = None
-        self._registered = False
+    return VersionedMBeanAdapter
 
-    # Private stuff
-    @property
-    @synchronised
-    @logged
-    def beaninfo(self): #pylint: disable-msg=R0912
-        '''Calculate the ``MBeanInfo`` of the bean
 
-        :return: ``MBeanInfo`` object describing the MBean
-        :rtype: ``MBeanInfo``
-        '''
-        # Short path
-        if self._beaninfo:
-            return self._beaninfo
+# Mode flags to adapter class mapping
+_adapter_classes = {}
 
-        self._logger.debug('Inspecting MBean')
-
-        def attributes():
-            '''Calculate and list all attributes exposed on the MBean'''
-            cls = self._bean.__class__
-
-            # List all properties found on the bean type
-            for name, attr in filter(lambda (_, a): isinstance(a, property),
-                                     list_attributes(cls)):
-                # Calculate property value type
-                type_ = attr.type if isinstance(attr, TypedProperty) \
-                                  else self.DEFAULT_PROPERTY_TYPE
-
-                yield MBeanAttributeInfo(name, classname(type_),
-                                         format_docstring(attr.__doc__ or ''),
-                                         callable(attr.fget),
-                                         callable(attr.fset), False)
-
-        def operations():
-            '''Calculate and list all methods exposed on the MBean'''
-            cls = self._bean.__class__
-
-            # List all callable attributes found on the bean type
-            for name, attr in filter(lambda (_, a): callable(a),
-                                     list_attributes(cls)):
-                # If it's a NotificationTrigger, skip
-                if isinstance(attr, NotificationTrigger):
-                    continue
+def adapter_class(trace=False, instrument=False, versioned=False):
+    '''Retrieve the adapter class supporting the given modes
 
-                # Make sure it's a method
-                if not isinstance(attr, types.MethodType):
-                    raise TypeError('MBean methods can\'t be staticmethods')
-
-                # Make sure it's not a classmethod
-                if attr.im_self:
-                    raise TypeError('MBean methods can\'t have classmethods')
-
-                # Make sure it has no *args, **kwargs or argument defaults
-                spec = inspect.getargspec(attr)
-                if spec[1:] != (None, None, None):
-                    raise TypeError('MBean methods can\'t have *args, ' \
-                                    '**kwargs or defaults')
-
-                # Make sure an @args decorator is used, if the method takes any
-                # arguments (next to self)
-                names = spec[0]
-                if len(names[1:]) > 0 and not hasattr(attr, '__args__'):
-                    raise TypeError('No @args definition on method %s' % name)
-
-                # Calculate the method return type (string)
-                return_type = classname(getattr(attr, '__returns__',
-                                            self.DEFAULT_FUNCTION_RETURN_TYPE))
-
-                def args_():
-                    '''List all method parameters taken by the method'''
-                    # Check whether this is a zero-argument method
-                    if not hasattr(attr, '__args__'):
-                        assert len(names[1:]) == 0
-                        return
-
-                    arg_types = attr.__args__
-
-                    # Validate number of argument type definitions
-                    if len(names[1:]) != len(arg_types):
-                        raise ValueError(
-                            'Invalid number of argument definitions')
-
-                    # Loop through all arguments and their type definition
-                    for name, type_ in zip(names[1:], arg_types):
-                        # Figure out type and docstring, if given
-                        if isinstance(type_, type):
-                            type_, doc = type_, None
-                        else:
-                            type_, doc = type_
-
-                        # Yield the parameter info for the current parameter
-                        yield MBeanParameterInfo(name, classname(type_), doc)
-
-                # Yield method info for the current method
-                # All methods are ACTIONs for now.
-                yield MBeanOperationInfo(attr.__name__,
-                                         format_docstring(attr.__doc__ or ''),
-                                         tuple(args_()), return_type,
-                                         MBeanOperationInfo.ACTION)
-
-        # Calculate and store MBeanInfo
-        self._beaninfo = MBeanInfo(classname(self._bean.__class__),
-                                   format_docstring(
-                                       self._bean.__class__.__doc__ or ''),
-                                   tuple(attributes()), None,
-                                   tuple(operations()), self.notificationinfo)
-
-        return self._beaninfo
-
-    @property
-    @logged
-    @synchronised
-    def notificationinfo(self):
-        '''Calculate the ``MBeanNotificationInfo`` of the bean
+    `MBeanAdapter` itself only performs the work required to serve JMX: it
+    neither logs exceptions raised by the bean, nor traces calls, nor records
+    statistics. Every mode adds a layer of wrappers around the methods of the
+    plain adapter, so only adapters using a mode pay for it, and any modes can
+    be combined:
 
-        :return: ``MBeanNotificationInfo`` array describing the notifications
-                 emitted by the MBean
-        :rtype: ``tuple<MBeanNotificationInfo>``
-        '''
-        # Short path
-        if self._notificationinfo:
-            return self._notificationinfo
+    `trace`
+        Log all exceptions raised by the bean, and trace all calls if the
+        adapter logger is enabled for ``DEBUG``
+    `instrument`
+        Record statistics of all JMX accesses in `access_stats`
+    `versioned`
+        Track a version of every attribute, and serve the attributes changed
+        since a version through the ``getChangedAttributes`` operation
 
-        def notifications():
-            '''Calculate and list all notifications exposed on the MBean'''
-            cls = self._bean.__class__
+    Tracing is the outermost layer, so it also logs exceptions raised by the
+    other ones. Classes are created once per combination of modes.
 
-            # List all callable attributes found on the bean type
-            for _, attr in filter(
-                    lambda (_, a): isinstance(a, NotificationTrigger),
-                    list_attributes(cls)):
-                attr.sendNotification = self.sendNotification
-                attr.nextId = self._nextId
-                attr.source = self._bean.__class__.__name__
+    Example:
 
-                yield attr.name
+    >>> registry = MBeanRegistry(factory=adapter_class(trace=True,
+    ...                                                 instrument=True))
 
-        self._logger.debug('Calculating notifications info')
+    :param trace: log exceptions and trace calls
+    :type trace: `bool`
+    :param instrument: record access statistics
+    :type instrument: `bool`
+    :param versioned: track attribute versions
+    :type versioned: `bool`
 
-        notificationinfo = MBeanNotificationInfo(tuple(notifications()),
-                                   classname(Notification),
-                                   'Notifications emitted through JythonMX')
+    :return: adapter class
+    :rtype: `type`
+    '''
+    key = bool(trace), bool(instrument), bool(versioned)
 
-        self._notificationinfo = (notificationinfo, )
-        return self._notificationinfo
+    cls = _adapter_classes.get(key)
+    if cls is None:
+        cls = MBeanAdapter
+        if versioned:
+            cls = _versioned(cls)
+        if instrument:
+            cls = _instrumented(cls)
+        if trace:
+            cls = _traced(cls)
 
-    @synchronised
-    def _nextId(self):
-        '''
-        Calculate and return a sequence number for notifications sent by the
-        MBean
+        cls = _adapter_classes.setdefault(key, cls)
 
-        :return: sequence ID
-        :rtype: ``number``
+    return cls
+
+InstrumentedMBeanAdapter = adapter_class(instrument=True)
+TracingMBeanAdapter = adapter_class(trace=True)
+VersionedMBeanAdapter = adapter_class(versioned=True)
+
+def test_instrumented_mbean_adapter():
+    '''Test `InstrumentedMBeanAdapter` statistics'''
+    class C(object): #pylint: disable-msg=C0111
+        value = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+
+        def fail(self): #pylint: disable-msg=C0111
+            raise RuntimeError('Failure')
+
+    adapter = InstrumentedMBeanAdapter(C())
+    adapter.register('JythonMXTest:type=Instrumented')
+    try:
+        assert mbean_server().isRegistered(
+                   object_name(AccessStats.OBJECT_NAME))
+
+        adapter.getAttribute('value')
+        adapter.getAttribute('value')
+        adapter.getAttributes(['value'])
+        try:
+            adapter.invoke('fail', [], [])
+        except MBeanException:
+            pass
+
+        #pylint: disable-msg=W0212
+        stats = adapter._stats
+        assert stats['getAttribute', 'value'].calls == 2
+        assert stats['getAttributes', '*'].calls == 1
+        assert stats['invoke', 'fail'].errors == 1
+
+        rows = [row for row in access_stats._rows()
+                if row[0] == adapter.name.getCanonicalName()]
+        assert len(rows) == 3
+    finally:
+        adapter.unregister()
+
+    assert not [row for row in access_stats._rows()
+                if row[0] == 'JythonMXTest:type=Instrumented']
+
+
+def test_tracing_mbean_adapter():
+    '''Test `TracingMBeanAdapter` logging'''
+    class C(object): #pylint: disable-msg=C0111
+        value = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+        broken = TypedProperty(java.lang.Integer, fget=lambda _: 1 / 0)
+
+    records = []
+    class Handler(logging.Handler): #pylint: disable-msg=C0111
+        def emit(self, record): #pylint: disable-msg=C0111
+            records.append(record)
+
+    logger = logging.getLogger('mbeanadapter')
+    handler = Handler()
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        adapter = TracingMBeanAdapter(C())
+        assert adapter.tracing
+        assert adapter.getAttribute('value') == 1
+        try:
+            adapter.getAttribute('unknown')
+        except AttributeNotFoundException:
+            pass
+
+        assert [r.levelno for r in records] == [logging.DEBUG] * 2 + \
+                                               [logging.ERROR]
+
+        logger.setLevel(logging.INFO)
+        del records[:]
+        adapter = TracingMBeanAdapter(C())
+        assert not adapter.tracing
+        adapter.getAttribute('value')
+        assert not records
+
+        # Exceptions raised by the bean are logged once
+        try:
+            adapter.getAttribute('broken')
+        except ZeroDivisionError:
+            pass
+        else:
+            assert False, 'ZeroDivisionError not raised'
+        assert [r.levelno for r in records] == [logging.ERROR]
+
+        del records[:]
+        try:
+            MBeanAdapter(C()).getAttribute('broken')
+        except ZeroDivisionError:
+            pass
+        assert not records
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+
+def test_adapter_class():
+    '''Test combining adapter modes using `adapter_class`'''
+    class C(object): #pylint: disable-msg=C0111
+        value = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+
+    assert adapter_class() is MBeanAdapter
+    assert adapter_class(trace=True) is TracingMBeanAdapter
+
+    cls = adapter_class(trace=True, instrument=True)
+    assert cls is adapter_class(instrument=True, trace=True)
+    assert issubclass(cls, MBeanAdapter)
+
+    adapter = cls(C())
+    adapter.register('JythonMXTest:type=Combined')
+    try:
+        assert adapter.getAttribute('value') == 1
+        try:
+            adapter.getAttribute('unknown')
+        except AttributeNotFoundException:
+            pass
+
+        #pylint: disable-msg=W0212
+        assert adapter._stats['getAttribute', 'value'].calls == 1
+        assert adapter._stats['getAttribute', 'unknown'].errors == 1
+        assert adapter.tracing == adapter._logger.isEnabledFor(logging.DEBUG)
+    finally:
+        adapter.unregister()
+
+
+def test_versioned_mbean_adapter():
+    '''Test `VersionedMBeanAdapter` delta reads'''
+    reads = []
+
+    class C(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self._i = 1
+            self.s = 'a'
+
+        def _getI(self): #pylint: disable-msg=C0111
+            reads.append('i')
+            return self._i
+
+        i = TypedProperty(java.lang.Integer, fget=_getI,
+                          fset=attrsetter('_i'), tracked=True)
+        label = TypedProperty(java.lang.String, fget=lambda s: s.s)
+        requests = Counter()
+
+    bean = C()
+    adapter = VersionedMBeanAdapter(bean)
+    assert adapter_class(versioned=True) is VersionedMBeanAdapter
+
+    def changed(since): #pylint: disable-msg=C0111
+        result = adapter.invoke('getChangedAttributes', [since], ['long'])
+        return result.get('version'), \
+               dict((a.name, a.value) for a in result.get('attributes'))
+
+    version, values = changed(0)
+    assert values == {'i': 1, 'label': 'a', 'requests': 0}
+    assert version == adapter.version
+    assert reads == ['i']
+
+    # Tracked attributes aren't read again until they change
+    assert changed(version) == (version, {})
+    assert reads == ['i']
+
+    bean.requests.inc()
+    bean.s = 'b'
+    version, values = changed(version)
+    assert values == {'label': 'b', 'requests': 1}
+
+    adapter.setAttribute(Attribute('i', 5))
+    version, values = changed(version)
+    assert values == {'i': 5}
+    assert reads == ['i', 'i']
+
+    # Updates which didn't change the value aren't reported
+    bean.requests.inc()
+    bean.requests.dec()
+    assert changed(version) == (version, {})
+
+    # Counts are kept per bean
+    other = C()
+    other.i = 2
+    assert changed(version) == (version, {})
+    assert reads == ['i', 'i']
+
+    assert changed(version)[1] == {}
+    assert changed(0)[1] == {'i': 5, 'label': 'b', 'requests': 1}
+
+    assert 'getChangedAttributes' in [op.name for op
+                                      in adapter.getMBeanInfo().operations]
+
+
+def batched(iterable, size):
+    '''Split an iterable in lists of at most `size` items
+
+    :param iterable: items to split
+    :type iterable: ``iterable``
+    :param size: maximum number of items per batch
+    :type size: `int`
+
+    :return: all batches
+    :rtype: ``iterable<list>``
+    '''
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def test_batched():
+    '''Test `batched`'''
+    assert list(batched(xrange(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched((), 2)) == []
+
+
+class RegistrationJob(object):
+    '''Progress and outcome of a bulk (un)registration by an `MBeanRegistry`'''
+    __slots__ = '_processed', '_failures', '_done',
+
+    def __init__(self):
+        self._processed = 0
+        self._failures = []
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        '''Wait until the job is done
+
+        :param timeout: maximum number of seconds to wait
+        :type timeout: `float`
+
+        :return: whether the job is done
+        :rtype: `bool`
         '''
-        self._currentId += 1
-        return self._currentId
+        self._done.wait(timeout)
+        return self._done.isSet()
 
-    # DynamicMBean implementation
-    @logged
-    def getMBeanInfo(self):
-        '''Retrieve ``MBeanInfo`` for the bean
+    processed = property(operator.attrgetter('_processed'),
+                         doc='Number of beans processed so far')
+    failures = property(lambda s: list(s._failures),
+                        doc='``(name, exception)`` pairs of all failures')
+    done = property(lambda s: s._done.isSet(), doc='Whether the job is done')
 
-        :return: ``MBeanInfo`` of the bean
-        :rtype: ``MBeanInfo``
+
+class MBeanRegistry(object):
+    '''Registers and unregisters large numbers of beans
+
+    The registry keeps track of all adapters registered through it, so all of
+    them can be unregistered at once, e.g. on shutdown. Bulk operations work in
+    batches, reporting progress after every batch, and can run on a background
+    thread. Failures don't abort a bulk operation, they're collected in its
+    `RegistrationJob`.
+    '''
+    def __init__(self, batch_size=1000, factory=None):
+        '''Initialize a new `MBeanRegistry`
+
+        :param batch_size: number of beans processed per batch
+        :type batch_size: `int`
+        :param factory: callable creating an adapter for a bean, `MBeanAdapter`
+                        by default
+        :type factory: `callable`
         '''
-        self._logger.debug('MBean info requested')
+        self._batchSize = batch_size
+        self._factory = factory or MBeanAdapter
 
-        return self.beaninfo
+        self._adapters = {}
+        self._lock = threading.Lock()
 
-    @logged
-    def getAttribute(self, name):
-        '''Get an attribute value from the bean
+        self._logger = logging.getLogger('mbeanadapter.registry')
 
-        :param name: attribute to retrieve
+    def register(self, name, bean):
+        '''Register a single bean
+
+        :param name: name to register the bean as
         :type name: `str`
+        :param bean: bean, or adapter, to register
+        :type bean: `object`
 
-        :return: attribute value
-        :rtype: `object`
+        :return: adapter of the bean
+        :rtype: `MBeanAdapter`
         '''
-        self._logger.debug('Attribute requested: %s', name)
+        adapter = bean if isinstance(bean, MBeanAdapter) \
+                       else self._factory(bean)
+        adapter.register(name)
 
-        if not hasattr(self._bean, name):
-            self._logger.exception('Attribute not found')
-            raise AttributeNotFoundException('No such attribute: %s' % name)
+        self._lock.acquire()
+        try:
+            self._adapters[adapter.name] = adapter
+        finally:
+            self._lock.release()
 
-        # Calculate attribute type
-        type_ = self.DEFAULT_PROPERTY_TYPE
-        if hasattr(self._bean.__class__, name):
-            # Override the default if the property is a TypedProperty
-            property_ = getattr(self._bean.__class__, name)
-            if isinstance(property_, TypedProperty):
-                type_ = property_.type
+        return adapter
 
-        # Retrieve attribute value
-        value = getattr(self._bean, name)
+    def unregister(self, name):
+        '''Unregister a single bean registered through this registry
 
-        # Coerce before returning
-        return type_(value)
+        :param name: name of the bean
+        :type name: `str`
+        '''
+        name = object_name(name)
 
-    @logged
-    def getAttributes(self, names):
-        '''Get multiple attributes at once
+        self._lock.acquire()
+        try:
+            adapter = self._adapters[name]
+        finally:
+            self._lock.release()
 
-        :param names: attributes to retrieve
-        :type names: ``iterable<Attribute>``
+        # Keep track of the bean if unregistering it fails
+        adapter.unregister()
 
-        :return: requested attribute values, if available
-        :rtype: ``AttributeList``
+        self._lock.acquire()
+        try:
+            if self._adapters.get(name) is adapter:
+                del self._adapters[name]
+        finally:
+            self._lock.release()
+
+    def registerAll(self, beans, background=False, progress=None):
+        '''Register a number of beans
+
+        :param beans: ``(name, bean)`` pairs to register
+        :type beans: ``iterable<tuple<str, object>>``
+        :param background: run the job on a background thread
+        :type background: `bool`
+        :param progress: callable, called with the job after every batch
+        :type progress: `callable`
+
+        :return: the registration job
+        :rtype: `RegistrationJob`
         '''
-        self._logger.debug('Attributes requested: %s', names)
+        return self._run(beans, lambda (name, bean): self.register(name, bean),
+                         background, progress)
+
+    def unregisterAll(self, names=None, background=False, progress=None):
+        '''Unregister a number of beans, or all beans owned by the registry
+
+        :param names: names of the beans to unregister, or `None` to unregister
+                      all beans registered through this registry
+        :type names: ``iterable<str>``
+        :param background: run the job on a background thread
+        :type background: `bool`
+        :param progress: callable, called with the job after every batch
+        :type progress: `callable`
+
+        :return: the unregistration job
+        :rtype: `RegistrationJob`
+        '''
+        if names is None:
+            self._lock.acquire()
+            try:
+                names = self._adapters.keys()
+            finally:
+                self._lock.release()
 
-        attributes = AttributeList()
+        return self._run(names, self.unregister, background, progress)
 
-        for name in names:
+    def _run(self, items, action, background, progress):
+        '''Run `action` on all items, batch by batch'''
+        job = RegistrationJob()
+
+        def run():
+            '''Process all batches'''
+            #pylint: disable-msg=W0212
             try:
-                value = self.getAttribute(name)
-            except AttributeNotFoundException:
-                # We can discard unknown attributes
-                pass
-            else:
-                attributes.add(Attribute(name, value))
+                for batch in batched(items, self._batchSize):
+                    for item in batch:
+                        try:
+                            action(item)
+                        except (Exception, java.lang.Exception), exc:
+                            name = item[0] if isinstance(item, tuple) else item
+                            self._logger.warning('Failed to process %s: %s',
+                                                 name, exc)
+                            job._failures.append((name, exc))
+
+                    job._processed += len(batch)
+                    if progress:
+                        progress(job)
+            finally:
+                job._done.set()
+
+        if background:
+            thread = threading.Thread(target=run, name='jythonmx-registry')
+            thread.setDaemon(True)
+            thread.start()
+        else:
+            run()
 
-        return attributes
+        return job
 
-    @logged
-    def setAttribute(self, attribute):
-        '''Set the value of an attribute
+    def __len__(self):
+        return len(self._adapters)
 
-        :param attribute: attribute to set
-        :type attribute: ``Attribute``
-        '''
-        self._logger.debug('Attribute set: %s = %s', attribute.name,
-                           attribute.value)
-        setattr(self._bean, attribute.name, attribute.value)
+    def __contains__(self, name):
+        return object_name(name) in self._adapters
 
-    @logged
-    def setAttributes(self, attributes):
-        '''Set multiple attributes at once
+    adapters = property(lambda s: dict(s._adapters),
+                        doc='Mapping of names to all adapters owned by the ' \
+                            'registry')
 
-        :param attributes: attributes to set
-        :type attributes: ``iterable<Attribute>``
-        '''
-        map(self.setAttribute, attributes)
+def test_mbean_registry():
+    '''Test bulk registration and unregistration using `MBeanRegistry`'''
+    class C(object): #pylint: disable-msg=C0111
+        i = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+
+    names = ['JythonMXTest:type=C,name=%d' % i for i in xrange(5)]
+    names.append('Invalid name')
+
+    progress = []
+    registry = MBeanRegistry(batch_size=2)
+    job = registry.registerAll(((name, C()) for name in names),
+                               progress=lambda j: progress.append(j.processed))
+
+    assert job.done
+    assert progress == [2, 4, 6]
+    assert [name for name, _ in job.failures] == ['Invalid name']
+    assert len(registry) == 5
+    assert names[0] in registry
+    assert mbean_server().isRegistered(ObjectName(names[0]))
+
+    job = registry.unregisterAll(background=True)
+    assert job.wait(10)
+    assert not job.failures
+    assert len(registry) == 0
+    assert not mbean_server().isRegistered(ObjectName(names[0]))
+
+    adapter = registry.register(names[0], C())
+    mbean_server().unregisterMBean(adapter.name)
+    try:
+        registry.unregister(names[0])
+    except (Exception, java.lang.Exception):
+        pass
+    else:
+        assert False, 'Unregistration didn\'t fail'
+    assert names[0] in registry
+    assert adapter.registered
+    assert adapter_index.query(adapter.name) == [adapter]
+
+    mbean_server().registerMBean(adapter, adapter.name)
+    registry.unregister(names[0])
+    assert not adapter_index.query(adapter.name)
+
+
+# Characters to escape in JSON strings
+_JSON_UNSAFE = re.compile(r'[\x00-\x1f"\\]')
+_JSON_ESCAPES = {
+    '"': '\\"',
+    '\\': '\\\\',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+}
+
+def json_string(value):
+    '''Encode a string as a JSON string literal
+
+    :param value: string to encode
+    :type value: `unicode`
+
+    :return: JSON string literal
+    :rtype: `unicode`
+    '''
+    if _JSON_UNSAFE.search(value) is None:
+        return '"%s"' % value
+
+    return '"%s"' % _JSON_UNSAFE.sub(
+                        lambda m: _JSON_ESCAPES.get(m.group()) or \
+                                  '\\u%04x' % ord(m.group()),
+                        value)
+
+def write_json(value, write):
+    '''Encode a value as JSON, passing the encoded text to `write` in chunks
+
+    Python values and the Java types returned by `MBeanAdapter` are
+    supported: ``CompositeData`` is encoded as an object, ``TabularData`` as
+    a list of row objects, dates as milliseconds since the epoch, and
+    anything else unknown as its string representation.
+
+    :param value: value to encode
+    :type value: `object`
+    :param write: function called with every chunk of encoded text
+    :type write: `callable`
+    '''
+    if value is None:
+        write('null')
+    elif isinstance(value, bool):
+        write(value and 'true' or 'false')
+    elif isinstance(value, (int, long)):
+        write(str(value))
+    elif isinstance(value, float):
+        # NaN and infinities have no JSON representation
+        if value != value or value - value != 0:
+            write('null')
+        else:
+            write(repr(value))
+    elif isinstance(value, basestring):
+        write(json_string(value))
+    elif isinstance(value, CompositeData):
+        write_json_object(((key, value.get(key))
+                           for key in value.getCompositeType().keySet()),
+                          write)
+    elif isinstance(value, TabularData):
+        write_json_array(value.values(), write)
+    elif isinstance(value, dict):
+        write_json_object(value.iteritems(), write)
+    elif isinstance(value, java.util.Map):
+        write_json_object(((entry.getKey(), entry.getValue())
+                           for entry in value.entrySet()), write)
+    elif isinstance(value, java.util.Date):
+        write(str(value.getTime()))
+    elif isinstance(value, java.lang.Number):
+        write(str(value.toString()))
+    elif isinstance(value, (list, tuple, array.array, java.util.Collection)):
+        write_json_array(value, write)
+    else:
+        write(json_string(unicode(value)))
+
+def write_json_object(items, write):
+    '''Encode ``(key, value)`` pairs as a JSON object, see `write_json`'''
+    write('{')
+    first = True
+    for key, value in items:
+        if not first:
+            write(', ')
+        first = False
+
+        write(json_string(unicode(key)))
+        write(': ')
+        write_json(value, write)
+    write('}')
+
+def write_json_array(values, write):
+    '''Encode values as a JSON array, see `write_json`'''
+    write('[')
+    first = True
+    for value in values:
+        if not first:
+            write(', ')
+        first = False
+
+        write_json(value, write)
+    write(']')
+
+def test_write_json():
+    '''Test JSON encoding'''
+    def encode(value): #pylint: disable-msg=C0111
+        chunks = []
+        write_json(value, chunks.append)
+        return ''.join(chunks)
+
+    assert encode(None) == 'null'
+    assert encode(True) == 'true'
+    assert encode(12L) == '12'
+    assert encode(0.5) == '0.5'
+    assert encode(float('nan')) == 'null'
+    assert encode(u'a"b\\c\n\x01') == '"a\\"b\\\\c\\n\\u0001"'
+    assert encode([1, (2, 'x')]) == '[1, [2, "x"]]'
+    assert encode({'a': [1]}) == '{"a": [1]}'
+    assert encode(jarray.array([1.5], 'd')) == '[1.5]'
+
+    values = Composite('Test', (('a', java.lang.Integer),
+                                ('b', java.lang.String)))
+    assert encode(values((1, 'x'))) == '{"a": 1, "b": "x"}'
+
+
+class JSONHandler(HttpHandler or object):
+    '''``HttpHandler`` serving the attribute values of registered adapters
+    as JSON, see `HTTPExporter`'''
+    def __init__(self, exporter):
+        self._exporter = exporter
+
+    def handle(self, exchange):
+        '''Handle a request'''
+        try:
+            try:
+                query = cgi.parse_qs(exchange.getRequestURI().getRawQuery()
+                                     or '')
+                patterns = [object_name(pattern) for pattern
+                            in query.get('pattern') or ('*:*', )]
+            except (Exception, java.lang.Exception), exc:
+                self._error(exchange, 400, str(exc))
+                return
 
-    @logged
-    def invoke(self, name, args_, sig):
-        '''Invoke a method on the bean
+            if exchange.getRequestMethod() != 'GET':
+                self._error(exchange, 405, 'Only GET is supported')
+                return
 
-        :param name: method to invoke
-        :type name: `str`
-        :param args\_: arguments to pass to the method
-        :type args\_: ``iterable<object>``
-        :param sig: method signature
-        :type sig: ``iterable<java.lang.String>``
+            exchange.getResponseHeaders().set(
+                'Content-Type', 'application/json; charset=utf-8')
+            # Length 0: use chunked encoding, the response is streamed
+            exchange.sendResponseHeaders(200, 0)
 
-        :return: method call result
-        :rtype: `object`
-        '''
-        self._logger.debug('Invoke: %s(%s), sig=%s', name, args_, sig)
+            writer = BufferedWriter(OutputStreamWriter(
+                                        exchange.getResponseBody(), 'UTF-8'))
+            try:
+                self._exporter.write(patterns, query.get('attribute'),
+                                     writer.write)
+            finally:
+                writer.close()
+        except: #pylint: disable-msg=W0702
+            logging.getLogger('mbeanadapter.exporter').exception(
+                'Error handling request')
+        finally:
+            exchange.close()
+
+    def _error(self, exchange, code, message):
+        '''Send an error response'''
+        body = java.lang.String(message).getBytes('UTF-8')
+        exchange.getResponseHeaders().set('Content-Type',
+                                          'text/plain; charset=utf-8')
+        exchange.sendResponseHeaders(code, len(body))
+        exchange.getResponseBody().write(body)
+
+
+# Java types exported as Prometheus samples
+NUMERIC_TYPES = (
+    java.lang.Byte, java.lang.Short, java.lang.Integer, java.lang.Long,
+    java.lang.Float, java.lang.Double, java.math.BigDecimal,
+    java.math.BigInteger,
+)
+
+_PROMETHEUS_UNSAFE = re.compile(r'[^a-zA-Z0-9_:]')
+
+def prometheus_name(name):
+    '''Turn a name into a valid Prometheus metric or label name
+
+    :param name: name to convert
+    :type name: `str`
+
+    :return: valid name
+    :rtype: `str`
+    '''
+    name = _PROMETHEUS_UNSAFE.sub('_', name)
+    return '_' + name if name[:1].isdigit() else name
+
+def prometheus_value(value):
+    '''Format a sample value in Prometheus text format
+
+    :param value: value to format
+    :type value: `int`, `long`, `float` or ``java.lang.Number``
 
-        if not hasattr(self._bean, name):
-            raise ReflectionException(java.lang.NoSuchMethodException(name))
+    :return: formatted value
+    :rtype: `str`
+    '''
+    if isinstance(value, (int, long, java.math.BigInteger)):
+        return str(value)
+    if isinstance(value, java.lang.Number):
+        value = value.doubleValue()
+
+    value = float(value)
+    if value != value:
+        return 'NaN'
+    if value - value != 0:
+        return value > 0 and '+Inf' or '-Inf'
+    return repr(value)
+
+def test_prometheus_format():
+    '''Test Prometheus name and value formatting'''
+    assert prometheus_name('App.cache-hits') == 'App_cache_hits'
+    assert prometheus_name('1x') == '_1x'
+    assert prometheus_value(3L) == '3'
+    assert prometheus_value(0.25) == '0.25'
+    assert prometheus_value(float('nan')) == 'NaN'
+    assert prometheus_value(float('-inf')) == '-Inf'
+
+
+class PrometheusRenderer(object):
+    '''Renders the numeric attributes of all registered adapters in Prometheus
+    text format
+
+    Every numeric attribute ``attr`` of a bean named ``domain:key=value,...``
+    is a sample of the ``domain_attr`` gauge, labeled with the key properties
+    of the name. Samples of the same gauge are grouped, whatever the bean
+    class.
+
+    Rendering is incremental: the numeric attributes, gauge names and
+    ``HELP`` lines are calculated once per bean class, the labels once per
+    bean, and the line of every sample is only formatted again when its value
+    changed since the previous scrape.
+    '''
+    def __init__(self, index=None):
+        '''Initialize a new `PrometheusRenderer`
 
-        fun = None
+        :param index: index of the adapters to render, `adapter_index` by
+                      default
+        :type index: `AdapterIndex`
+        '''
+        self._index = index or adapter_index
+        self._lock = threading.Lock()
+
+        # ClassMetadata to ((attribute, suffix, help), ...) mapping
+        self._classes = {}
+        # Canonical bean name to (labels, {attribute: (value, line)}) mapping
+        self._beans = {}
+
+    def _classFragments(self, metadata):
+        '''Calculate the numeric attributes of a class'''
+        fragments = self._classes.get(metadata)
+        if fragments is None:
+            # Lazy adapters might not have calculated their MBeanInfo yet
+            docs = metadata.descriptions()
+            fragments = tuple(
+                (name, prometheus_name(name),
+                 (docs.get(name) or name).replace('\\', '\\\\') \
+                                         .replace('\n', '\\n'))
+                for name, type_ in sorted(metadata.types.iteritems())
+                if type_ in NUMERIC_TYPES)
+
+        return fragments
+
+    def _beanFragments(self, adapter, name):
+        '''Retrieve the labels and sample lines of a bean'''
+        fragments = self._beans.get(name)
+        if fragments is None:
+            properties = adapter.name.getKeyPropertyList()
+            labels = ','.join('%s="%s"' % (
+                                  prometheus_name(key),
+                                  properties.get(key).replace('\\', '\\\\')
+                                                     .replace('"', '\\"')
+                                                     .replace('\n', '\\n'))
+                              for key in sorted(properties.keySet()))
+            fragments = '{%s}' % labels, {}
+
+        return fragments
+
+    def render(self, write):
+        '''Render all samples
+
+        :param write: function called with every chunk of rendered text
+        :type write: `callable`
+        '''
+        self._lock.acquire()
         try:
-            fun = getattr(self._bean, name, None)
-        except Exception, exc:
-            self._logger.exception('Error retrieving method on bean')
-            raise MBeanException(exc)
+            # Gauge name to (help, [sample line, ...]) mapping
+            families = {}
+
+            # Only keep the fragments of classes and beans still registered
+            classes, beans = {}, {}
+
+            for adapter in self._index.query('*:*'):
+                name = adapter.name.getCanonicalName()
+                metadata = adapter.metadata
+
+                class_ = classes[metadata] = self._classFragments(metadata)
+                if not class_:
+                    continue
+
+                labels, lines = beans[name] = \
+                    self._beanFragments(adapter, name)
+                prefix = prometheus_name(adapter.name.getDomain())
+
+                try:
+                    values = dict((attribute.name, attribute.value)
+                                  for attribute in adapter.getAttributes(
+                                      [attr for attr, _, _ in class_]))
+                except (Exception, java.lang.Exception):
+                    logging.getLogger('mbeanadapter.exporter').exception(
+                        'Error reading %s', name)
+                    continue
+
+                for attr, suffix, help_ in class_:
+                    value = values.get(attr)
+                    if value is None:
+                        continue
+
+                    family = '%s_%s' % (prefix, suffix)
+
+                    cached = lines.get(attr)
+                    if cached is not None and cached[0] == value:
+                        line = cached[1]
+                    else:
+                        line = '%s%s %s\n' % (family, labels,
+                                              prometheus_value(value))
+                        lines[attr] = value, line
+
+                    families.setdefault(family, (help_, []))[1].append(line)
 
-        if not callable(fun):
-            raise ReflectionException(java.lang.NoSuchMethodException(name))
+            self._classes, self._beans = classes, beans
+        finally:
+            self._lock.release()
+
+        for family in sorted(families):
+            help_, lines = families[family]
+            write('# HELP %s %s\n# TYPE %s gauge\n' % (family, help_, family))
+            for line in lines:
+                write(line)
 
-        return_type = getattr(fun, '__returns__',
-                              self.DEFAULT_FUNCTION_RETURN_TYPE)
+def test_prometheus_renderer():
+    '''Test `PrometheusRenderer` output and caching'''
+    class C(object): #pylint: disable-msg=C0111
+        def __init__(self):
+            self.value = 1
+
+        i = TypedProperty(java.lang.Integer, fget=lambda s: s.value,
+                          doc='A value')
+        s = property(fget=lambda _: 'x')
+
+    beans = [C(), C()]
+    index = AdapterIndex()
+    for i, bean in enumerate(beans):
+        adapter = MBeanAdapter(bean)
+        adapter._name = object_name( #pylint: disable-msg=W0212
+                            'JythonMXTest:type=Rendered,name=%d' % i)
+        index.add(adapter)
+
+    renderer = PrometheusRenderer(index)
+    chunks = []
+    renderer.render(chunks.append)
+    output = ''.join(chunks)
+    assert output.count('# TYPE JythonMXTest_i gauge\n') == 1
+    assert '# HELP JythonMXTest_i A value\n' in output
+    assert 'JythonMXTest_i{name="0",type="Rendered"} 1\n' in output
+    assert 'JythonMXTest_s' not in output
+    # Rendering doesn't calculate the MBeanInfo
+    assert not adapter.metadata.introspected
+
+    beans[1].value = 2
+    chunks = []
+    renderer.render(chunks.append)
+    assert 'JythonMXTest_i{name="0",type="Rendered"} 1\n' in chunks
+    assert 'JythonMXTest_i{name="1",type="Rendered"} 2\n' in chunks
+
+
+class PrometheusHandler(JSONHandler):
+    '''``HttpHandler`` serving the numeric attribute values of registered
+    adapters in Prometheus text format, see `HTTPExporter`'''
+    def handle(self, exchange):
+        '''Handle a request'''
         try:
-            value = fun(*args_)
-            # Coerce before returning
-            if return_type is java.lang.Void:
+            if exchange.getRequestMethod() != 'GET':
+                self._error(exchange, 405, 'Only GET is supported')
                 return
-            else:
-                return return_type(value)
-        except Exception, exc:
-            self._logger.exception('Error executing or coercing return value')
-            raise MBeanException(exc)
 
-    # NotificationBroadcasterSupport
-    @logged
-    def getNotificationInfo(self):
-        '''Retrieve info of all notifications emitted by the MBean
+            exchange.getResponseHeaders().set(
+                'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            exchange.sendResponseHeaders(200, 0)
 
-        :return: MBean notification info
-        :rtype: ``tuple<MBeanNotificationInfo>``
-        '''
-        self._logger.debug('Notification info requested')
+            writer = BufferedWriter(OutputStreamWriter(
+                                        exchange.getResponseBody(), 'UTF-8'))
+            try:
+                self._exporter.renderer.render(writer.write)
+            finally:
+                writer.close()
+        except: #pylint: disable-msg=W0702
+            logging.getLogger('mbeanadapter.exporter').exception(
+                'Error handling request')
+        finally:
+            exchange.close()
 
-        return self.notificationinfo
 
-    @logged
-    def sendNotification(self, notification):
-        '''Emit a notification to all listeners
+class HTTPExporter(object):
+    '''An embedded HTTP server exporting the attributes of all registered
+    adapters as JSON, and their numeric attributes in Prometheus text format
 
-        :param notification: Notification to emit
-        :type notification: ``Notification``
+    A single ``GET /json`` request reads the attributes of all beans matching
+    any number of ``pattern`` query parameters (``*:*`` by default). Only the
+    attributes given as ``attribute`` query parameters are read, or all
+    readable ones. Attributes of a bean are read through
+    `MBeanAdapter.getAttributes`, using the dispatch table of its class, and
+    the response is streamed bean by bean::
+
+        GET /json?pattern=App:type=Cache,*&attribute=hits&attribute=misses
+
+        {"beans": [{"name": "App:name=users,type=Cache",
+                    "attributes": {"hits": 10, "misses": 2}}, ...]}
+
+    Beans which fail to read have an ``error`` message instead of
+    ``attributes``.
+
+    ``GET /metrics`` renders all numeric attributes of all beans for
+    Prometheus to scrape, see `PrometheusRenderer`.
+
+    The server requires the ``com.sun.net.httpserver`` package of the JDK,
+    and only listens on the loopback interface by default.
+    '''
+    JSON_PATH = '/json'
+    METRICS_PATH = '/metrics'
+
+    def __init__(self, port=0, address='127.0.0.1', index=None, threads=2):
+        '''Initialize a new `HTTPExporter`
+
+        :param port: port to listen on, or 0 to pick a free one
+        :type port: `int`
+        :param address: address to listen on
+        :type address: `str`
+        :param index: index of the adapters to export, `adapter_index` by
+                      default
+        :type index: `AdapterIndex`
+        :param threads: number of threads handling requests
+        :type threads: `int`
         '''
-        self._logger.debug('Emit notification: %s', notification)
+        self._port = port
+        self._address = address
+        self._index = index or adapter_index
+        self._threads = threads
+        self._renderer = PrometheusRenderer(self._index)
+        self._server = None
+
+    def start(self):
+        '''Start serving requests'''
+        if HttpServer is None:
+            raise RuntimeError('com.sun.net.httpserver is not available')
+        if self._server is not None:
+            raise RuntimeError('Exporter already started')
+
+        server = HttpServer.create(InetSocketAddress(self._address,
+                                                     self._port), 0)
+        server.createContext(self.JSON_PATH, JSONHandler(self))
+        server.createContext(self.METRICS_PATH, PrometheusHandler(self))
+        server.setExecutor(Executors.newFixedThreadPool(
+                               self._threads,
+                               DaemonThreadFactory('jythonmx-http')))
+        server.start()
+
+        self._server = server
+
+    def stop(self, delay=0):
+        '''Stop serving requests
+
+        :param delay: number of seconds to wait for running requests
+        :type delay: `int`
+        '''
+        if self._server is None:
+            raise RuntimeError('Exporter not started')
+
+        self._server.stop(delay)
+        self._server.getExecutor().shutdown()
+        self._server = None
+
+    def write(self, patterns, attributes, write):
+        '''Encode the attributes of all adapters matching any of `patterns`
+        as JSON
+
+        :param patterns: names or patterns of the beans to export
+        :type patterns: ``iterable<ObjectName>``
+        :param attributes: attributes to export, or `None` for all readable
+                           ones
+        :type attributes: ``iterable<str>``
+        :param write: function called with every chunk of encoded text
+        :type write: `callable`
+        '''
+        write('{"beans": [')
+
+        # Patterns might overlap, export every bean once
+        seen = set()
+        for pattern in patterns:
+            for adapter in self._index.query(pattern):
+                name = adapter.name.getCanonicalName()
+                if name in seen:
+                    continue
+
+                if seen:
+                    write(', ')
+                seen.add(name)
 
-        return NotificationBroadcasterSupport.sendNotification(self,
-                                                               notification)
+                write('{"name": %s, ' % json_string(name))
+                try:
+                    values = adapter.getAttributes(
+                                 attributes or adapter.metadata.getters.keys())
+                except (Exception, java.lang.Exception), exc:
+                    write('"error": %s}' % json_string(unicode(exc)))
+                    continue
+
+                write('"attributes": ')
+                write_json_object(((attribute.name, attribute.value)
+                                   for attribute in values), write)
+                write('}')
+
+        write(']}')
+
+    port = property(lambda s: s._server.getAddress().getPort() \
+                              if s._server is not None else s._port,
+                    doc='Port the server listens on')
+    url = property(lambda s: 'http://%s:%d' % (s._address, s.port),
+                   doc='Base URL of the server')
+    renderer = property(operator.attrgetter('_renderer'),
+                        doc='`PrometheusRenderer` of the ``/metrics`` export')
+
+def test_http_exporter():
+    '''Test `HTTPExporter` using a local HTTP client'''
+    import urllib2
+
+    class C(object): #pylint: disable-msg=C0111
+        i = TypedProperty(java.lang.Integer, fget=lambda _: 1)
+        s = property(fget=lambda _: 'x')
+
+    adapters = [MBeanAdapter(C()) for _ in xrange(2)]
+    for i, adapter in enumerate(adapters):
+        adapter.register('JythonMXTest:type=Exported,name=%d' % i)
+
+    exporter = HTTPExporter()
+    exporter.start()
+    try:
+        body = urllib2.urlopen(exporter.url + exporter.JSON_PATH + \
+                               '?pattern=JythonMXTest:type=Exported,*' \
+                               '&pattern=JythonMXTest:name=0,type=Exported' \
+                               '&attribute=i').read()
+        assert body.startswith('{"beans": [{"name": "JythonMXTest:')
+        assert body.count('"attributes": {"i": 1}') == 2
+
+        try:
+            urllib2.urlopen(exporter.url + exporter.JSON_PATH +
+                            '?pattern=invalid')
+        except urllib2.HTTPError, exc:
+            assert exc.code == 400
+        else:
+            assert False, 'HTTPError not raised'
+
+        response = urllib2.urlopen(exporter.url + exporter.METRICS_PATH)
+        assert response.info().getheader('Content-Type').startswith(
+                   'text/plain; version=0.0.4')
+        body = response.read()
+        assert body.count('# TYPE JythonMXTest_i gauge\n') == 1
+        assert 'JythonMXTest_i{name="1",type="Exported"} 1\n' in body
+    finally:
+        exporter.stop()
+        for adapter in adapters:
+            adapter.unregister()
 
 
 class DemoMBean(object):
@@ -880,13 +6701,16 @@ class DemoMBean(object):
                         fset=attrsetter('_strValue'), doc='A string value')
     # TypedProperties allow one to define the Java type of an attribute, given
     # as the first argument to the constructor
+    # Sampled properties are recorded by the Sampler of the adapter, if any
     intValue = TypedProperty(java.lang.Integer,
                              fget=operator.attrgetter('_intValue'),
-                             doc='A read-only integer value')
+                             doc='A read-only integer value', sample=True)
     boolValue = TypedProperty(java.lang.Boolean,
                               fget=operator.attrgetter('_boolValue'),
                               fset=attrsetter('_boolValue'))
 
+    # Results of operations called through JMX can be cached
+    @cached(ttl=60)
     @returns(java.lang.String)
     @args((java.lang.String, 'User name'))
     def hello(self, name):
@@ -894,11 +6718,21 @@ class DemoMBean(object):
         return 'Hello, %s' % name
 
     # By default, methods are considered to return nothing, and take no
-    # arguments
+    # arguments. Bulkheads limit the number of concurrent calls through JMX.
+    @bulkhead(1, timeout=10)
     def demo(self):
         '''A demo function which only prints to console'''
         print 'Demo called'
 
+    # Long-running operations can run on a thread pool, they return a job ID
+    # and emit a notification once they're done
+    @async_operation
+    @returns(java.lang.String)
+    def slowDemo(self):
+        '''A demo function taking a couple of seconds'''
+        time.sleep(5)
+        return 'Slow demo done'
+
     @returns(java.lang.Boolean)
     @args(
         (java.lang.Integer, 'Dividend'),
@@ -911,13 +6745,26 @@ class DemoMBean(object):
 
         return (a % b == 0)
 
+    # Composite types expose related values as a single attribute
+    values = TypedProperty(Composite('DemoValues', (
+                               ('strValue', java.lang.String, 'A string value'),
+                               ('intValue', java.lang.Integer),
+                               ('boolValue', java.lang.Boolean),
+                           )),
+                           fget=lambda s: (s._strValue, s._intValue,
+                                           s._boolValue),
+                           doc='All values at once')
+
+    # TypedProperties can cache the values read through JMX
     modules = TypedProperty(Array(java.lang.String),
                             fget=lambda _: sorted(sys.modules.iterkeys()),
-                            doc='List of all loaded modules')
+                            doc='List of all loaded modules', ttl=10)
 
     # Notifications
     test = signal('test')
     test2 = signal('test2')
+    # Thresholds emit a notification when an attribute crosses them
+    intAlarm = Threshold('intValue', high=1000, hysteresis=100)
 
     def notifyTest(self):
         '''A function which emits both test notifications'''
@@ -928,13 +6775,18 @@ class DemoMBean(object):
 
 def main():
     '''Expose the demo MBean and wait for termination'''
+    sampler = Sampler()
+    sampler_adapter = MBeanAdapter(sampler)
+    sampler_adapter.register('JythonMX:type=Sampler')
     bean = DemoMBean(u'demo', 123, True)
-    adapter = MBeanAdapter(bean)
+    # Trace all JMX calls, since DEBUG logging is enabled
+    adapter = TracingMBeanAdapter(bean, sampler=sampler)
     adapter.register('JythonMX:name=demo')
     print
     raw_input('Press return to quit\n')
     print
     adapter.unregister()
+    sampler_adapter.unregister()
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)